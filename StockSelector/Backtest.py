@@ -0,0 +1,153 @@
+import asyncio, time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from StockSelector.Replay import ReplayFeed, readFrames, tapeFiles
+from StockSelector.SymbolEngine import IND_INTERVAL, IND_PERIODS
+
+class Crossover():
+    # buy when the fast line crosses above the slow one, sell when it crosses back under
+    def __init__(self, fast, slow):
+        self.fast = fast
+        self.slow = slow
+        self.above = None
+
+    def signal(self, indicators):
+        fast, slow = indicators.get(self.fast), indicators.get(self.slow)
+        if fast is None or slow is None:
+            return "hold"
+        above, previous = fast > slow, self.above
+        self.above = above
+        if previous is None or above == previous:
+            return "hold"
+        return "buy" if above else "sell"
+
+class RsiThreshold():
+    # oversold buys, overbought sells
+    def __init__(self, low=30, high=70, field=f"rsi{IND_PERIODS['rsi']}"):
+        self.low = low
+        self.high = high
+        self.field = field
+
+    def signal(self, indicators):
+        rsi = indicators.get(self.field)
+        if rsi is None:
+            return "hold"
+        if rsi < self.low:
+            return "buy"
+        if rsi > self.high:
+            return "sell"
+        return "hold"
+
+STRATEGIES = {
+    "ema_sma": lambda: Crossover(f"ema{IND_PERIODS['ema']}", f"sma{IND_PERIODS['sma']}"),
+    "macd": lambda: Crossover("macd", "macdSignal"),
+    "price_sma": lambda: Crossover("close", f"sma{IND_PERIODS['sma']}"),
+    "rsi": lambda: RsiThreshold()
+}
+
+class Position():
+    # long-only, all in on buy and all out on sell, returns compounded per closed trade
+    def __init__(self):
+        self.entry = None
+        self.equity = 1.0
+        self.peak = 1.0
+        self.drawdown = 0.0
+        self.trades = 0
+        self.wins = 0
+        self.first = None
+        self.last = None
+
+    def mark(self, price):
+        if self.first is None:
+            self.first = price
+        self.last = price
+
+    def apply(self, signal, price):
+        if signal == "buy" and self.entry is None:
+            self.entry = price
+        elif signal == "sell" and self.entry is not None:
+            self._close(price)
+
+    def _close(self, price):
+        ret = price / self.entry - 1
+        self.entry = None
+        self.trades += 1
+        self.wins += ret > 0
+        self.equity *= 1 + ret
+        self.peak = max(self.peak, self.equity)
+        self.drawdown = max(self.drawdown, 1 - self.equity / self.peak)
+
+    def result(self):
+        if self.entry is not None and self.last is not None:
+            self._close(self.last)
+        return {
+            "return": self.equity - 1,
+            "buyHold": self.last / self.first - 1 if self.first else 0.0,
+            "trades": self.trades,
+            "wins": self.wins,
+            "maxDrawdown": self.drawdown
+        }
+
+class Backtest():
+    # one strategy instance and position per (strategy, symbol), fed from the replayed bar closes
+    def __init__(self, strategies):
+        self.strategies = strategies
+        self.books = {}
+
+    def onBars(self, event):
+        indicators = event.get("indicators")
+        if not indicators:
+            return
+        close = next((bar["close"] for label, bar in event["bars"] if label == IND_INTERVAL), None)
+        if close is None:
+            return
+        values = {**indicators, "close": close}
+        for name in self.strategies:
+            key = (name, event["symbol"])
+            book = self.books.get(key)
+            if book is None:
+                book = self.books[key] = (STRATEGIES[name](), Position())
+            strategy, position = book
+            position.mark(close)
+            position.apply(strategy.signal(values), close)
+
+    def results(self):
+        return {f"{name}|{symbol}": position.result() for (name, symbol), (_, position) in self.books.items()}
+
+async def _runWorker(paths, index, workers, speed, strategies, symbols, redis):
+    backtest = Backtest(strategies)
+    if redis == "fake":
+        from StockSelector.FakeRedis import FakeRedis
+        redis = FakeRedis()
+    else:
+        redis = None
+    feed = ReplayFeed(backtest.onBars, redis=redis, symbols=symbols, index=index, workers=workers)
+    stats = await feed.replay(readFrames(paths), speed)
+    return {"worker": index, **stats, "results": backtest.results()}
+
+def runWorker(paths, index, workers, speed=0, strategies=(), symbols=None, redis=None):
+    return asyncio.run(_runWorker(paths, index, workers, speed, strategies, symbols, redis))
+
+def runBacktest(paths, workers=1, speed=0, strategies=(), symbols=None, redis=None):
+    # every worker reads the whole tape and keeps the symbols that hash to it
+    paths = tapeFiles(paths)
+    start = time.perf_counter()
+    if workers <= 1:
+        reports = [runWorker(paths, 0, 1, speed, strategies, symbols, redis)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            futures = [pool.submit(runWorker, paths, index, workers, speed, strategies, symbols, redis) for index in range(workers)]
+            reports = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    ticks = sum(report["ticks"] for report in reports)
+    results = {}
+    for report in reports:
+        results.update(report.pop("results"))
+    return {
+        "workers": reports,
+        "ticks": ticks,
+        "symbols": sum(report["symbols"] for report in reports),
+        "seconds": elapsed,
+        "ticksPerSec": ticks / elapsed if elapsed else 0.0,
+        "results": results
+    }
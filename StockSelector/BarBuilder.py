@@ -0,0 +1,81 @@
+INTERVALS = {
+    "1s": 1,
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600
+}
+
+class BarBuilder():
+    def __init__(self, intervals=("1m", "5m"), closeDelay=1):
+        self.intervals = sorted(intervals, key=lambda label: INTERVALS[label])
+        self.seconds = {label: INTERVALS[label] for label in self.intervals}
+        self.closeDelay = closeDelay
+        self.buckets = {label: None for label in self.intervals}
+        self.lastClosed = {label: None for label in self.intervals}
+        # every interval is rolled up from the largest smaller interval that divides it,
+        # only the ones without such a source see raw trades
+        self.sources = {}
+        for idx, label in enumerate(self.intervals):
+            secs = self.seconds[label]
+            parents = [p for p in self.intervals[:idx] if secs % self.seconds[p] == 0]
+            self.sources[label] = parents[-1] if parents else None
+        self.children = {label: [c for c in self.intervals if self.sources[c] == label] for label in self.intervals}
+        self.rawIntervals = [label for label in self.intervals if self.sources[label] is None]
+
+    @staticmethod
+    def _startBucket(time, intervals):
+        s = time // 1000
+        return s // intervals * intervals
+
+    def addTrade(self, price, time, vol=0):
+        closed = []
+        for label in self.rawIntervals:
+            start = self._startBucket(time, self.seconds[label])
+            self._fold(label, start, price, price, price, price, vol, closed)
+        return closed
+
+    def closeDue(self, now):
+        closed = []
+        for label in self.intervals:
+            bucket = self.buckets[label]
+            if bucket is not None and bucket['ts'] + self.seconds[label] + self.closeDelay <= now:
+                self._close(label, closed)
+        return closed
+
+    def _fold(self, label, start, o, h, l, c, vol, closed):
+        secs = self.seconds[label]
+        last = self.lastClosed[label]
+        if last is not None and start <= last:
+            # late data for an already published bar goes into the next one
+            start = last + secs
+        bucket = self.buckets[label]
+        if bucket is not None and start > bucket['ts']:
+            self._close(label, closed)
+            bucket = None
+        if bucket is None:
+            self.buckets[label] = {
+                'ts': start,
+                'open': o,
+                'high': h,
+                'low': l,
+                'close': c,
+                'volume': vol
+            }
+            return
+        if h > bucket['high']:
+            bucket['high'] = h
+        if l < bucket['low']:
+            bucket['low'] = l
+        if start == bucket['ts']:
+            bucket['close'] = c
+        bucket['volume'] += vol
+
+    def _close(self, label, closed):
+        bar = self.buckets[label]
+        self.buckets[label] = None
+        self.lastClosed[label] = bar['ts']
+        closed.append((label, bar))
+        for child in self.children[label]:
+            start = bar['ts'] // self.seconds[child] * self.seconds[child]
+            self._fold(child, start, bar['open'], bar['high'], bar['low'], bar['close'], bar['volume'], closed)
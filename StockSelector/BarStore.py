@@ -0,0 +1,171 @@
+import contextlib, fcntl, os
+from urllib.parse import quote
+import numpy as np
+from django.conf import settings
+
+BAR_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8')
+])
+BAR_FIELDS = BAR_DTYPE.names
+# end-of-period series kept on disk next to the live intervals
+STORE_INTERVALS = ("1d", "1w", "1mo")
+
+def symbolDir(symbol):
+    # any provider symbol (BINANCE:BTCUSDT, OANDA:EUR_USD) as one directory name: percent-encoded,
+    # so separators can't split it, and a leading "." escaped, so it is never . or ..
+    if not isinstance(symbol, str) or not symbol:
+        raise ValueError(f"Invalid symbol {symbol!r}")
+    name = quote(symbol, safe="")
+    if name.startswith("."):
+        name = "%2E" + name[1:]
+    if len(name) > 200:
+        raise ValueError(f"Invalid symbol {symbol[:20]!r}...")
+    return name
+
+def toBarArray(bars):
+    if isinstance(bars, np.ndarray) and bars.dtype == BAR_DTYPE:
+        return bars
+    bars = list(bars)
+    out = np.empty(len(bars), dtype=BAR_DTYPE)
+    for field in BAR_FIELDS:
+        out[field] = [bar[field] for bar in bars]
+    return out
+
+def frameToBars(frame):
+    # parsed Alpha Vantage frame (DatetimeIndex + open/high/low/close/volume columns) to records
+    out = np.empty(len(frame), dtype=BAR_DTYPE)
+    out['ts'] = frame.index.values.astype('datetime64[s]').astype(np.int64)
+    for field in BAR_FIELDS[1:]:
+        out[field] = frame[field].to_numpy(dtype=np.float64)
+    return out
+
+class BarStore():
+    _default = None
+
+    @classmethod
+    def default(cls):
+        if cls._default is None:
+            cls._default = cls(getattr(settings, "STOCK_BAR_STORE_DIR", os.path.join(settings.BASE_DIR, "barstore")))
+        return cls._default
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.lastTs = {}
+        self.maps = {}
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.root, symbolDir(symbol), f"{interval}.bars")
+
+    @contextlib.contextmanager
+    def _locked(self, path):
+        # every process running an engine for the symbol writes the same file, one at a time
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", 'ab') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _fileLast(path):
+        if not os.path.exists(path) or os.path.getsize(path) < BAR_DTYPE.itemsize:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(-BAR_DTYPE.itemsize, os.SEEK_END)
+            return int(np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)['ts'][0])
+
+    def _last(self, path):
+        if path not in self.lastTs:
+            self.lastTs[path] = self._fileLast(path)
+        return self.lastTs[path]
+
+    @staticmethod
+    def _ordered(records):
+        if not np.all(np.diff(records['ts']) > 0):
+            _, keep = np.unique(records['ts'], return_index=True)
+            records = records[keep]
+        return records
+
+    def append(self, symbol, interval, bars):
+        # append-only: anything at or before the newest stored bar is dropped
+        path = self._path(symbol, interval)
+        records = toBarArray(bars)
+        # the cached ts can only lag the file, so it is safe for skipping without the lock
+        last = self._last(path)
+        if last is not None:
+            records = records[records['ts'] > last]
+        if not len(records):
+            return 0
+        with self._locked(path):
+            return self._append(path, self._ordered(records))
+
+    def _append(self, path, records):
+        # another process may have appended since the cache was filled, the file decides
+        last = self._fileLast(path)
+        if last is not None:
+            records = records[records['ts'] > last]
+        if not len(records):
+            self.lastTs[path] = last
+            return 0
+        with open(path, 'ab') as f:
+            f.write(records.tobytes())
+        self.lastTs[path] = int(records['ts'][-1])
+        return len(records)
+
+    def merge(self, symbol, interval, bars):
+        # a refetch is authoritative from its first bar on: a partial week or month stored under
+        # a mid-period date is replaced by the completed bar instead of kept next to it
+        path = self._path(symbol, interval)
+        records = self._ordered(toBarArray(bars))
+        if not len(records):
+            return 0
+        with self._locked(path):
+            existing = np.array(self._map(path))
+            kept = existing[existing['ts'] < records['ts'][0]]
+            if len(kept) == len(existing):
+                return self._append(path, records)
+            combined = np.concatenate([kept, records])
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(combined.tobytes())
+            os.replace(tmp, path)
+            self.maps.pop(path, None)
+            self.lastTs[path] = int(combined['ts'][-1])
+            return len(combined) - len(existing)
+
+    def _map(self, path):
+        if not os.path.exists(path):
+            return np.empty(0, dtype=BAR_DTYPE)
+        size = os.path.getsize(path) // BAR_DTYPE.itemsize
+        cached = self.maps.get(path)
+        if cached is None or len(cached) != size:
+            cached = np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(size,)) if size else np.empty(0, dtype=BAR_DTYPE)
+            self.maps[path] = cached
+        return cached
+
+    def read(self, symbol, interval, start=None, end=None):
+        # a slice of the memory map, nothing is copied until the caller touches it
+        bars = self._map(self._path(symbol, interval))
+        lo = int(np.searchsorted(bars['ts'], start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(bars['ts'], end, side='right')) if end is not None else len(bars)
+        return bars[lo:hi]
+
+    def closes(self, symbol, interval, start=None, end=None):
+        return self.read(symbol, interval, start, end)['close']
+
+    def missing(self, symbol, interval, start, end, step):
+        bars = self._map(self._path(symbol, interval))
+        if not len(bars):
+            return [(start, end)]
+        ranges = []
+        if bars['ts'][0] > start:
+            ranges.append((start, int(bars['ts'][0]) - step))
+        if bars['ts'][-1] + step <= end:
+            ranges.append((int(bars['ts'][-1]) + step, end))
+        return ranges
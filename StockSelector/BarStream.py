@@ -0,0 +1,145 @@
+import asyncio, time
+from django.conf import settings
+from redis.exceptions import ResponseError
+from StockSelector import Metrics
+
+STREAMS = {
+    "bars": 500,
+    "ticks": 10000,
+    "bus": 100000,
+    "block": 5000,
+    "count": 500,
+    "group": "analytics",
+    "claimIdle": 60,
+    "writerTtl": 10,
+    **getattr(settings, "STOCK_STREAMS", {})
+}
+# every closed bar of every symbol, indicators attached to the 1m ones
+BUS_KEY = "stock|bus|bars"
+
+STREAM_CONSUMED = Metrics.counter("stonks_stream_consumed_total", "Stream entries handled by a consumer group", ("group",))
+STREAM_FAILED = Metrics.counter("stonks_stream_failed_total", "Stream entries whose handler raised, left pending for a retry", ("group",))
+STREAM_LAG = Metrics.histogram("stonks_stream_consumer_lag_seconds", "Time between an entry's XADD and its handling", ("group",))
+
+def barKey(symbol, label):
+    return f"stock|{symbol}|bars|{label}"
+
+def tickKey(symbol):
+    return f"stock|{symbol}|ticks"
+
+def writerKey(symbol):
+    return f"stock|{symbol}|ticks|writer"
+
+def barId(ts):
+    # bar entries are keyed by their start time, so a time range maps straight to an ID range
+    return f"{int(ts) * 1000}-0"
+
+def idTime(entryId):
+    # the millisecond part of an entry ID, as seconds
+    entryId = entryId.decode() if isinstance(entryId, bytes) else entryId
+    return int(entryId.split("-")[0]) / 1000
+
+def isDuplicate(err):
+    # the bar is already on the stream: a second writer during a shard handoff, or a restart
+    return isinstance(err, ResponseError) and "equal or smaller" in str(err)
+
+def _key(key):
+    return key.decode() if isinstance(key, bytes) else key
+
+async def claimWriters(redis, symbols, writerId, ttl=None):
+    # tick entries have no natural ID to de-duplicate on, so one process per symbol appends them:
+    # a lease taken with SET NX and renewed by its holder, a dead writer's symbols move within the TTL
+    ttl = ttl or STREAMS["writerTtl"]
+    async with redis.pipeline(transaction=False) as pipe:
+        for symbol in symbols:
+            await pipe.set(writerKey(symbol), writerId, nx=True, ex=ttl)
+            await pipe.get(writerKey(symbol))
+        results = await pipe.execute()
+    owned = {symbol for symbol, holder in zip(symbols, results[1::2]) if holder is not None and _key(holder) == writerId}
+    if owned:
+        async with redis.pipeline(transaction=False) as pipe:
+            for symbol in owned:
+                await pipe.expire(writerKey(symbol), ttl)
+            await pipe.execute()
+    return owned
+
+async def tail(redis, streams, block=None, count=None):
+    # XREAD BLOCK from the given last-seen IDs ("$" for only new entries), yields
+    # (stream, id, fields) forever; the IDs dict is kept current so a caller can resume from it
+    block = STREAMS["block"] if block is None else block
+    count = count or STREAMS["count"]
+    while True:
+        response = await redis.xread(streams, count=count, block=block)
+        for stream, entries in response or []:
+            stream = _key(stream)
+            for entryId, fields in entries:
+                streams[stream] = entryId
+                yield stream, entryId, fields
+
+class StreamGroup():
+    # One consumer of a consumer group: entries are acked only after the handler returns, so
+    # whatever a crashed consumer had in flight is claimed by the next one after claimIdle seconds
+    def __init__(self, redis, stream, handler, group=None, consumer="worker", count=None, block=None, claimIdle=None):
+        self.redis = redis
+        self.stream = stream
+        self.handler = handler
+        self.group = group or STREAMS["group"]
+        self.consumer = consumer
+        self.count = count or STREAMS["count"]
+        self.block = STREAMS["block"] if block is None else block
+        self.claimIdle = STREAMS["claimIdle"] if claimIdle is None else claimIdle
+        self.stopping = False
+        self.stats = {"handled": 0, "failed": 0, "claimed": 0}
+
+    async def ensureGroup(self, start="$"):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id=start, mkstream=True)
+        except ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+    async def claim(self):
+        # take over entries other consumers read but never acked
+        cursor = "0-0"
+        while True:
+            cursor, entries, *_ = await self.redis.xautoclaim(self.stream, self.group, self.consumer,
+                                                               int(self.claimIdle * 1000), cursor, count=self.count)
+            self.stats["claimed"] += len(entries)
+            await self._handle(entries)
+            if _key(cursor) == "0-0" or not entries:
+                return
+
+    async def _handle(self, entries):
+        done = []
+        for entryId, fields in entries:
+            if fields is None:
+                # trimmed away by MAXLEN before anyone handled it
+                done.append(entryId)
+                continue
+            try:
+                await self.handler(entryId, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.stats["failed"] += 1
+                STREAM_FAILED.inc(self.group)
+                Metrics.error("streams.handle", err, self.stream, entryId)
+                continue
+            STREAM_LAG.observe(time.time() - idTime(entryId), self.group)
+            done.append(entryId)
+        if done:
+            await self.redis.xack(self.stream, self.group, *done)
+            self.stats["handled"] += len(done)
+            STREAM_CONSUMED.inc(self.group, amount=len(done))
+
+    async def run(self, start="$"):
+        await self.ensureGroup(start)
+        await self.claim()
+        claimedAt = time.time()
+        while not self.stopping:
+            response = await self.redis.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=self.count, block=self.block)
+            for _, entries in response or []:
+                await self._handle(entries)
+            if time.time() - claimedAt >= self.claimIdle:
+                await self.claim()
+                claimedAt = time.time()
@@ -0,0 +1,102 @@
+import asyncio, contextlib, random, time
+import orjson
+import websockets
+
+class FakeFinnhubServer():
+    def __init__(self, host='127.0.0.1', port=8765, tradesPerSec=10, pingInterval=10, trackPrices=0):
+        self.host = host
+        self.port = port
+        self.tradesPerSec = tradesPerSec
+        self.pingInterval = pingInterval
+        self.server = None
+        self.prices = {}
+        # symbol -> {price: perf_counter when sent} for the last trackPrices trades, for latency
+        self.trackPrices = trackPrices
+        self.sentAt = {}
+        self.stats = {
+            "connections": 0,
+            "openConnections": 0,
+            "subscribes": 0,
+            "unsubscribes": 0,
+            "framesSent": 0,
+            "tradesSent": 0
+        }
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}?token=fake"
+
+    async def start(self):
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        if not self.port:
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def _nextPrice(self, symbol):
+        price = self.prices.get(symbol) or random.uniform(20, 500)
+        price = max(0.01, price * (1 + random.gauss(0, 0.0005)))
+        self.prices[symbol] = price
+        return round(price, 4)
+
+    async def _handler(self, ws):
+        self.stats["connections"] += 1
+        self.stats["openConnections"] += 1
+        subscriptions = set()
+        sender = asyncio.create_task(self._sendTrades(ws, subscriptions))
+        try:
+            async for msg in ws:
+                try:
+                    data = orjson.loads(msg)
+                except Exception:
+                    continue
+                symbol = data.get("symbol")
+                if data.get("type") == "subscribe" and symbol:
+                    subscriptions.add(symbol)
+                    self.stats["subscribes"] += 1
+                elif data.get("type") == "unsubscribe" and symbol:
+                    subscriptions.discard(symbol)
+                    self.stats["unsubscribes"] += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.stats["openConnections"] -= 1
+            sender.cancel()
+            with contextlib.suppress(BaseException):
+                await sender
+
+    async def _sendTrades(self, ws, subscriptions):
+        # one frame per tick carrying a trade for every subscribed symbol, like Finnhub batches them
+        interval = 1 / self.tradesPerSec if self.tradesPerSec > 0 else 1
+        lastPing = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if now - lastPing >= self.pingInterval:
+                await ws.send('{"type":"ping"}')
+                lastPing = now
+            if not subscriptions:
+                continue
+            ts = int(time.time() * 1000)
+            trades = [{
+                "s": symbol,
+                "p": self._nextPrice(symbol),
+                "t": ts,
+                "v": random.randint(1, 500),
+                "c": None
+            } for symbol in list(subscriptions)]
+            await ws.send(orjson.dumps({"type": "trade", "data": trades}).decode())
+            if self.trackPrices:
+                sent = time.perf_counter()
+                for trade in trades:
+                    recent = self.sentAt.setdefault(trade["s"], {})
+                    recent[trade["p"]] = sent
+                    if len(recent) > self.trackPrices:
+                        del recent[next(iter(recent))]
+            self.stats["framesSent"] += 1
+            self.stats["tradesSent"] += len(trades)
@@ -0,0 +1,265 @@
+import asyncio, time
+from redis.exceptions import ResponseError
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    return str(value).encode()
+
+def _key(key):
+    return key.decode() if isinstance(key, bytes) else key
+
+class FakePipeline():
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.calls = []
+
+    def __await__(self):
+        # redis.asyncio pipelines are awaitable, commands can be queued with or without await
+        yield from ()
+        return self
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self, raise_on_error=True):
+        calls, self.calls = self.calls, []
+        results = []
+        for name, args, kwargs in calls:
+            try:
+                results.append(await getattr(self.redis, name)(*args, **kwargs))
+            except Exception as err:
+                if raise_on_error:
+                    raise
+                results.append(err)
+        return results
+
+class FakeRedis():
+    # in-process stand-in for the commands the app issues, for load tests without a redis-server
+    def __init__(self):
+        self.data = {}
+        self.zsets = {}
+        self.sets = {}
+        self.streams = {}
+        self.commands = 0
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        async def unavailable(keys=None, args=None):
+            # scripts are not emulated, callers fall back to their local behaviour
+            raise ConnectionError("scripts are not supported by FakeRedis")
+        return unavailable
+
+    async def execute_command(self, name, *args):
+        return await getattr(self, name.lower())(*args)
+
+    async def get(self, key):
+        self.commands += 1
+        return self._live(_key(key))
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        self.commands += 1
+        key = _key(key)
+        if nx and self._live(key) is not None:
+            return None
+        expires = time.time() + (px / 1000 if px else ex) if (px or ex) else None
+        self.data[key] = (_bytes(value), expires)
+        return True
+
+    async def setex(self, key, seconds, value):
+        return await self.set(key, value, ex=seconds)
+
+    async def mget(self, keys, *more):
+        self.commands += 1
+        keys = list(keys) + list(more) if isinstance(keys, (list, tuple)) else [keys, *more]
+        return [self._live(_key(key)) for key in keys]
+
+    async def delete(self, *keys):
+        self.commands += 1
+        removed = 0
+        for key in map(_key, keys):
+            removed += (self.data.pop(key, None) is not None) + (self.zsets.pop(key, None) is not None) + (self.sets.pop(key, None) is not None) + (self.streams.pop(key, None) is not None)
+        return removed
+
+    async def expire(self, key, seconds):
+        # only plain values expire here, sets and sorted sets live until deleted
+        self.commands += 1
+        key = _key(key)
+        if key in self.data:
+            self.data[key] = (self.data[key][0], time.time() + seconds)
+        return key in self.data or key in self.sets or key in self.zsets
+
+    async def sadd(self, key, *members):
+        self.commands += 1
+        members = {_bytes(member) for member in members}
+        values = self.sets.setdefault(_key(key), set())
+        added = len(members - values)
+        values.update(members)
+        return added
+
+    async def srem(self, key, *members):
+        self.commands += 1
+        values = self.sets.get(_key(key), set())
+        members = {_bytes(member) for member in members}
+        removed = len(members & values)
+        values -= members
+        return removed
+
+    async def smembers(self, key):
+        self.commands += 1
+        return set(self.sets.get(_key(key), set()))
+
+    async def sunion(self, keys, *more):
+        self.commands += 1
+        keys = list(keys) + list(more) if isinstance(keys, (list, tuple)) else [keys, *more]
+        union = set()
+        for key in keys:
+            union |= self.sets.get(_key(key), set())
+        return union
+
+    def _sorted(self, key):
+        return sorted(self.zsets.get(_key(key), {}).items(), key=lambda item: (item[1], item[0]))
+
+    async def zadd(self, key, mapping):
+        self.commands += 1
+        zset = self.zsets.setdefault(_key(key), {})
+        added = sum(1 for member in mapping if _bytes(member) not in zset)
+        for member, score in mapping.items():
+            zset[_bytes(member)] = float(score)
+        return added
+
+    async def zrange(self, key, start, end):
+        self.commands += 1
+        members = [member for member, _ in self._sorted(key)]
+        count = len(members)
+        start = max(count + start, 0) if start < 0 else start
+        end = count + end if end < 0 else min(end, count - 1)
+        if start > end or start >= count:
+            return []
+        return members[start:end + 1]
+
+    async def zrangebyscore(self, key, low, high):
+        self.commands += 1
+        low, high = float(low), float(high)
+        return [member for member, score in self._sorted(key) if low <= score <= high]
+
+    async def zrem(self, key, *members):
+        self.commands += 1
+        zset = self.zsets.get(_key(key), {})
+        return sum(zset.pop(_bytes(member), None) is not None for member in members)
+
+    async def zremrangebyscore(self, key, low, high):
+        self.commands += 1
+        low, high = float(low), float(high)
+        zset = self.zsets.get(_key(key), {})
+        doomed = [member for member, score in zset.items() if low <= score <= high]
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
+
+    async def zremrangebyrank(self, key, start, end):
+        doomed = await self.zrange(key, start, end)
+        zset = self.zsets.get(_key(key), {})
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
+
+    @staticmethod
+    def _id(value, default=0):
+        # "ms-seq" or "ms" as bytes or str, to a comparable tuple
+        value = _key(value)
+        ms, _, seq = value.partition("-")
+        return int(ms), int(seq) if seq else default
+
+    @staticmethod
+    def _bound(value, low):
+        # XRANGE bounds: - and +, inclusive IDs and exclusive "(" IDs
+        value = _key(value)
+        if value == "-":
+            return (0, 0), False
+        if value == "+":
+            return (float("inf"), 0), False
+        exclusive = value.startswith("(")
+        return FakeRedis._id(value.lstrip("("), 0 if low else float("inf")), exclusive
+
+    def _entries(self, key, low, high):
+        (lowId, lowOpen), (highId, highOpen) = self._bound(low, True), self._bound(high, False)
+        return [entry for entry in self.streams.get(_key(key), [])
+                if (entry[0] > lowId if lowOpen else entry[0] >= lowId) and (entry[0] < highId if highOpen else entry[0] <= highId)]
+
+    @staticmethod
+    def _reply(entry):
+        (ms, seq), fields = entry
+        return f"{ms}-{seq}".encode(), dict(fields)
+
+    async def xadd(self, name, fields, id="*", maxlen=None, approximate=True):
+        # MAXLEN trims exactly here, redis only trims whole nodes with ~
+        self.commands += 1
+        stream = self.streams.setdefault(_key(name), [])
+        last = stream[-1][0] if stream else (0, 0)
+        if _key(id) == "*":
+            entryId = max((int(time.time() * 1000), 0), (last[0], last[1] + 1))
+        else:
+            entryId = self._id(id)
+            if entryId <= last:
+                raise ResponseError("The ID specified in XADD is equal or smaller than the target stream top item")
+        stream.append((entryId, {_bytes(field): _bytes(value) for field, value in fields.items()}))
+        if maxlen is not None and len(stream) > maxlen:
+            del stream[:len(stream) - maxlen]
+        return f"{entryId[0]}-{entryId[1]}".encode()
+
+    async def xlen(self, name):
+        self.commands += 1
+        return len(self.streams.get(_key(name), []))
+
+    async def xrange(self, name, min="-", max="+", count=None):
+        self.commands += 1
+        return [self._reply(entry) for entry in self._entries(name, min, max)[:count]]
+
+    async def xrevrange(self, name, max="+", min="-", count=None):
+        self.commands += 1
+        entries = self._entries(name, min, max)[::-1]
+        return [self._reply(entry) for entry in entries[:count]]
+
+    async def xread(self, streams, count=None, block=None):
+        # BLOCK polls every 10 ms instead of waking on XADD
+        deadline = None if block is None else time.time() + block / 1000
+        last = {}
+        for key, entryId in streams.items():
+            stream = self.streams.get(_key(key), [])
+            last[key] = (stream[-1][0] if stream else (0, 0)) if _key(entryId) == "$" else self._id(entryId)
+        while True:
+            self.commands += 1
+            response = []
+            for key, after in last.items():
+                entries = [entry for entry in self.streams.get(_key(key), []) if entry[0] > after][:count]
+                if entries:
+                    response.append([_bytes(key), [self._reply(entry) for entry in entries]])
+            if response or deadline is None or (block and time.time() >= deadline):
+                return response
+            await asyncio.sleep(0.01)
+
+    async def aclose(self):
+        return None
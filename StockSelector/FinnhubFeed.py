@@ -0,0 +1,351 @@
+import asyncio, contextlib, os, re, socket, time, uuid
+import orjson
+import websockets
+from channels.layers import get_channel_layer
+from dotenv import load_dotenv
+from StockSelector.SymbolEngine import SymbolEngine
+from StockSelector.MarketData import MarketDataClient
+from StockSelector.BarStore import BarStore
+from StockSelector.RedisPool import RedisPool, AutoBatcher, sharedRedis
+from StockSelector.BarStream import STREAMS, tickKey, claimWriters
+from StockSelector.OpeningPrices import OpeningPrices, watchSymbol, latestKey, liveFrame
+from StockSelector.BarBuilder import INTERVALS
+from StockSelector.TapeRecorder import TapeRecorder
+from StockSelector.TickCoalescer import TickCoalescer, PUBLISH_COALESCE, coalescing
+from StockSelector import Metrics
+
+load_dotenv('./content.env')
+FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
+FINNHUB_WS_URL = os.getenv("FINNHUB_WS_URL", "wss://ws.finnhub.io")
+
+UPSTREAM_MESSAGES = Metrics.counter("stonks_upstream_messages_total", "Frames received from the Finnhub websocket")
+UPSTREAM_TRADES = Metrics.counter("stonks_upstream_trades_total", "Trades for subscribed symbols in those frames")
+UPSTREAM_CONNECTS = Metrics.counter("stonks_upstream_connects_total", "Finnhub websocket connections opened")
+PARSE_SECONDS = Metrics.histogram("stonks_upstream_parse_seconds", "Time to decode one Finnhub frame")
+DISPATCH_SECONDS = Metrics.histogram("stonks_upstream_dispatch_seconds", "Time to fold one frame into bars and fan it out")
+QUOTE_FLUSH_SECONDS = Metrics.histogram("stonks_quote_flush_seconds", "Time to publish one coalesced window of every symbol's trades")
+BAR_CLOSE_LAG = Metrics.histogram("stonks_bar_close_lag_seconds", "Wall time between a bar's end and its publish", ("interval",),
+                                  buckets=(0.05, 0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 10, 30, 60))
+
+def groupName(symbol):
+    # channel layer group names only allow ASCII alphanumerics, hyphens, underscores and periods
+    return "stock." + re.sub(r'[^0-9A-Za-z\-_.]', '_', symbol)[:90]
+
+class FinnhubFeed():
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        loop = asyncio.get_running_loop()
+        if cls._instance is None or cls._instance.loop is not loop:
+            cls._instance = cls()
+            cls._instance.loop = loop
+        return cls._instance
+
+    def __init__(self, url=None, channelLayer=None, redis=None, persist=True, scheduler=None, clock=time.time, recorder=None, coalesce=True):
+        self.url = url or f"{FINNHUB_WS_URL}?token={FINNHUB_API_KEY}"
+        self.channelLayer = channelLayer or get_channel_layer()
+        self.redis = None
+        self.batch = None
+        self.store = None
+        self.scheduler = scheduler
+        self.clock = clock
+        self.recorder = recorder
+        if persist:
+            self.store = BarStore.default()
+            self.redis = redis or sharedRedis()
+            # tick stream appends ride the shared auto-batcher instead of a round trip per frame
+            self.batch = AutoBatcher(redis) if redis is not None else RedisPool.instance().batch
+            # connection attempts draw from the same Finnhub quota as the REST calls
+            self.scheduler = scheduler or MarketDataClient.instance().schedulers["finnhub"]
+            # STOCK_TAPE["enabled"] captures every trade frame for replay and backtests
+            self.recorder = recorder or TapeRecorder.default()
+        if self.recorder is not None:
+            self.recorder.start()
+        self.loop = None
+        self.writerId = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # symbols whose tick stream this feed holds the writer lease for
+        self.tickWriters = set()
+        self.leasedAt = 0.0
+        # trades are conflated once per symbol here, every consumer gets the same window
+        self.coalescer = TickCoalescer() if coalesce and coalescing() else None
+        self.publish_task = None
+        self.refs = {}
+        self.engines = {}
+        self.finnhubSocket = None
+        self.stream_task = None
+        self.timer_task = None
+        self.stats = {
+            "connects": 0,
+            "messages": 0,
+            "trades": 0,
+            "subscribes": 0,
+            "unsubscribes": 0
+        }
+
+    async def join(self, symbol, channelName):
+        await self.channelLayer.group_add(groupName(symbol), channelName)
+        await self.acquire(symbol)
+
+    async def leave(self, symbol, channelName):
+        with contextlib.suppress(Exception):
+            await self.channelLayer.group_discard(groupName(symbol), channelName)
+        await self.release(symbol)
+
+    async def acquire(self, symbol):
+        # a shard worker holds symbols without any local consumer in the group
+        count = self.refs.get(symbol, 0)
+        self.refs[symbol] = count + 1
+        if count == 0:
+            # indicator state lives here once per symbol, every viewer only gets the results
+            engine = SymbolEngine(symbol, self.redis, store=self.store)
+            self.engines[symbol] = engine
+            await engine._getRedisSeed()
+            if self.redis is not None:
+                # tomorrow's opening-price warmup covers every symbol someone watched
+                await watchSymbol(self.redis, symbol)
+            # the last viewer may have released the symbol during those awaits (and a new one
+            # started over with its own engine): then there is nothing left to start or subscribe
+            if self.engines.get(symbol) is not engine:
+                return
+            if self.stream_task is None or self.stream_task.done():
+                self.stream_task = asyncio.create_task(self.priceStream())
+            if self.timer_task is None or self.timer_task.done():
+                self.timer_task = asyncio.create_task(self.bucketTimer())
+            if self.coalescer is not None and (self.publish_task is None or self.publish_task.done()):
+                self.publish_task = asyncio.create_task(self.publishFlusher())
+            await self._ws_subscribe(symbol)
+            await self.renewTickWriters([symbol])
+
+    async def release(self, symbol):
+        count = self.refs.get(symbol, 0)
+        if count > 1:
+            self.refs[symbol] = count - 1
+            return
+        if count == 0:
+            return
+        del self.refs[symbol]
+        self.engines.pop(symbol, None)
+        self.tickWriters.discard(symbol)
+        if self.coalescer is not None:
+            self.coalescer.pending.pop(symbol, None)
+        await self._ws_unsubscribe(symbol)
+        if not self.refs:
+            await self.close()
+
+    async def indicators(self, symbols):
+        result = {}
+        for symbol in symbols:
+            engine = self.engines.get(symbol)
+            if engine is not None and engine.indicators is not None:
+                result[symbol] = engine.indicators
+        return result
+
+    async def renewTickWriters(self, symbols=None):
+        # every process streaming a symbol sees the same trades, only the lease holder appends them
+        if self.batch is None or not STREAMS["ticks"]:
+            return
+        try:
+            owned = await claimWriters(self.redis, list(self.engines) if symbols is None else symbols, self.writerId)
+        except Exception as err:
+            Metrics.error("feed.tickWriters", err)
+            return
+        if symbols is None:
+            self.tickWriters = owned
+            self.leasedAt = self.clock()
+        else:
+            # a symbol released while its lease was being claimed stays out
+            self.tickWriters.update(owned & set(self.engines))
+
+    async def close(self):
+        tasks = [self.stream_task, self.timer_task, self.publish_task]
+        self.stream_task = self.timer_task = self.publish_task = None
+        for task in tasks:
+            if task is None:
+                continue
+            task.cancel()
+            with contextlib.suppress(BaseException):
+                await task
+
+    async def _ws_subscribe(self, symbol):
+        # before the socket is up the symbol is picked up by the resubscribe on connect
+        if self.finnhubSocket is None:
+            return
+        with contextlib.suppress(websockets.exceptions.ConnectionClosed):
+            await self.finnhubSocket.send(orjson.dumps({
+                "type": "subscribe",
+                "symbol": symbol
+            }).decode())
+            self.stats["subscribes"] += 1
+
+    async def _ws_unsubscribe(self, symbol):
+        if self.finnhubSocket is None:
+            return
+        with contextlib.suppress(websockets.exceptions.ConnectionClosed):
+            await self.finnhubSocket.send(orjson.dumps({
+                "type": "unsubscribe",
+                "symbol": symbol
+            }).decode())
+            self.stats["unsubscribes"] += 1
+
+    @staticmethod
+    def _parseFrame(msg):
+        try:
+            data = orjson.loads(msg)
+        except Exception:
+            return None
+        if data.get("type") != "trade":
+            return None
+        trades = {}
+        for tr in data.get("data") or []:
+            try:
+                symbol = tr["s"]
+                price = float(tr["p"])
+                ts = int(tr["t"])
+                vol = float(tr.get("v") or 0)
+            except Exception:
+                continue
+            trades.setdefault(symbol, []).append([price, ts, vol])
+        return trades
+
+    async def _dispatch(self, msg):
+        self.stats["messages"] += 1
+        UPSTREAM_MESSAGES.inc()
+        start = time.perf_counter()
+        trades = self._parseFrame(msg)
+        PARSE_SECONDS.observe(time.perf_counter() - start)
+        if not trades:
+            return
+        if self.recorder is not None:
+            self.recorder.record(msg, tuple(trades))
+        for symbol, batch in trades.items():
+            engine = self.engines.get(symbol)
+            if engine is None:
+                continue
+            self.stats["trades"] += len(batch)
+            UPSTREAM_TRADES.inc(amount=len(batch))
+            if self.coalescer is not None:
+                for price, ts, vol in batch:
+                    self.coalescer.add(symbol, price, vol)
+            elif self.batch is not None:
+                # uncoalesced, one write per symbol and frame, however many consumers fan it out
+                last = batch[-1][0]
+                self.batch.send("setex", latestKey(symbol), 60, orjson.dumps(liveFrame(symbol, last, OpeningPrices.prices.get(symbol))))
+            if symbol in self.tickWriters:
+                self.batch.send("xadd", tickKey(symbol), {"d": orjson.dumps(batch)}, maxlen=STREAMS["ticks"], approximate=True)
+            for price, ts, vol in batch:
+                closed = engine.addTrade(price, ts, vol)
+                if closed:
+                    await self._publishBars(engine, closed)
+            if self.coalescer is None:
+                await self.channelLayer.group_send(groupName(symbol), {
+                    "type": "stock.trades",
+                    "symbol": symbol,
+                    "trades": batch
+                })
+        DISPATCH_SECONDS.observe(time.perf_counter() - start)
+
+    async def flushQuotes(self):
+        pending = self.coalescer.drain()
+        if not pending:
+            return
+        start = time.perf_counter()
+        quotes = []
+        for symbol, entry in pending.items():
+            if symbol not in self.engines:
+                continue
+            opening = OpeningPrices.prices.get(symbol)
+            quote = liveFrame(symbol, entry["last"], opening)
+            quote["high"] = float(entry["high"])
+            quote["low"] = float(entry["low"])
+            quote["volume"] = float(entry["volume"])
+            quote["ticks"] = entry["ticks"]
+            frame = orjson.dumps(quote)
+            quotes.append((symbol, quote, frame, bool(opening)))
+            if self.batch is not None:
+                # sent back to back, so the auto-batcher writes every symbol's latest in one pipeline
+                self.batch.send("setex", latestKey(symbol), 60, frame)
+        for symbol, quote, frame, opened in quotes:
+            # consumers forward the frame as is; opened says whether it already holds today's change
+            await self.channelLayer.group_send(groupName(symbol), {
+                "type": "stock.quote",
+                "symbol": symbol,
+                "quote": quote,
+                "frame": frame.decode(),
+                "opened": opened
+            })
+        QUOTE_FLUSH_SECONDS.observe(time.perf_counter() - start)
+
+    async def publishFlusher(self):
+        # interval flushes on a fixed cadence, deadline flushes N ms after the first tick of a window
+        delay = PUBLISH_COALESCE.get("ms", 250) / 1000
+        while self.engines:
+            if PUBLISH_COALESCE.get("mode") == "deadline":
+                await self.coalescer.wait()
+            await asyncio.sleep(delay)
+            try:
+                await self.flushQuotes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                Metrics.error("feed.flushQuotes", err)
+
+    async def _publishBars(self, engine, closed):
+        try:
+            indicators = await engine._closeBucket(closed)
+        except Exception as err:
+            Metrics.error("feed.closeBucket", err, engine.symbol)
+            indicators = engine.indicators
+        now = self.clock()
+        for label, bar in closed:
+            BAR_CLOSE_LAG.observe(now - bar['ts'] - INTERVALS[label], label)
+        await self.channelLayer.group_send(groupName(engine.symbol), {
+            "type": "stock.bars",
+            "symbol": engine.symbol,
+            "bars": [[label, bar] for label, bar in closed],
+            "indicators": indicators
+        })
+
+    async def closeDue(self, now):
+        for engine in list(self.engines.values()):
+            try:
+                closed = engine.closeDue(now)
+                if closed:
+                    await self._publishBars(engine, closed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                Metrics.error("feed.bucketTimer", err, engine.symbol)
+
+    async def bucketTimer(self):
+        while self.engines:
+            await asyncio.sleep(1)
+            await self.closeDue(self.clock())
+            if self.clock() - self.leasedAt >= STREAMS["writerTtl"] / 3:
+                await self.renewTickWriters()
+
+    async def priceStream(self):
+        backoff = 1
+        maxBackoff = 30
+        while self.refs:
+            try:
+                if self.scheduler is not None:
+                    await self.scheduler.acquire("live")
+                async with websockets.connect(self.url) as ws:
+                    self.finnhubSocket = ws
+                    self.stats["connects"] += 1
+                    UPSTREAM_CONNECTS.inc()
+                    for symbol in list(self.refs):
+                        await self._ws_subscribe(symbol)
+                    backoff = 1
+                    async for msg in ws:
+                        await self._dispatch(msg)
+            except asyncio.CancelledError:
+                break
+            except Exception as err:
+                Metrics.error("feed.priceStream", err)
+                self.finnhubSocket = None
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, maxBackoff)
+            finally:
+                self.finnhubSocket = None
@@ -0,0 +1,175 @@
+import asyncio, datetime, hashlib, os, re, time, weakref
+import aiohttp
+import orjson
+from dotenv import load_dotenv
+from django.conf import settings
+from StockSelector.RateLimiter import RedisTokenBucket, RequestScheduler
+from StockSelector.RedisPool import sharedRedis
+from StockSelector import Metrics
+
+load_dotenv('./content.env')
+FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
+ALPHAVANTAGE_API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
+FINNHUB_URL = os.getenv("FINNHUB_URL", "https://finnhub.io/api/v1")
+ALPHAVANTAGE_URL = os.getenv("ALPHAVANTAGE_URL", "https://www.alphavantage.co/query")
+
+RATE_LIMITS = getattr(settings, "MARKET_DATA_RATE_LIMITS", {
+    "finnhub": {"perMinute": 60, "burst": 10},
+    "alphavantage": {"perMinute": 5, "burst": 1}
+})
+
+TIMEOUTS = {
+    "quote": 3,
+    "fundamentals": 5,
+    "earnings": 5,
+    "timeseries": 10
+}
+
+TIME_SERIES = {
+    'intraday': ('TIME_SERIES_INTRADAY', {'interval': '5min'}),
+    'daily': ('TIME_SERIES_DAILY_ADJUSTED', {}),
+    'weekly': ('TIME_SERIES_WEEKLY_ADJUSTED', {}),
+    'monthly': ('TIME_SERIES_MONTHLY_ADJUSTED', {})
+}
+
+# symbols as the providers spell them (AAPL, BRK.B, BINANCE:BTCUSDT, OANDA:EUR_USD, btcusdt):
+# printable ASCII without spaces; where they name files BarStore encodes them
+SYMBOL_MAX_LEN = 32
+SYMBOL = re.compile(rf"[!-~]{{1,{SYMBOL_MAX_LEN}}}")
+
+def validSymbol(symbol):
+    return isinstance(symbol, str) and SYMBOL.fullmatch(symbol) is not None
+
+HTTP_SECONDS = Metrics.histogram("stonks_upstream_http_seconds", "Upstream REST latency by provider and endpoint", ("provider", "endpoint"))
+HTTP_ERRORS = Metrics.counter("stonks_upstream_http_errors_total", "Failed upstream REST calls by provider and endpoint", ("provider", "endpoint"))
+
+class MarketDataError(Exception):
+    pass
+
+class MarketDataClient():
+    # aiohttp sessions are bound to the loop that created them, so keep one client per loop
+    _clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def instance(cls):
+        loop = asyncio.get_running_loop()
+        client = cls._clients.get(loop)
+        if client is None:
+            client = cls._clients[loop] = cls()
+        return client
+
+    def __init__(self, limit=100, limitPerHost=20, finnhubUrl=None, alphavantageUrl=None, redis=None, schedulers=None):
+        self.finnhubUrl = finnhubUrl or FINNHUB_URL
+        self.alphavantageUrl = alphavantageUrl or ALPHAVANTAGE_URL
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.session = None
+        self.schedulers = schedulers or self._schedulers(redis or sharedRedis())
+
+    @staticmethod
+    def _schedulers(redis):
+        # one shared bucket per provider and API key, whichever process or view is asking
+        schedulers = {}
+        for provider, apiKey in (("finnhub", FINNHUB_API_KEY), ("alphavantage", ALPHAVANTAGE_API_KEY)):
+            limits = RATE_LIMITS[provider]
+            keyHash = hashlib.sha1((apiKey or "").encode()).hexdigest()[:10]
+            bucket = RedisTokenBucket(redis, f"ratelimit|{provider}|{keyHash}", limits["perMinute"] / 60, limits["burst"])
+            schedulers[provider] = RequestScheduler(bucket)
+        return schedulers
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limitPerHost, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def _getJson(self, url, params, timeout, provider="other", endpoint="other"):
+        start = time.perf_counter()
+        try:
+            return await self._fetchJson(url, params, timeout)
+        except MarketDataError:
+            HTTP_ERRORS.inc(provider, endpoint)
+            raise
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - start, provider, endpoint)
+
+    async def _fetchJson(self, url, params, timeout):
+        try:
+            async with self._session().get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status != 200:
+                    raise MarketDataError(f"{url} returned {response.status}")
+                return orjson.loads(await response.read())
+        except asyncio.TimeoutError:
+            raise MarketDataError(f"{url} timed out after {timeout}s")
+        except (aiohttp.ClientError, orjson.JSONDecodeError) as err:
+            raise MarketDataError(f"{url} failed: {err}")
+
+    async def _scheduled(self, provider, url, params, timeout, priority, endpoint):
+        # identical requests still waiting for a token are merged into one upstream call
+        resource = f"{url}?{sorted(params.items())}"
+        scheduler = self.schedulers[provider]
+        return await scheduler.submit(resource, lambda: self._getJson(url, params, timeout, provider, endpoint), priority)
+
+    async def finnhub(self, path, params, timeout, priority="fundamentals"):
+        return await self._scheduled("finnhub", f"{self.finnhubUrl}{path}", {**params, 'token': FINNHUB_API_KEY}, timeout, priority, path)
+
+    async def alphavantage(self, function, symbol, timeout, priority="fundamentals", **params):
+        return await self._scheduled("alphavantage", self.alphavantageUrl, {
+            'function': function,
+            'symbol': symbol,
+            'apikey': ALPHAVANTAGE_API_KEY,
+            **params
+        }, timeout, priority, function)
+
+    async def quote(self, symbol, priority="live"):
+        return await self.finnhub('/quote', {'symbol': symbol}, TIMEOUTS['quote'], priority)
+
+    async def basicFinancials(self, symbol, priority="fundamentals"):
+        return await self.finnhub('/stock/metric', {'symbol': symbol, 'metric': 'all'}, TIMEOUTS['fundamentals'], priority)
+
+    async def companyProfile(self, symbol, priority="fundamentals"):
+        return await self.finnhub('/stock/profile2', {'symbol': symbol}, TIMEOUTS['fundamentals'], priority)
+
+    async def earningsCalendar(self, symbol, days=30, priority="fundamentals"):
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=days)
+        return await self.finnhub('/calendar/earnings', {
+            'from': start.strftime('%Y-%m-%d'),
+            'to': today.strftime('%Y-%m-%d'),
+            'symbol': symbol,
+            'international': 'false'
+        }, TIMEOUTS['earnings'], priority)
+
+    async def timeSeries(self, symbol, time='daily', priority="fundamentals"):
+        if time not in TIME_SERIES:
+            raise MarketDataError(f"Unknown time series {time}")
+        function, params = TIME_SERIES[time]
+        data = await self.alphavantage(function, symbol, TIMEOUTS['timeseries'], priority, **params)
+        seriesKey = next((key for key in data if 'Time Series' in key), None)
+        if seriesKey is None:
+            raise MarketDataError(data.get('Note') or data.get('Error Message') or "No time series in response")
+        return data[seriesKey]
+
+    def schedulerStats(self):
+        return {provider: scheduler.snapshot() for provider, scheduler in self.schedulers.items()}
+
+@Metrics.collector
+def _collect():
+    depth = Metrics.gauge("stonks_scheduler_queue_depth", "Upstream requests waiting for a rate limit token", ("provider",))
+    inFlight = Metrics.gauge("stonks_scheduler_in_flight", "Upstream requests running", ("provider",))
+    merged = Metrics.counter("stonks_scheduler_merged_total", "Identical queued requests merged into one call", ("provider",))
+    totals = {}
+    for client in list(MarketDataClient._clients.values()):
+        for provider, stats in client.schedulerStats().items():
+            total = totals.setdefault(provider, [0, 0, 0])
+            total[0] += stats["queueDepth"]
+            total[1] += stats["inFlight"]
+            total[2] += stats["merged"]
+    for provider, (queued, running, merges) in totals.items():
+        depth.set(queued, provider)
+        inFlight.set(running, provider)
+        merged.set(merges, provider)
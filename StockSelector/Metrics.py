@@ -0,0 +1,213 @@
+import ipaddress, logging, sys, threading, time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from django.conf import settings
+
+logger = logging.getLogger("StockSelector")
+
+# seconds, from sub-millisecond redis round trips up to slow upstream HTTP calls
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROFILER_ENABLED = getattr(settings, "STOCK_PROFILER_ENABLED", settings.DEBUG)
+# addresses or networks that may read metrics, stats and the profiler without a staff login
+METRICS_ALLOW = [ipaddress.ip_network(net, strict=False) for net in getattr(settings, "STOCK_METRICS_ALLOW", ["127.0.0.1", "::1"])]
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labelText(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter():
+    # label values are passed positionally in the order of `labels`, keep them low-cardinality
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value, *labels):
+        # collectors mirror totals that are already kept elsewhere
+        self.values[labels] = value
+
+    def samples(self):
+        for labels, value in list(self.values.items()):
+            yield self.name, _labelText(self.labelNames, labels), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+class Histogram():
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *labels):
+        # per-bucket counts, made cumulative only when rendered
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        for labels, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucketCount
+                yield self.name + "_bucket", _labelText(self.labelNames + ("le",), labels + (_number(bound),)), cumulative
+            yield self.name + "_sum", _labelText(self.labelNames, labels), total
+            yield self.name + "_count", _labelText(self.labelNames, labels), count
+
+class Timer():
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+class Registry():
+    # everything lives in this process; each worker is scraped on its own
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, cls, name, help, labels, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def collector(self, fn):
+        # called before each render to copy existing snapshot() stats into gauges
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as err:
+                error("metrics.collector", err)
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+collector = REGISTRY.collector
+
+ERRORS = counter("stonks_errors_total", "Errors caught and survived, by where they happened", ("where",))
+
+def error(where, err, *context):
+    ERRORS.inc(where)
+    logger.warning("%s failed%s: %s", where, "".join(f" {item}" for item in context), err)
+
+def allowedAddress(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in net for net in METRICS_ALLOW)
+
+class SamplingProfiler():
+    # A thread that snapshots every other thread's stack at a fixed interval and counts
+    # collapsed stacks (flamegraph.pl / speedscope format). Off unless started at runtime.
+    def __init__(self):
+        self.thread = None
+        self.running = threading.Event()
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.startedAt = None
+        self.interval = None
+        self.stopAt = None
+
+    def start(self, interval=0.005, seconds=60):
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.interval = interval
+        self.startedAt = time.time()
+        self.stopAt = time.monotonic() + seconds
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, name="stonks-profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join(1)
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running.is_set() and time.monotonic() < self.stopAt:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self.running.clear()
+
+    def collapsed(self, limit=None):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit)) + "\n"
+
+    def snapshot(self):
+        return {
+            "enabled": PROFILER_ENABLED,
+            "running": self.running.is_set(),
+            "interval": self.interval,
+            "startedAt": self.startedAt,
+            "samples": self.samples,
+            "stacks": len(self.stacks)
+        }
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,141 @@
+import asyncio, contextlib, datetime, time
+from StockSelector.MarketData import MarketDataClient, MarketDataError
+
+OPEN_TTL = 24 * 60 * 60
+# sorted set of every symbol the feed has streamed, scored by when it was last joined
+UNIVERSE_KEY = "stock|universe"
+
+def openKey(symbol, day=None):
+    return f"stock|{symbol}|open|{(day or datetime.date.today()):%Y-%m-%d}"
+
+def latestKey(symbol):
+    return f"stock|{symbol}|latest"
+
+def liveFrame(symbol, price, opening):
+    op = opening or 0
+    if op:
+        pchange = (price - op) / op * 100
+        delta = price - op
+    else:
+        pchange = 0
+        delta = 0
+
+    return {
+        "symbol": symbol,
+        "price": float(price),
+        "pchange": float(pchange),
+        "sign": "+" if pchange >= 0 else "-",
+        "delta": float(delta),
+    }
+
+async def watchSymbol(redis, symbol):
+    with contextlib.suppress(Exception):
+        await redis.zadd(UNIVERSE_KEY, {symbol: time.time()})
+
+async def watchedSymbols(redis, days=30):
+    # drops symbols nobody has opened for `days` so the universe does not grow forever
+    cutoff = time.time() - days * 24 * 60 * 60
+    await redis.zremrangebyscore(UNIVERSE_KEY, "-inf", cutoff)
+    return [symbol.decode() if isinstance(symbol, bytes) else symbol for symbol in await redis.zrange(UNIVERSE_KEY, 0, -1)]
+
+class OpeningPrices():
+    # one table per process and trading day, every consumer on the worker reads the same prices
+    day = None
+    prices = {}
+
+    @classmethod
+    def _today(cls):
+        today = datetime.date.today()
+        if cls.day != today:
+            cls.day = today
+            cls.prices = {}
+        return today
+
+    @classmethod
+    async def get(cls, redis, symbols, fetch=True):
+        # fetch=False answers from the table and Redis only, symbols without a price are left out
+        today = cls._today()
+        result = {symbol: cls.prices[symbol] for symbol in symbols if symbol in cls.prices}
+        missing = [symbol for symbol in symbols if symbol not in result]
+        if not missing:
+            return result
+
+        cached = [None] * len(missing)
+        with contextlib.suppress(Exception):
+            cached = await redis.mget([openKey(symbol, today) for symbol in missing])
+        toFetch = []
+        for symbol, value in zip(missing, cached):
+            try:
+                price = float(value) if value is not None else 0
+            except ValueError:
+                price = 0
+            if price > 0:
+                result[symbol] = cls.prices[symbol] = price
+            else:
+                toFetch.append(symbol)
+
+        if toFetch and fetch:
+            fetched = await asyncio.gather(*(cls._fetch(symbol) for symbol in toFetch))
+            with contextlib.suppress(Exception):
+                async with redis.pipeline() as pipe:
+                    for symbol, price in zip(toFetch, fetched):
+                        if price > 0:
+                            await pipe.setex(openKey(symbol, today), OPEN_TTL, price)
+                    await pipe.execute()
+            for symbol, price in zip(toFetch, fetched):
+                result[symbol] = price
+                if price > 0:
+                    cls.prices[symbol] = price
+        return result
+
+    @classmethod
+    async def warm(cls, redis, symbols, day=None, concurrency=8, batchSize=200, force=False, client=None):
+        # fetch in chunks under a concurrency bound, each chunk lands in one SETEX pipeline
+        day = day or datetime.date.today()
+        stats = {"symbols": len(symbols), "cached": 0, "fetched": 0, "failed": 0}
+        if not force:
+            missing = []
+            for offset in range(0, len(symbols), batchSize):
+                chunk = symbols[offset:offset + batchSize]
+                values = await redis.mget([openKey(symbol, day) for symbol in chunk])
+                for symbol, value in zip(chunk, values):
+                    try:
+                        cached = float(value) if value is not None else 0
+                    except ValueError:
+                        cached = 0
+                    if cached > 0:
+                        stats["cached"] += 1
+                    else:
+                        missing.append(symbol)
+            symbols = missing
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetchOne(symbol):
+            async with semaphore:
+                return await cls._fetch(symbol, client, "backfill")
+
+        for offset in range(0, len(symbols), batchSize):
+            chunk = symbols[offset:offset + batchSize]
+            prices = await asyncio.gather(*(fetchOne(symbol) for symbol in chunk))
+            async with redis.pipeline(transaction=False) as pipe:
+                for symbol, price in zip(chunk, prices):
+                    if price > 0:
+                        await pipe.setex(openKey(symbol, day), OPEN_TTL, price)
+                        stats["fetched"] += 1
+                    else:
+                        stats["failed"] += 1
+                await pipe.execute()
+        return stats
+
+    @staticmethod
+    async def _fetch(symbol, client=None, priority="live"):
+        try:
+            data = await (client or MarketDataClient.instance()).quote(symbol, priority=priority)
+            opening = data.get('pc', 0) or data.get('o', 0)
+        except MarketDataError:
+            return 0.0
+        try:
+            return float(opening)
+        except Exception:
+            return 0.0
@@ -0,0 +1,47 @@
+import numpy as np
+from StockSelector.BarStore import BAR_DTYPE, BAR_FIELDS, toBarArray
+from StockSelector.BarStream import barId
+
+# Redis keeps one stream per symbol and interval: the entry ID is the bar ts in ms, the "b"
+# field is the bar as a single little-endian BAR_DTYPE record (48 bytes)
+SNAPSHOT_BARS = 100
+# short column names used by columnar history frames
+COLUMNS = {
+    "ts": "ts",
+    "o": "open",
+    "h": "high",
+    "l": "low",
+    "c": "close",
+    "v": "volume"
+}
+
+def packBars(bars):
+    records = toBarArray(bars)
+    return [records[i:i + 1].tobytes() for i in range(len(records))]
+
+def unpackBars(members):
+    if not members:
+        return np.empty(0, dtype=BAR_DTYPE)
+    return np.frombuffer(b"".join(members), dtype=BAR_DTYPE)
+
+def barsToDicts(records):
+    return [dict(zip(BAR_FIELDS, row)) for row in records.tolist()]
+
+def barsToColumns(records, fields=None):
+    # parallel arrays, one contiguous copy per field, ready for orjson's numpy support
+    return {name: np.ascontiguousarray(records[COLUMNS[name]]) for name in (fields or COLUMNS)}
+
+def _records(entries):
+    return unpackBars([fields[b"b"] for _, fields in entries])
+
+async def readBars(redis, key, start=None, end=None, count=None):
+    # by time when a range is given, otherwise the newest `count` bars; oldest first
+    low = "-" if start is None else barId(start)
+    high = "+" if end is None else barId(end)
+    if count:
+        return _records((await redis.xrevrange(key, high, low, count=count))[::-1])
+    return _records(await redis.xrange(key, low, high))
+
+async def readSince(redis, key, since, count=None):
+    # the bars after `since` (a bar ts), a reconnecting client's catch-up in one XRANGE
+    return _records(await redis.xrange(key, f"({barId(since)}", "+", count=count))
@@ -0,0 +1,198 @@
+import asyncio, heapq, itertools, time
+
+PRIORITY = {
+    "live": 0,
+    "fundamentals": 1,
+    "backfill": 2
+}
+
+# Atomically refill and take one token. The caller passes `now`, so every process shares
+# one bucket per provider and key and a simulated clock drives it the same way.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+if now > ts then
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    ts = now
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', ts)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class LocalTokenBucket():
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = None
+
+    async def take(self, now):
+        if self.ts is None:
+            self.ts = now
+        if now > self.ts:
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class RedisTokenBucket():
+    def __init__(self, redis, key, rate, capacity):
+        self.redis = redis
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.script = redis.register_script(TOKEN_BUCKET_LUA)
+        self.fallback = LocalTokenBucket(rate, capacity)
+
+    async def take(self, now):
+        try:
+            wait = await self.script(keys=[self.key], args=[self.rate, self.capacity, now])
+        except Exception:
+            # without Redis each process still keeps itself inside the quota
+            return await self.fallback.take(now)
+        return float(wait)
+
+class SimulatedClock():
+    def __init__(self, start=0.0):
+        self.now = start
+        self.sleepers = []
+        self.seq = itertools.count()
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.sleepers, (self.now + max(seconds, 0), next(self.seq), future))
+        await future
+
+    async def advance(self, seconds):
+        target = self.now + seconds
+        while self.sleepers and self.sleepers[0][0] <= target:
+            wake, _, future = heapq.heappop(self.sleepers)
+            self.now = max(self.now, wake)
+            if not future.done():
+                future.set_result(None)
+            # let the woken task run before moving the clock further
+            for _ in range(5):
+                await asyncio.sleep(0)
+        self.now = target
+
+class _Pending():
+    __slots__ = ('future', 'fetch', 'priority', 'seq', 'enqueued')
+
+    def __init__(self, future, fetch, priority, seq, enqueued):
+        self.future = future
+        self.fetch = fetch
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = enqueued
+
+class RequestScheduler():
+    def __init__(self, bucket, clock=time.time, sleep=asyncio.sleep):
+        self.bucket = bucket
+        self.clock = clock
+        self.sleep = sleep
+        self.heap = []
+        self.pending = {}
+        self.running = {}
+        self.seq = itertools.count()
+        self.worker = None
+        self.tasks = set()
+        self.stats = {"submitted": 0, "merged": 0, "executed": 0, "waitTotal": 0.0, "waitMax": 0.0}
+
+    def submit(self, resource, fetch, priority="fundamentals"):
+        rank = PRIORITY.get(priority, priority)
+        self.stats["submitted"] += 1
+        if resource is not None:
+            if resource in self.running:
+                self.stats["merged"] += 1
+                return asyncio.shield(self.running[resource])
+            entry = self.pending.get(resource)
+            if entry is not None:
+                self.stats["merged"] += 1
+                if rank < entry.priority:
+                    # requeue at the higher priority, the old heap slot is skipped when popped
+                    entry.priority = rank
+                    entry.seq = next(self.seq)
+                    heapq.heappush(self.heap, (rank, entry.seq, resource))
+                return asyncio.shield(entry.future)
+        else:
+            resource = object()
+        entry = _Pending(asyncio.get_running_loop().create_future(), fetch, rank, next(self.seq), self.clock())
+        self.pending[resource] = entry
+        heapq.heappush(self.heap, (rank, entry.seq, resource))
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._drain())
+        return asyncio.shield(entry.future)
+
+    async def acquire(self, priority="live"):
+        async def granted():
+            return None
+        await self.submit(None, granted, priority)
+
+    async def _drain(self):
+        while self.heap:
+            rank, seq, resource = self.heap[0]
+            entry = self.pending.get(resource)
+            if entry is None or entry.seq != seq:
+                heapq.heappop(self.heap)
+                continue
+            wait = await self.bucket.take(self.clock())
+            if wait > 0:
+                await self.sleep(wait)
+                continue
+            heapq.heappop(self.heap)
+            del self.pending[resource]
+            waited = self.clock() - entry.enqueued
+            self.stats["waitTotal"] += waited
+            self.stats["waitMax"] = max(self.stats["waitMax"], waited)
+            self.stats["executed"] += 1
+            self.running[resource] = entry.future
+            task = asyncio.create_task(self._run(resource, entry))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, resource, entry):
+        try:
+            result = await entry.fetch()
+        except asyncio.CancelledError:
+            entry.future.cancel()
+            raise
+        except Exception as err:
+            entry.future.set_exception(err)
+            entry.future.exception()
+        else:
+            entry.future.set_result(result)
+        finally:
+            self.running.pop(resource, None)
+
+    def snapshot(self):
+        depth = {}
+        for entry in self.pending.values():
+            depth[entry.priority] = depth.get(entry.priority, 0) + 1
+        names = {rank: name for name, rank in PRIORITY.items()}
+        executed = self.stats["executed"]
+        return {
+            "queueDepth": len(self.pending),
+            "queueDepthByPriority": {names.get(rank, rank): count for rank, count in depth.items()},
+            "inFlight": len(self.running),
+            "submitted": self.stats["submitted"],
+            "merged": self.stats["merged"],
+            "executed": executed,
+            "waitAvg": self.stats["waitTotal"] / executed if executed else 0.0,
+            "waitMax": self.stats["waitMax"]
+        }
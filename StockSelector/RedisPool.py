@@ -0,0 +1,206 @@
+import asyncio, time, weakref
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError as RedisConnectionError
+from django.conf import settings
+from StockSelector import Metrics
+
+REDIS = {
+    "host": "localhost",
+    "port": 6379,
+    "db": 0,
+    "maxConnections": 50,
+    "timeout": 5,
+    "healthCheckInterval": 30,
+    **getattr(settings, "STOCK_REDIS", {})
+}
+
+REDIS_SECONDS = Metrics.histogram("stonks_redis_command_seconds", "Redis round trips by command, pipelines as PIPELINE", ("command",))
+REDIS_ERRORS = Metrics.counter("stonks_redis_errors_total", "Redis round trips that raised, by command", ("command",))
+
+class MeteredPipeline(Pipeline):
+    async def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except Exception:
+            REDIS_ERRORS.inc("PIPELINE")
+            raise
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - start, "PIPELINE")
+
+class MeteredRedis(aioredis.Redis):
+    # every command and pipeline round trip lands in stonks_redis_command_seconds
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        command = args[0] if isinstance(args[0], str) else str(args[0])
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            REDIS_ERRORS.inc(command)
+            raise
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - start, command)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return MeteredPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class MeteredConnectionPool(aioredis.BlockingConnectionPool):
+    # callers queue for a free connection instead of opening new sockets, the wait is recorded
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = {"acquired": 0, "waited": 0, "errors": 0, "waitTotal": 0.0, "waitMax": 0.0}
+
+    async def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except RedisConnectionError:
+            self.stats["errors"] += 1
+            raise
+        waited = time.perf_counter() - start
+        self.stats["acquired"] += 1
+        self.stats["waitTotal"] += waited
+        if waited > 0.001:
+            self.stats["waited"] += 1
+        if waited > self.stats["waitMax"]:
+            self.stats["waitMax"] = waited
+        return connection
+
+class AutoBatcher():
+    # small commands issued in the same event loop tick go out as one pipeline round trip
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = []
+        self.flushing = None
+        self.tasks = set()
+        self.stats = {"commands": 0, "batches": 0, "largest": 0, "failed": 0}
+
+    def call(self, name, *args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._queue(name, args, kwargs, future)
+        return future
+
+    def send(self, name, *args, **kwargs):
+        # fire and forget: rides along with the next batch, failures are only counted
+        self._queue(name, args, kwargs, None)
+
+    def execute(self, *args):
+        return self.call("execute_command", *args)
+
+    def _queue(self, name, args, kwargs, future):
+        self.queue.append((name, args, kwargs, future))
+        if self.flushing is None:
+            self.flushing = asyncio.get_running_loop().call_soon(self._startFlush)
+
+    def _startFlush(self):
+        self.flushing = None
+        queue, self.queue = self.queue, []
+        if queue:
+            task = asyncio.create_task(self._flush(queue))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _flush(self, queue):
+        self.stats["commands"] += len(queue)
+        self.stats["batches"] += 1
+        self.stats["largest"] = max(self.stats["largest"], len(queue))
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for name, args, kwargs, _ in queue:
+                    getattr(pipe, name)(*args, **kwargs)
+                results = await pipe.execute(raise_on_error=False)
+        except Exception as err:
+            results = [err] * len(queue)
+        for (_, _, _, future), result in zip(queue, results):
+            if future is None:
+                if isinstance(result, Exception):
+                    self.stats["failed"] += 1
+                continue
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def get(self, key):
+        return await self.execute("GET", key)
+
+    async def mget(self, keys):
+        return await self.execute("MGET", *keys) if keys else []
+
+    async def setex(self, key, seconds, value):
+        return await self.execute("SETEX", key, seconds, value)
+
+class RedisPool():
+    # redis.asyncio connections belong to the loop that opened them, so one pool per loop;
+    # a worker process runs a single loop and therefore a single pool
+    _pools = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def instance(cls):
+        loop = asyncio.get_running_loop()
+        pool = cls._pools.get(loop)
+        if pool is None:
+            pool = cls._pools[loop] = cls(**REDIS)
+        return pool
+
+    @classmethod
+    def install(cls, client):
+        # use an already built client (a load test's FakeRedis) as this loop's pool
+        pool = cls.__new__(cls)
+        pool.pool = None
+        pool.client = client
+        pool.batch = AutoBatcher(client)
+        cls._pools[asyncio.get_running_loop()] = pool
+        return pool
+
+    def __init__(self, host, port, db=0, maxConnections=50, timeout=5, healthCheckInterval=30):
+        self.pool = MeteredConnectionPool(
+            max_connections=maxConnections,
+            timeout=timeout,
+            host=host,
+            port=port,
+            db=db,
+            health_check_interval=healthCheckInterval,
+            socket_keepalive=True
+        )
+        self.client = MeteredRedis(connection_pool=self.pool)
+        self.batch = AutoBatcher(self.client)
+
+    async def close(self):
+        await self.client.aclose()
+        if self.pool is not None:
+            await self.pool.disconnect()
+
+    def snapshot(self):
+        if self.pool is None:
+            return {"batch": dict(self.batch.stats)}
+        stats = self.pool.stats
+        return {
+            "maxConnections": self.pool.max_connections,
+            "created": len(self.pool._available_connections) + len(self.pool._in_use_connections),
+            "inUse": len(self.pool._in_use_connections),
+            "acquired": stats["acquired"],
+            "waited": stats["waited"],
+            "errors": stats["errors"],
+            "waitAvg": stats["waitTotal"] / stats["acquired"] if stats["acquired"] else 0.0,
+            "waitMax": stats["waitMax"],
+            "batch": dict(self.batch.stats)
+        }
+
+@Metrics.collector
+def _collect():
+    pools = [pool.snapshot() for pool in list(RedisPool._pools.values())]
+    inUse = Metrics.gauge("stonks_redis_pool_in_use", "Redis connections checked out of the pool")
+    waited = Metrics.counter("stonks_redis_pool_waited_total", "Connection checkouts that queued for more than 1 ms")
+    batched = Metrics.counter("stonks_redis_batched_commands_total", "Commands sent through the auto-batcher")
+    batches = Metrics.counter("stonks_redis_batches_total", "Auto-batcher pipeline round trips")
+    inUse.set(sum(pool.get("inUse", 0) for pool in pools))
+    waited.set(sum(pool.get("waited", 0) for pool in pools))
+    batched.set(sum(pool["batch"]["commands"] for pool in pools))
+    batches.set(sum(pool["batch"]["batches"] for pool in pools))
+
+def sharedRedis():
+    return RedisPool.instance().client
@@ -0,0 +1,134 @@
+import asyncio, glob, gzip, os, time, zlib
+import orjson
+from StockSelector.FinnhubFeed import FinnhubFeed
+from StockSelector.SymbolEngine import SymbolEngine
+from StockSelector.TapeRecorder import SEGMENT_INDEX
+
+def isTape(path):
+    # frame files only: not the segment index or a segment's .idx sidecar
+    name = os.path.basename(path)
+    return name.endswith((".jsonl", ".jsonl.gz")) and name != SEGMENT_INDEX
+
+def tapeFiles(paths):
+    # files, directories or globs; .gz files are read through gzip, everything in name order
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path) if isTape(name))
+        else:
+            matches = sorted(glob.glob(path))
+            files += [match for match in matches if isTape(match)] if matches else [path]
+    return files
+
+def readFrames(paths):
+    # one raw Finnhub websocket frame per line, exactly as it came off the socket
+    for path in tapeFiles(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+def frameTime(frame):
+    # newest trade time in the frame, seconds
+    try:
+        data = orjson.loads(frame)
+    except orjson.JSONDecodeError:
+        return None
+    times = [tr.get("t") for tr in data.get("data") or [] if isinstance(tr, dict) and isinstance(tr.get("t"), (int, float))]
+    return max(times) / 1000 if times else None
+
+def ownedBy(symbol, index, workers):
+    # crc32 rather than hash() so every process agrees without PYTHONHASHSEED
+    return workers <= 1 or zlib.crc32(symbol.encode()) % workers == index
+
+class SimClock():
+    # the feed's notion of now, driven by the trade times being replayed
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, now):
+        if now > self.now:
+            self.now = now
+
+class ReplayLayer():
+    # stands in for the channel layer: nobody is subscribed, bar closes go to onBars
+    def __init__(self, onBars=None):
+        self.onBars = onBars
+        self.sent = 0
+
+    async def group_add(self, group, channel):
+        return None
+
+    async def group_discard(self, group, channel):
+        return None
+
+    async def group_send(self, group, message):
+        self.sent += 1
+        if self.onBars is not None and message["type"] == "stock.bars":
+            self.onBars(message)
+
+class ReplayFeed(FinnhubFeed):
+    # FinnhubFeed with the socket swapped for a tape: frames go through the same _dispatch,
+    # _parseFrame, BarBuilder, _closeBucket and indicators, with time taken from the trades
+    def __init__(self, onBars=None, redis=None, store=None, symbols=None, index=0, workers=1):
+        self.simClock = SimClock()
+        super().__init__(url="replay://", channelLayer=ReplayLayer(onBars), persist=False, clock=self.simClock, coalesce=False)
+        self.redis = redis
+        self.store = store
+        self.symbols = set(symbols) if symbols else None
+        self.index = index
+        self.workers = workers
+
+    def _owns(self, symbol):
+        return (self.symbols is None or symbol in self.symbols) and ownedBy(symbol, self.index, self.workers)
+
+    def _parseFrame(self, msg):
+        trades = FinnhubFeed._parseFrame(msg)
+        if not trades:
+            return trades
+        newest = 0
+        for symbol, batch in trades.items():
+            if symbol not in self.engines and self._owns(symbol):
+                self.engines[symbol] = SymbolEngine(symbol, self.redis, store=self.store)
+            for trade in batch:
+                if trade[1] > newest:
+                    newest = trade[1]
+        self.simClock.advance(newest / 1000)
+        return trades
+
+    async def replay(self, frames, speed=0):
+        # speed 0 is as fast as possible, otherwise N x the recorded pace
+        start = time.perf_counter()
+        simStart = None
+        nextClose = 0
+        for frame in frames:
+            if speed:
+                at = frameTime(frame)
+                if at is not None:
+                    if simStart is None:
+                        simStart = at
+                    delay = (at - simStart) / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            await self._dispatch(frame)
+            now = self.simClock.now
+            if now >= nextClose:
+                # the once-a-second bucketTimer, on the simulated clock
+                await self.closeDue(now)
+                nextClose = int(now) + 1
+        # close whatever is still open at the end of the tape
+        await self.closeDue(self.simClock.now + 24 * 60 * 60)
+        elapsed = time.perf_counter() - start
+        return {
+            "frames": self.stats["messages"],
+            "ticks": self.stats["trades"],
+            "symbols": len(self.engines),
+            "events": self.channelLayer.sent,
+            "seconds": elapsed,
+            "ticksPerSec": self.stats["trades"] / elapsed if elapsed else 0.0
+        }
@@ -0,0 +1,140 @@
+import asyncio, contextlib, time, uuid, weakref
+import orjson
+from StockSelector.RedisPool import sharedRedis
+from StockSelector import Metrics
+
+# (fresh seconds, seconds a stale copy may still be served while it is refreshed)
+TTLS = {
+    "quote": (15, 120),
+    "timeseries": (6 * 60 * 60, 3 * 24 * 60 * 60),
+    "fundamentals": (24 * 60 * 60, 7 * 24 * 60 * 60),
+    "earnings": (6 * 60 * 60, 3 * 24 * 60 * 60)
+}
+
+CACHE_LOOKUPS = Metrics.counter("stonks_cache_lookups_total", "Response cache lookups by data class and result (hit, stale, miss)", ("class", "result"))
+CACHE_HIT_RATIO = Metrics.gauge("stonks_cache_hit_ratio", "Lookups answered from the cache, fresh or stale, by data class", ("class",))
+
+class ResponseCache():
+    # counters are shared by every per-loop instance so they describe the whole process
+    stats = {"hits": 0, "misses": 0, "stale": 0, "coalesced": 0, "errors": 0}
+    _caches = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def instance(cls):
+        loop = asyncio.get_running_loop()
+        cache = cls._caches.get(loop)
+        if cache is None:
+            cache = cls._caches[loop] = cls(sharedRedis())
+        return cache
+
+    def __init__(self, redis, ttls=None, lockTimeout=15, pollInterval=0.05, clock=time.time):
+        self.redis = redis
+        self.ttls = ttls or TTLS
+        self.lockTimeout = lockTimeout
+        self.pollInterval = pollInterval
+        self.clock = clock
+        self.inflight = {}
+        self.background = set()
+
+    @staticmethod
+    def _key(endpoint, symbol):
+        return f"cache|{endpoint}|{symbol}"
+
+    async def get(self, dataClass, endpoint, symbol, fetch):
+        key = self._key(endpoint, symbol)
+        envelope = await self._read(key)
+        if envelope is not None:
+            if envelope["fresh"] > self.clock():
+                self.stats["hits"] += 1
+                CACHE_LOOKUPS.inc(dataClass, "hit")
+            else:
+                self.stats["stale"] += 1
+                CACHE_LOOKUPS.inc(dataClass, "stale")
+                self._revalidate(key, dataClass, fetch)
+            return envelope["v"]
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.inc(dataClass, "miss")
+        return await self._singleFlight(key, dataClass, fetch)
+
+    async def _read(self, key):
+        try:
+            raw = await self.redis.get(key)
+            return orjson.loads(raw) if raw else None
+        except Exception:
+            return None
+
+    def _revalidate(self, key, dataClass, fetch):
+        if key in self.inflight:
+            return
+        task = asyncio.create_task(self._singleFlight(key, dataClass, fetch))
+        self.background.add(task)
+        task.add_done_callback(self._backgroundDone)
+
+    def _backgroundDone(self, task):
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+
+    async def _singleFlight(self, key, dataClass, fetch):
+        # callers in this process shield one detached fetch, so a caller that goes away (client
+        # disconnect, timeout) doesn't cancel it under the others; other processes wait on the Redis lock
+        task = self.inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.create_task(self._fetchLocked(key, dataClass, fetch))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._flightDone(key, done))
+        return await asyncio.shield(task)
+
+    def _flightDone(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # mark a failure retrieved, every caller may have gone
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetchLocked(self, key, dataClass, fetch):
+        lockKey = f"{key}|lock"
+        token = uuid.uuid4().hex
+        try:
+            locked = await self.redis.set(lockKey, token, nx=True, px=int(self.lockTimeout * 1000))
+        except Exception:
+            locked = True
+        if not locked:
+            before = await self._read(key)
+            deadline = self.clock() + self.lockTimeout
+            while self.clock() < deadline:
+                await asyncio.sleep(self.pollInterval)
+                envelope = await self._read(key)
+                if envelope is not None and (before is None or envelope["fresh"] != before["fresh"]):
+                    self.stats["coalesced"] += 1
+                    return envelope["v"]
+        try:
+            value = await fetch()
+            await self._store(key, dataClass, value)
+            return value
+        finally:
+            if locked:
+                with contextlib.suppress(Exception):
+                    if await self.redis.get(lockKey) in (token, token.encode()):
+                        await self.redis.delete(lockKey)
+
+    async def _store(self, key, dataClass, value):
+        fresh, stale = self.ttls[dataClass]
+        with contextlib.suppress(Exception):
+            await self.redis.set(key, orjson.dumps({"v": value, "fresh": self.clock() + fresh}), ex=fresh + stale)
+
+    @classmethod
+    def snapshot(cls):
+        lookups = cls.stats["hits"] + cls.stats["misses"] + cls.stats["stale"]
+        return {**cls.stats, "hitRatio": (cls.stats["hits"] + cls.stats["stale"]) / lookups if lookups else None}
+
+@Metrics.collector
+def _collect():
+    lookups = {}
+    for (dataClass, result), count in list(CACHE_LOOKUPS.values.items()):
+        served, total = lookups.get(dataClass, (0, 0))
+        lookups[dataClass] = (served + (count if result != "miss" else 0), total + count)
+    for dataClass, (served, total) in lookups.items():
+        CACHE_HIT_RATIO.set(served / total, dataClass)
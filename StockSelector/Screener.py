@@ -0,0 +1,347 @@
+import asyncio, re, time, weakref
+import numpy as np
+import orjson
+from django.conf import settings
+from StockSelector.BarStream import BUS_KEY, tail
+from StockSelector.PackedBars import unpackBars
+from StockSelector.OpeningPrices import watchedSymbols
+from StockSelector import Metrics
+
+SCREENER = {
+    "refresh": 30,
+    "batch": 500,
+    "limit": 50,
+    "maxLimit": 1000,
+    "follow": True,
+    **getattr(settings, "STOCK_SCREENER", {})
+}
+# Finnhub /stock/metric keys kept as screenable columns
+FUNDAMENTALS = {
+    "marketCap": "marketCapitalization",
+    "pe": "peTTM",
+    "beta": "beta",
+    "high52w": "52WeekHigh",
+    "low52w": "52WeekLow",
+    "return52w": "52WeekPriceReturnDaily",
+    "avgVolume10d": "10DayAverageTradingVolume",
+    "avgVolume3m": "3MonthAverageTradingVolume"
+}
+# reported in millions (dollars, shares), scaled on load so "marketCap > 1B" means what it says
+MILLIONS = {"marketCap", "avgVolume10d", "avgVolume3m"}
+SUFFIXES = {"k": 1e3, "m": 1e6, "b": 1e9, "t": 1e12}
+COMPARISONS = {
+    "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+    "=": np.equal, "==": np.equal, "!=": np.not_equal,
+    "below": np.less, "above": np.greater
+}
+ARITHMETIC = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+TOKEN = re.compile(r"\s*(?:(\d+(?:\.\d*)?|\.\d+)([kmbtKMBT](?![A-Za-z0-9_]))?|([A-Za-z_][A-Za-z0-9_]*)|(<=|>=|==|!=|[<>=()+\-*/]))")
+
+QUERY_SECONDS = Metrics.histogram("stonks_screener_query_seconds", "Time to evaluate one screener query over the snapshot")
+
+def _tokens(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Unexpected input at {text[pos:pos + 10]!r}")
+        number, suffix, word, op = match.groups()
+        if number is not None:
+            tokens.append(("num", float(number) * SUFFIXES.get((suffix or "").lower(), 1)))
+        elif word is not None:
+            lowered = word.lower()
+            if lowered in ("and", "or", "not", "above", "below"):
+                tokens.append(("op", lowered))
+            else:
+                tokens.append(("field", word))
+        else:
+            tokens.append(("op", op))
+        pos = match.end()
+    return tokens
+
+class QueryParser():
+    # or > and > not > comparison > + - > * / ; fields resolve against the snapshot's columns
+    def __init__(self, text, snapshot):
+        self.tokens = _tokens(text)
+        self.pos = 0
+        self.snapshot = snapshot
+        self.fields = []
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty query")
+        try:
+            mask = self._or()
+        except TypeError:
+            raise ValueError("and / or / not only combine comparisons")
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.tokens[self.pos][1]!r}")
+        if not isinstance(mask, np.ndarray) or mask.dtype != bool:
+            raise ValueError("Query must be a comparison, e.g. rsi14 < 30")
+        return mask
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _take(self, *ops):
+        kind, value = self._peek()
+        if kind == "op" and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def _or(self):
+        mask = self._and()
+        while self._take("or"):
+            mask = mask | self._and()
+        return mask
+
+    def _and(self):
+        mask = self._not()
+        while self._take("and"):
+            mask = mask & self._not()
+        return mask
+
+    def _not(self):
+        if self._take("not"):
+            return ~self._not()
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._sum()
+        op = self._take(*COMPARISONS)
+        if op is None:
+            return left
+        right = self._sum()
+        # NaN (no data yet) compares False for every operator
+        with np.errstate(invalid="ignore"):
+            return COMPARISONS[op](left, right)
+
+    def _sum(self):
+        value = self._product()
+        while True:
+            op = self._take("+", "-")
+            if op is None:
+                return value
+            value = ARITHMETIC[op](value, self._product())
+
+    def _product(self):
+        value = self._operand()
+        while True:
+            op = self._take("*", "/")
+            if op is None:
+                return value
+            with np.errstate(divide="ignore", invalid="ignore"):
+                value = ARITHMETIC[op](value, self._operand())
+
+    def _operand(self):
+        kind, value = self._peek()
+        self.pos += 1
+        if kind == "num":
+            return value
+        if kind == "field":
+            name = self.snapshot.field(value)
+            self.fields.append(name)
+            return self.snapshot.column(name)
+        if kind == "op" and value == "(":
+            inner = self._or()
+            if not self._take(")"):
+                raise ValueError("Missing )")
+            return inner
+        if kind == "op" and value == "-":
+            return -self._operand()
+        raise ValueError(f"Unexpected {value!r}" if kind else "Query ends early")
+
+class ScreenerSnapshot():
+    # One row per symbol and one float64 array per field, so a query is a handful of vectorized
+    # comparisons. Rows are updated in place by SymbolEngine as bars close and refreshed from
+    # Redis for symbols other workers stream; missing values are NaN.
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.symbols = []
+        self.rows = {}
+        self.columns = {}
+        self.names = {}
+        self.refreshedAt = 0.0
+        # one bus follower per event loop
+        self.followers = weakref.WeakKeyDictionary()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def field(self, name):
+        resolved = self.names.get(name.lower())
+        if resolved is None:
+            # "rsi" means rsi14 while only one period is tracked
+            periods = [full for lowered, full in self.names.items() if re.fullmatch(re.escape(name.lower()) + r"\d+", lowered)]
+            resolved = periods[0] if len(periods) == 1 else None
+        if resolved is None:
+            raise ValueError(f"Unknown field {name}, expected one of {sorted(self.columns)}")
+        return resolved
+
+    def column(self, name):
+        return self.columns[name][:len(self.symbols)]
+
+    def _row(self, symbol):
+        row = self.rows.get(symbol)
+        if row is not None:
+            return row
+        row = len(self.symbols)
+        if row == self.capacity:
+            self.capacity *= 2
+            for name, values in self.columns.items():
+                grown = np.full(self.capacity, np.nan)
+                grown[:row] = values[:row]
+                self.columns[name] = grown
+        self.symbols.append(symbol)
+        self.rows[symbol] = row
+        return row
+
+    def _columnFor(self, name):
+        values = self.columns.get(name)
+        if values is None:
+            values = self.columns[name] = np.full(self.capacity, np.nan)
+            self.names[name.lower()] = name
+        return values
+
+    def declare(self, names):
+        # known fields are queryable (all NaN) before the first value arrives
+        for name in names:
+            self._columnFor(name)
+
+    def value(self, symbol, name):
+        row = self.rows.get(symbol)
+        if row is None or name not in self.columns:
+            return np.nan
+        return self.columns[name][row]
+
+    def update(self, symbol, values):
+        row = self._row(symbol)
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                if value is not None:
+                    continue
+                value = np.nan
+            self._columnFor(name)[row] = value
+
+    def query(self, text, sort=None, order="desc", limit=None, fields=None):
+        start = time.perf_counter()
+        parser = QueryParser(text, self)
+        mask = parser.parse()
+        matched = np.flatnonzero(mask)
+        total = len(matched)
+        limit = self._limit(limit)
+        if sort is not None:
+            key = self.column(self.field(sort))[matched]
+            key = -key if order == "desc" else key
+            # symbols without a value sort last either way
+            key = np.where(np.isnan(key), np.inf, key)
+            if limit < len(matched):
+                top = np.argpartition(key, limit - 1)[:limit]
+                matched = matched[top[np.argsort(key[top], kind="stable")]]
+            else:
+                matched = matched[np.argsort(key, kind="stable")]
+        matched = matched[:limit]
+        names = list(dict.fromkeys([self.field(name) for name in (fields or ["price"])] + parser.fields + ([self.field(sort)] if sort else [])))
+        columns = {name: self.column(name)[matched] for name in names}
+        results = []
+        for idx, row in enumerate(matched.tolist()):
+            entry = {"symbol": self.symbols[row]}
+            for name in names:
+                value = columns[name][idx]
+                entry[name] = None if np.isnan(value) else float(value)
+            results.append(entry)
+        elapsed = time.perf_counter() - start
+        QUERY_SECONDS.observe(elapsed)
+        return {"universe": len(self.symbols), "count": total, "elapsedMs": elapsed * 1000, "results": results}
+
+    @staticmethod
+    def _limit(limit):
+        if limit is None:
+            return SCREENER["limit"]
+        if isinstance(limit, bool) or not isinstance(limit, (int, float, str)):
+            raise ValueError("limit must be a whole number")
+        try:
+            value = int(limit)
+        except ValueError:
+            raise ValueError("limit must be a whole number")
+        if value != float(limit) or not 1 <= value <= SCREENER["maxLimit"]:
+            raise ValueError(f"limit must be between 1 and {SCREENER['maxLimit']}")
+        return value
+
+    async def refresh(self, redis, symbols):
+        # pulls indicators, live prices and cached fundamentals for the whole universe, in MGET batches
+        batch = SCREENER["batch"]
+        for offset in range(0, len(symbols), batch):
+            chunk = symbols[offset:offset + batch]
+            keys = []
+            for symbol in chunk:
+                keys += [f"stock|{symbol}|indicators|1m", f"stock|{symbol}|latest", f"cache|metric|{symbol}"]
+            raw = await redis.mget(keys)
+            for idx, symbol in enumerate(chunk):
+                indicators, latest, metric = raw[idx * 3:idx * 3 + 3]
+                values = {}
+                if latest:
+                    values["price"] = orjson.loads(latest).get("price")
+                if indicators:
+                    indicators = orjson.loads(indicators)
+                    # a local close newer than what Redis holds is kept
+                    if not self.value(symbol, "ts") > indicators.get("ts", 0):
+                        values.update(indicators)
+                if metric:
+                    data = (orjson.loads(metric).get("v") or {}).get("metric") or {}
+                    for name, key in FUNDAMENTALS.items():
+                        value = data.get(key)
+                        if name in MILLIONS and isinstance(value, (int, float)) and not isinstance(value, bool):
+                            value *= 1e6
+                        values[name] = value
+                if values:
+                    self.update(symbol, values)
+            await asyncio.sleep(0)
+        self.refreshedAt = time.time()
+
+    def _applyBar(self, fields):
+        if fields.get(b"l") != b"1m" or b"i" not in fields:
+            return
+        symbol = fields[b"s"].decode()
+        indicators = orjson.loads(fields[b"i"])
+        # closes made by this process's own engines are already in
+        if self.value(symbol, "ts") >= indicators.get("ts", 0):
+            return
+        bar = unpackBars([fields[b"b"]])[0]
+        self.update(symbol, {**indicators, "price": float(bar["close"]), "volume1m": float(bar["volume"])})
+
+    async def follow(self, redis):
+        # rows from the bar bus as closes happen anywhere (shard workers included), between the
+        # periodic refreshes; after an error the XREAD resumes from the last entry it saw
+        streams = {BUS_KEY: "$"}
+        while True:
+            try:
+                async for _, _, fields in tail(redis, streams):
+                    self._applyBar(fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                Metrics.error("screener.follow", err)
+                await asyncio.sleep(1)
+
+    def ensureFollowing(self, redis):
+        loop = asyncio.get_running_loop()
+        task = self.followers.get(loop)
+        if task is None or task.done():
+            self.followers[loop] = asyncio.create_task(self.follow(redis))
+
+    async def ensureFresh(self, redis, universe=None):
+        if SCREENER["follow"]:
+            self.ensureFollowing(redis)
+        if time.time() - self.refreshedAt < SCREENER["refresh"]:
+            return
+        # concurrent queries keep using the current rows instead of stacking refreshes
+        self.refreshedAt = time.time()
+        symbols = list(dict.fromkeys(list(getattr(settings, "STOCK_UNIVERSE", [])) + (universe or await watchedSymbols(redis))))
+        await self.refresh(redis, symbols)
+
+SNAPSHOT = ScreenerSnapshot()
+SNAPSHOT.declare(["price", *FUNDAMENTALS])
@@ -0,0 +1,137 @@
+import asyncio, time, weakref
+from collections import deque
+from django.conf import settings
+from StockSelector import Metrics
+
+SEND_QUEUE = {
+    "maxDepth": 256,
+    "maxLag": 5,
+    "grace": 10,
+    **getattr(settings, "STOCK_SEND_QUEUE", {})
+}
+
+class SendQueue():
+    # Outbound frames for one websocket, drained by its own task so a slow client never blocks
+    # the consumer's event handling. Keyed frames (latest price per symbol) replace the queued
+    # copy; unkeyed frames (bars, replies) are always delivered. A client that stays over
+    # maxDepth or maxLag for `grace` seconds is handed to onOverflow, 4x maxDepth is immediate.
+    queues = weakref.WeakSet()
+
+    def __init__(self, send, onOverflow=None, name=None, maxDepth=None, maxLag=None, grace=None, clock=time.monotonic):
+        self.send = send
+        self.onOverflow = onOverflow
+        self.name = name
+        self.maxDepth = maxDepth or SEND_QUEUE["maxDepth"]
+        self.maxLag = maxLag or SEND_QUEUE["maxLag"]
+        self.grace = SEND_QUEUE["grace"] if grace is None else grace
+        self.clock = clock
+        self.frames = deque()
+        self.latest = {}
+        self.ready = asyncio.Event()
+        self.overSince = None
+        self.overflowed = False
+        self.stats = {"queued": 0, "sent": 0, "conflated": 0, "maxDepth": 0, "lagLast": 0.0, "lagMax": 0.0}
+        SendQueue.queues.add(self)
+
+    def depth(self):
+        return len(self.frames) + len(self.latest)
+
+    def put(self, payload, key=None):
+        if self.overflowed:
+            return
+        now = self.clock()
+        self.stats["queued"] += 1
+        if key is None:
+            self.frames.append((payload, now))
+        elif key in self.latest:
+            # keep the first enqueue time so lag reports how stale the client really is
+            self.latest[key] = (payload, self.latest[key][1])
+            self.stats["conflated"] += 1
+        else:
+            self.latest[key] = (payload, now)
+        depth = self.depth()
+        if depth > self.stats["maxDepth"]:
+            self.stats["maxDepth"] = depth
+        self.ready.set()
+        self.check(now)
+
+    def lag(self, now=None):
+        now = self.clock() if now is None else now
+        oldest = None
+        if self.frames:
+            oldest = self.frames[0][1]
+        if self.latest:
+            first = next(iter(self.latest.values()))[1]
+            oldest = first if oldest is None else min(oldest, first)
+        return 0.0 if oldest is None else now - oldest
+
+    def check(self, now=None):
+        now = self.clock() if now is None else now
+        depth = self.depth()
+        if depth > 4 * self.maxDepth:
+            self._overflow()
+            return
+        if depth > self.maxDepth or self.lag(now) > self.maxLag:
+            if self.overSince is None:
+                self.overSince = now
+            elif now - self.overSince >= self.grace:
+                self._overflow()
+        else:
+            self.overSince = None
+
+    def _overflow(self):
+        if self.overflowed:
+            return
+        self.overflowed = True
+        self.frames.clear()
+        self.latest.clear()
+        if self.onOverflow is not None:
+            self.overflowTask = asyncio.create_task(self.onOverflow())
+
+    def _next(self):
+        if self.frames and self.latest:
+            key, (payload, queued) = next(iter(self.latest.items()))
+            if self.frames[0][1] <= queued:
+                return self.frames.popleft()
+            del self.latest[key]
+            return payload, queued
+        if self.frames:
+            return self.frames.popleft()
+        key = next(iter(self.latest))
+        return self.latest.pop(key)
+
+    async def run(self):
+        while not self.overflowed:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.depth() and not self.overflowed:
+                payload, queued = self._next()
+                if isinstance(payload, bytes):
+                    await self.send(bytes_data=payload)
+                else:
+                    await self.send(text_data=payload)
+                lag = self.clock() - queued
+                self.stats["sent"] += 1
+                self.stats["lagLast"] = lag
+                if lag > self.stats["lagMax"]:
+                    self.stats["lagMax"] = lag
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "depth": self.depth(),
+            "lag": self.lag(),
+            "overBudget": self.overSince is not None,
+            **self.stats
+        }
+
+    @classmethod
+    def snapshotAll(cls):
+        return [queue.snapshot() for queue in list(cls.queues)]
+
+@Metrics.collector
+def _collect():
+    queues = SendQueue.snapshotAll()
+    Metrics.gauge("stonks_ws_connections", "Open websockets with an outbound queue").set(len(queues))
+    Metrics.gauge("stonks_ws_queue_depth", "Frames waiting across every outbound queue").set(sum(q["depth"] for q in queues))
+    Metrics.gauge("stonks_ws_queue_lag_max_seconds", "Age of the oldest unsent frame on any connection").set(max((q["lag"] for q in queues), default=0.0))
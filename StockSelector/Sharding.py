@@ -0,0 +1,198 @@
+import asyncio, contextlib, hashlib, os, socket, time, uuid, weakref
+import orjson
+from channels.layers import get_channel_layer
+from django.conf import settings
+from StockSelector.FinnhubFeed import FinnhubFeed, groupName
+from StockSelector.RedisPool import sharedRedis
+from StockSelector import Metrics
+
+SHARDS = {
+    "enabled": False,
+    "heartbeat": 2,
+    "ttl": 6,
+    "poll": 1,
+    **getattr(settings, "STOCK_SHARDS", {})
+}
+WORKERS_KEY = "stock|shards|workers"
+CLIENTS_KEY = "stock|shards|clients"
+
+SHARD_MOVES = Metrics.counter("stonks_shard_moves_total", "Symbols taken on or handed off by this shard worker", ("direction",))
+SHARD_SYMBOLS = Metrics.gauge("stonks_shard_symbols", "Symbols owned by this shard worker")
+
+def demandKey(clientId):
+    return f"stock|shards|demand|{clientId}"
+
+def _weight(worker, symbol):
+    return int.from_bytes(hashlib.blake2b(f"{worker}|{symbol}".encode(), digest_size=8).digest(), "big")
+
+def owner(symbol, workers):
+    # rendezvous hashing: a worker joining or leaving only moves the symbols it wins or held
+    return max(workers, key=lambda worker: _weight(worker, symbol)) if workers else None
+
+def _decoded(values):
+    return [value.decode() if isinstance(value, bytes) else value for value in values]
+
+async def aliveMembers(redis, key):
+    await redis.zremrangebyscore(key, "-inf", time.time())
+    return sorted(_decoded(await redis.zrange(key, 0, -1)))
+
+async def demandedSymbols(redis):
+    clients = await aliveMembers(redis, CLIENTS_KEY)
+    if not clients:
+        return set()
+    return set(_decoded(await redis.sunion([demandKey(client) for client in clients])))
+
+def liveFeed():
+    # what consumers join: the in-process feed, or a ShardClient when shard workers compute bars
+    return ShardClient.instance() if SHARDS["enabled"] else FinnhubFeed.instance()
+
+class ShardClient():
+    # The web process side of shard mode. Consumers still join the symbol's channel layer group,
+    # the symbol itself is only advertised in this process's demand set, which the owning shard
+    # worker picks up; its trades and bars then arrive through the Redis channel layer.
+    _clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def instance(cls):
+        loop = asyncio.get_running_loop()
+        client = cls._clients.get(loop)
+        if client is None:
+            client = cls._clients[loop] = cls()
+        return client
+
+    def __init__(self, redis=None, channelLayer=None):
+        self.redis = redis or sharedRedis()
+        self.channelLayer = channelLayer or get_channel_layer()
+        self.clientId = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.refs = {}
+        self.heartbeatTask = None
+
+    async def join(self, symbol, channelName):
+        await self.channelLayer.group_add(groupName(symbol), channelName)
+        count = self.refs.get(symbol, 0)
+        self.refs[symbol] = count + 1
+        if count == 0:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                await pipe.sadd(demandKey(self.clientId), symbol)
+                await pipe.expire(demandKey(self.clientId), SHARDS["ttl"])
+                await pipe.zadd(CLIENTS_KEY, {self.clientId: time.time() + SHARDS["ttl"]})
+                await pipe.execute()
+        if self.heartbeatTask is None or self.heartbeatTask.done():
+            self.heartbeatTask = asyncio.create_task(self.heartbeat())
+
+    async def leave(self, symbol, channelName):
+        with contextlib.suppress(Exception):
+            await self.channelLayer.group_discard(groupName(symbol), channelName)
+        count = self.refs.get(symbol, 0)
+        if count > 1:
+            self.refs[symbol] = count - 1
+            return
+        if count == 0:
+            return
+        del self.refs[symbol]
+        await self.redis.srem(demandKey(self.clientId), symbol)
+
+    async def indicators(self, symbols):
+        if not symbols:
+            return {}
+        values = await self.redis.mget([f"stock|{symbol}|indicators|1m" for symbol in symbols])
+        return {symbol: orjson.loads(value) for symbol, value in zip(symbols, values) if value}
+
+    async def _heartbeat(self):
+        # the whole set is rewritten so a Redis restart or an expired key heals on the next beat
+        key = demandKey(self.clientId)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await pipe.delete(key)
+            if self.refs:
+                await pipe.sadd(key, *self.refs)
+            await pipe.expire(key, SHARDS["ttl"])
+            await pipe.zadd(CLIENTS_KEY, {self.clientId: time.time() + SHARDS["ttl"]})
+            await pipe.execute()
+
+    async def heartbeat(self):
+        while self.refs:
+            await asyncio.sleep(SHARDS["heartbeat"])
+            try:
+                await self._heartbeat()
+            except Exception as err:
+                Metrics.error("shards.clientHeartbeat", err)
+
+class ShardWorker():
+    # Owns the symbols that rendezvous-hash to it among the live workers: one FinnhubFeed with
+    # its own upstream subscription, bar builders and indicators, publishing to the channel layer
+    # exactly like the single-process feed. Membership and demand are re-read every poll, so
+    # symbols move within about a heartbeat TTL when a worker joins, leaves or dies.
+    def __init__(self, workerId=None, redis=None, feed=None):
+        self.workerId = workerId or f"{socket.gethostname()}-{os.getpid()}"
+        self.redis = redis or sharedRedis()
+        self.feed = feed or FinnhubFeed.instance()
+        self.owned = set()
+        self.workers = []
+        self.stopping = False
+
+    async def _beat(self):
+        await self.redis.zadd(WORKERS_KEY, {self.workerId: time.time() + SHARDS["ttl"]})
+
+    async def rebalance(self):
+        await self._beat()
+        self.workers = await aliveMembers(self.redis, WORKERS_KEY)
+        if self.workerId not in self.workers:
+            self.workers.append(self.workerId)
+        demand = await demandedSymbols(self.redis)
+        mine = {symbol for symbol in demand if owner(symbol, self.workers) == self.workerId}
+        added, removed = mine - self.owned, self.owned - mine
+        for symbol in removed:
+            await self.feed.release(symbol)
+            self.owned.discard(symbol)
+        for symbol in added:
+            try:
+                await self.feed.acquire(symbol)
+                self.owned.add(symbol)
+            except Exception as err:
+                Metrics.error("shards.acquire", err, symbol)
+        SHARD_MOVES.inc("in", amount=len(added))
+        SHARD_MOVES.inc("out", amount=len(removed))
+        SHARD_SYMBOLS.set(len(self.owned))
+        return added, removed
+
+    async def run(self):
+        try:
+            while not self.stopping:
+                try:
+                    await self.rebalance()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:
+                    Metrics.error("shards.rebalance", err)
+                await asyncio.sleep(SHARDS["poll"])
+        finally:
+            await self.leave()
+
+    async def leave(self):
+        # deregister first so the others take over at their next poll instead of after the TTL
+        with contextlib.suppress(Exception):
+            await self.redis.zrem(WORKERS_KEY, self.workerId)
+        for symbol in list(self.owned):
+            with contextlib.suppress(Exception):
+                await self.feed.release(symbol)
+        self.owned.clear()
+        await self.feed.close()
+
+    def snapshot(self):
+        return {"worker": self.workerId, "workers": self.workers, "owned": len(self.owned), "feed": dict(self.feed.stats)}
+
+async def shardStatus(redis):
+    workers = await aliveMembers(redis, WORKERS_KEY)
+    demand = await demandedSymbols(redis)
+    counts = {worker: 0 for worker in workers}
+    for symbol in demand:
+        worker = owner(symbol, workers)
+        if worker is not None:
+            counts[worker] += 1
+    return {
+        "enabled": SHARDS["enabled"],
+        "workers": counts,
+        "clients": await aliveMembers(redis, CLIENTS_KEY),
+        "symbols": len(demand),
+        "unowned": len(demand) if not workers else 0
+    }
@@ -1,17 +1,52 @@
 import contextlib
-from functools import partial
 from channels.generic.websocket import AsyncWebsocketConsumer
-import os, json, asyncio, aiohttp, datetime
-import websockets
-import finnhub
+import os, asyncio, time
 import orjson
-from redis import asyncio as aioredis
 from dotenv import load_dotenv
-from StockSelector.Technicals.RollingSMA import RollingSMA
-from StockSelector.Technicals.StreamingEMA import StreamingEMA
+from StockSelector.Sharding import liveFeed
+from StockSelector.RedisPool import RedisPool
+from StockSelector.OpeningPrices import OpeningPrices, openKey, latestKey, liveFrame
+from StockSelector.SendQueue import SendQueue
+from StockSelector.PackedBars import SNAPSHOT_BARS, COLUMNS, readBars, readSince, barsToDicts, barsToColumns
+from StockSelector.BarStream import barKey
+from StockSelector.SymbolEngine import BAR_INTERVALS
+from StockSelector.BarStore import BarStore, STORE_INTERVALS
+from StockSelector.MarketData import validSymbol
+from StockSelector import Metrics
 
 load_dotenv('./content.env')
 FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
+HISTORY_MAX = 10000
+# channel layer events from the shared feed and their handlers
+FEED_EVENTS = {
+    "stock.trades": "stock_trades",
+    "stock.quote": "stock_quote",
+    "stock.bars": "stock_bars"
+}
+
+LIVE_PUBLISH_SECONDS = Metrics.histogram("stonks_live_publish_seconds", "Time to publish live prices to a client, per tick or per coalesced flush", ("mode",))
+ACTION_SECONDS = Metrics.histogram("stonks_ws_action_seconds", "Time to answer a websocket request", ("action",))
+SLOW_CLIENTS = Metrics.counter("stonks_ws_slow_clients_total", "Websockets closed for falling too far behind", ("consumer",))
+REQUEST_FAILED = "Request failed"
+
+def _wholeNumber(data, name, default=None, low=None, high=None):
+    # a whole number from a client frame within [low, high]; an absent optional one stays None
+    value = data.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{name} must be a whole number")
+    try:
+        number = int(value)
+        whole = number == float(value)
+    except (ValueError, OverflowError):
+        whole = False
+    if not whole:
+        raise ValueError(f"{name} must be a whole number")
+    if (low is not None and number < low) or (high is not None and number > high):
+        bounds = f"between {low} and {high}" if high is not None else f"at least {low}"
+        raise ValueError(f"{name} must be {bounds}")
+    return number
 
 class StockState(AsyncWebsocketConsumer):
     async def connect(self):
@@ -19,269 +54,211 @@ class StockState(AsyncWebsocketConsumer):
         if not FINNHUB_API_KEY:
             await self.close(code=4001)
             return None
-        self.redis = aioredis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-        self.p_latest = f"stock|{self.stockTick}|latest"
-        self.p_open = f"stock|{self.stockTick}|open|{datetime.date.today():%Y-%m-%d}"
-        self.p_bars = f"stock|{self.stockTick}|bars|5m"
-        self.p_bars1m = f"stock|{self.stockTick}|bars|1m"
+        if not validSymbol(self.stockTick):
+            await self.close(code=4004)
+            return None
+        pool = RedisPool.instance()
+        self.redis = pool.client
+        self.batch = pool.batch
+        self.p_latest = latestKey(self.stockTick)
+        self.p_open = openKey(self.stockTick)
+        self.p_bars = barKey(self.stockTick, "5m")
+        self.p_bars1m = barKey(self.stockTick, "1m")
+        self.p_snapshot = f"stock|{self.stockTick}|candles|1m|snapshot"
         self.p_ind = f"stock|{self.stockTick}|indicators|1m"
         
-        self.ind_periods = {
-            "sma": 20,
-            "ema": 20,
-            "rsi": 14,
-            "macd": 12
-        }
-        self.sma = RollingSMA(self.ind_periods['sma'])
-        self.ema = StreamingEMA(self.ind_periods['ema'], 2)
-        
-        self.current1mBucketData = {
-            'start': None,
-            'high': None,
-            'low': None,
-            'open': None,
-            'bucketVol': 0
-        }
-        
-        self.current5mBucketData = {
-            'start': None,
-            'high': None,
-            'low': None,
-            'open': None,
-            'bucketVol': 0
-        }
-        
         self.updatedPrice = None
         self.currentPrice = None
         
         await self.accept()
+        # everything to the client goes through the outbox, a slow socket only delays itself
+        self.outbox = SendQueue(self.send, self._overBudget, name=f"stock:{self.stockTick}")
+        self.sendTask = asyncio.create_task(self.outbox.run())
         
         self.openingPrice = await self._getOpeningPrice()
         
-        await self._getRedisSeed()
-        
-        self.keep_streaming = True
-        self.stream_task = asyncio.create_task(self.priceStream())
-        
-        self.priceUpdateTask = asyncio.create_task(self.updatePricePerMinute())
+        self.feed = liveFeed()
+        await self.feed.join(self.stockTick, self.channel_name)
         
     async def disconnect(self, close_code):
-        self.keep_streaming = False
-        if hasattr(self, 'stream_task'):
-            try:
-                self.stream_task.cancel()
-                with contextlib.suppress(Exception):
-                    await self.stream_task
-            except Exception as err:
-                print("Error cancelling stream task:", err)
-        
-        if hasattr(self, 'finnhubSocket'):
+        if hasattr(self, 'feed'):
             try:
-                with contextlib.suppress(Exception):
-                    await self._ws_unsubscribe(self.stockTick)
-                    await self.finnhubSocket.close()
+                await self.feed.leave(self.stockTick, self.channel_name)
             except Exception as e:
-                print("Error closing websocket:", e)
-        
-        if hasattr(self, 'priceUpdateTask'):
-            try:
-                self.priceUpdateTask.cancel()
-                with contextlib.suppress(Exception):
-                    await self.priceUpdateTask
-            except:
-                print("Error in cancelling minute price updation.")
+                Metrics.error("stock.leave", e, self.stockTick)
         
-        with contextlib.suppress(Exception):
-            close = getattr(self.redis, "aclose", None)
-            if callable(close):
-                await close()
-            else:
-                self.redis.close()
-                connPool = getattr(self.redis, "connection_pool", None)
-                if connPool and hasattr(connPool, "disconnect"):
-                    connPool.disconnect()
+        task = getattr(self, 'sendTask', None)
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(BaseException):
+                await task
+
+    async def dispatch(self, message):
+        handler = FEED_EVENTS.get(message["type"])
+        if handler is None:
+            return await super().dispatch(message)
+        # feed events never touch the database, so skip channels' per-message
+        # close_old_connections, a thread hop that serialises every tick
+        await getattr(self, handler)(message)
+
+    async def _overBudget(self):
+        SLOW_CLIENTS.inc("stock")
+        Metrics.logger.info("Closing slow client for %s: %s", self.stockTick, self.outbox.snapshot())
+        await self.close(code=4008)
                    
     async def receive(self, text_data=None, bytes_data=None):
         if not text_data:
             return
         try:
-            data = json.loads(text_data)
-        except Exception as e:
+            data = orjson.loads(text_data)
+        except orjson.JSONDecodeError:
             return
-        if data.get("action") == "get_price":
-            liveData = await self.redis.get(self.p_latest)
-            if liveData:
-                await self.send(liveData)
-            elif data.get("action") == "get_1mcandles":
-                candleData = await self.redis.lindex(self.p_bars1m, 0)
-                if candleData:
-                    await self.send(json.dumps({
-                        "type": "hist_minute_candle",
-                        "data": json.loads(candleData),
-                        "stock": self.stockTick,
-                        "summary": "Latest 1m stock candle"
-                    }))    
-            elif data.get("action") == "get_allcandles":
-                length = data.get("count", 100)
-                candles = await self.redis.lrange(self.p_bars1m, 0, length-1)
-                candleData = []
-                for candle in candles:
-                    try:
-                        candleData.append(json.loads(candle))
-                    except Exception:
-                        continue
-                await self.send(json.dumps({
-                    "type": "history_candles",
-                    "data": candleData,
-                    "length": len(candleData)
-                }))
-                
-    async def _getOpeningPrice(self):
-        cacheData = await self.redis.get(self.p_open)
-        if cacheData is not None and float(cacheData) > float(0):
-            try:
-                return float(cacheData)
-            except Exception as e:
-                pass
-        
-        url = f'https://finnhub.io/api/v1/quote?symbol={self.stockTick}&token={FINNHUB_API_KEY}'
-        params = {'symbol': self.stockTick, 'token': FINNHUB_API_KEY}
-        timeout = aiohttp.ClientTimeout()
-        opening = 0
-        try:
-            async with aiohttp.ClientSession(timeout=timeout) as sess:
-                async with sess.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        opening = data.get('pc', 0) or data.get('o', 0)
-        except (Exception, 
-                finnhub.FinnhubAPIException,
-                finnhub.FinnhubRequestException):
-            opening = 0
-        
-        try:
-            openingF = float(opening)
-        except Exception as e:
-            openingF = 0
-        await self.redis.setex(self.p_open, 24 * 60 * 60, openingF)
-        return openingF
-    
-    async def _getRedisSeed(self):
+        if not isinstance(data, dict):
+            return
+        action = data.get("action")
+        handler = self.actions.get(action)
+        if handler is None:
+            return
+        start = time.perf_counter()
         try:
-            count = max(self.ind_periods['sma'], self.ind_periods['ema']) + 10
-            candles = await self.redis.lrange(self.p_bars, 0, count)
-            priceQueue = []
-            for candle in candles:
-                try:
-                    cObj = json.loads(candle)
-                    priceQueue.append(cObj['close'])
-                except Exception as e:
-                    continue
-            
-            if priceQueue:
-                self.sma.seed(priceQueue)
-                self.ema.seed(priceQueue[-1])
+            await getattr(self, handler)(data)
+            ACTION_SECONDS.observe(time.perf_counter() - start, action)
         except Exception as err:
-            print("This is breaking")
-            print(err)
-        
-    async def _ws_unsubscribe(self, symbol):
-        await self.finnhubSocket.send(json.dumps({
-            "type": "unsubscribe",
-            "symbol": symbol
-        }))
-    
-    async def _ws_subscribe(self, symbol):
-        await self.finnhubSocket.send(json.dumps({
-            "type": "subscribe",
-            "symbol": symbol
-        }))
-    
-    @staticmethod
-    def _startBucket(time, intervals):
-        s = time // 1000
-        return s // intervals * intervals
-    
-    async def _closeBucket(self):
-        if self.currentBucketStart is None or self.currentBucketClose is None:
-            return 
-        candle = {'ts': int(self.currentBucketStart), 'close': float(self.currentBucketClose)}
-        
-        async with self.redis.pipeline() as pipe:
-            await pipe.lpush(self.p_bars, orjson.dumps(candle).decode())
-            await pipe.ltrim(self.p_bars, 0, 499)
-            await pipe.execute()
-        
-        smaValue = self.sma.accumulate(candle['close'])
-        emaValue = self.ema.update(candle['close'])
-        
-        await self.redis.set(
-            self.p_ind, 
-            orjson.dumps({
-                "ts": candle['ts'],
-                f"sma{self.ind_periods['sma']}": smaValue,
-                f"ema{self.ind_periods['ema']}": emaValue
-            }).decode(),
-        )
+            Metrics.error("stock.receive", err, action, self.stockTick)
+            # validation messages are written for the client, anything else stays in the logs
+            message = str(err) if isinstance(err, ValueError) else REQUEST_FAILED
+            self.outbox.put(orjson.dumps({"type": "error", "action": action, "error": message}).decode())
 
-    async def _livePublish(self, price):
-        op = self.openingPrice or 0
-        if op:
-            pchange = (price - op) / op * 100
-            delta = price - op
+    actions = {
+        "get_price": "_sendPrice",
+        "get_1mcandles": "_sendMinuteCandle",
+        "get_allcandles": "_sendCandles",
+        "get_history": "_sendHistory",
+        "resume": "_sendResume",
+        "get_publish_stats": "_sendPublishStats"
+    }
+
+    async def _sendPublishStats(self, data):
+        coalescer = getattr(self.feed, "coalescer", None)
+        self.outbox.put(orjson.dumps({
+            "type": "publish_stats",
+            "stock": self.stockTick,
+            # ticks are coalesced once per symbol by the feed, None when it runs elsewhere or uncoalesced
+            "data": coalescer.stats() if coalescer is not None else None,
+            "queue": self.outbox.snapshot()
+        }).decode())
+
+    async def _sendPrice(self, data):
+        liveData = await self.batch.get(self.p_latest)
+        if liveData:
+            # the feed may not know today's open (a shard worker has no consumers), this one does
+            self.outbox.put(orjson.dumps(self._liveFrame(self.stockTick, orjson.loads(liveData)["price"])).decode())
+
+    async def _sendMinuteCandle(self, data):
+        candles = await readBars(self.redis, self.p_bars1m, count=1)
+        if len(candles):
+            self.outbox.put(orjson.dumps({
+                "type": "hist_minute_candle",
+                "data": barsToDicts(candles)[0],
+                "stock": self.stockTick,
+                "summary": "Latest 1m stock candle"
+            }).decode())
+
+    async def _sendCandles(self, data):
+        length = _wholeNumber(data, "count", SNAPSHOT_BARS, 1, HISTORY_MAX)
+        start, end = _wholeNumber(data, "from", low=0), _wholeNumber(data, "to", low=0)
+        if data.get("format") == "binary":
+            # raw little-endian records, 48 bytes each, oldest first
+            candles = await readBars(self.redis, self.p_bars1m, start, end, length)
+            self.outbox.put(candles.tobytes())
+            return
+        if start is None and end is None and length == SNAPSHOT_BARS:
+            snapshot = await self.batch.get(self.p_snapshot)
+            if snapshot:
+                self.outbox.put(snapshot.decode())
+                return
+        candles = await readBars(self.redis, self.p_bars1m, start, end, length)
+        candleData = barsToDicts(candles[::-1])
+        self.outbox.put(orjson.dumps({
+            "type": "history_candles",
+            "data": candleData,
+            "length": len(candleData)
+        }).decode())
+
+    async def _sendHistory(self, data):
+        symbol = data.get("symbol") or self.stockTick
+        interval = data.get("interval", "1m")
+        start, end = _wholeNumber(data, "from", low=0), _wholeNumber(data, "to", low=0)
+        fields = data.get("fields") or list(COLUMNS)
+        if not validSymbol(symbol):
+            raise ValueError("Invalid symbol")
+        if not isinstance(fields, list) or any(field not in COLUMNS for field in fields):
+            raise ValueError(f"fields must be a subset of {list(COLUMNS)}")
+        count = min(_wholeNumber(data, "count", low=0) or HISTORY_MAX, HISTORY_MAX)
+        if interval in BAR_INTERVALS:
+            candles = await readBars(self.redis, barKey(symbol, interval), start, end, count)
+        elif interval in STORE_INTERVALS:
+            # daily and longer bars come from the local store
+            candles = BarStore.default().read(symbol, interval, start, end)[-count:]
         else:
-            pchange = 0
-            delta = 0
-        
-        live = {
-            "symbol": self.stockTick,
-            "price": float(price),
-            "pchange": float(pchange),
-            "sign": "+" if pchange >= 0 else "-",
-            "delta": float(delta),
-        }
+            raise ValueError(f"Unknown interval {interval}")
+        self.outbox.put(orjson.dumps({
+            "type": "history",
+            "stock": symbol,
+            "interval": interval,
+            "length": len(candles),
+            **barsToColumns(candles, fields)
+        }, option=orjson.OPT_SERIALIZE_NUMPY).decode())
 
-        payload = orjson.dumps(live).decode()
-        await self.redis.setex(self.p_latest, 60, payload)
-        await self.send(payload)
-    
-    async def priceStream(self):
-        backoff = 1
-        maxBackoff = 30
-        while self.keep_streaming:
-            try:
-                async with websockets.connect(
-                    f"wss://ws.finnhub.io?token={FINNHUB_API_KEY}"
-                ) as ws:
-                    self.finnhubSocket = ws
-                    await self._ws_subscribe(self.stockTick)
-                    backoff = 1
-                    async for msg in ws:
-                        try:
-                            data = orjson.loads(msg)
-                        except Exception:
-                            continue
-                        
-                        callType = data.get("type")
-                        if callType == "trade":
-                            for tr in data.get("data", []):
-                                if tr.get("s") != self.stockTick:
-                                    continue
-                                try:
-                                    price = float(tr.get("p"))
-                                    time = int(tr.get("t"))
-                                except Exception:
-                                    continue
-                                await self._livePublish(price)
-                        elif callType == "ping":
-                            pass
-            except asyncio.CancelledError:
-                break
-            except (websockets.exceptions.ConnectionClosed,
-                    websockets.exceptions.ConnectionClosedError,
-                    websockets.exceptions.ConnectionClosedOK):
-                await asyncio.sleep(backoff)
-                backoff = min(backoff * 2, maxBackoff)
-            except Exception as e:
-                await asyncio.sleep(backoff)
-                backoff = min(backoff * 2, maxBackoff)
+    async def _sendResume(self, data):
+        # a reconnecting client sends the ts of the last bar it has and gets only the ones after it
+        interval = data.get("interval", "1m")
+        if interval not in BAR_INTERVALS:
+            raise ValueError(f"Unknown interval {interval}")
+        if data.get("since") is None:
+            raise ValueError("since is required")
+        since = _wholeNumber(data, "since", low=0)
+        candles = await readSince(self.redis, barKey(self.stockTick, interval), since, HISTORY_MAX)
+        self.outbox.put(orjson.dumps({
+            "type": "resume",
+            "stock": self.stockTick,
+            "interval": interval,
+            "since": since,
+            "data": barsToDicts(candles),
+            "length": len(candles)
+        }).decode())
+
+    async def _getOpeningPrice(self):
+        prices = await OpeningPrices.get(self.redis, [self.stockTick])
+        return prices.get(self.stockTick, 0.0)
+
+    def _liveFrame(self, symbol, price):
+        return liveFrame(symbol, price, self.openingPrice)
+
+    async def _livePublish(self, price):
+        # stock|SYM|latest is written once per symbol by the feed, consumers only fan out
+        start = time.perf_counter()
+        self.outbox.put(orjson.dumps(self._liveFrame(self.stockTick, price)).decode(), key=self.stockTick)
+        LIVE_PUBLISH_SECONDS.observe(time.perf_counter() - start, "tick")
+
+    async def stock_trades(self, event):
+        # only sent when the feed does not coalesce
+        for price, ts, vol in event.get("trades", []):
+            await self._livePublish(price)
+
+    async def stock_quote(self, event):
+        frame = event["frame"]
+        if not event.get("opened") and self.openingPrice:
+            # the feed may not know today's open (a shard worker has no consumers), this one does
+            quote = dict(event["quote"])
+            quote.update(self._liveFrame(self.stockTick, quote["price"]))
+            frame = orjson.dumps(quote).decode()
+        self.outbox.put(frame, key=self.stockTick)
+
+    async def stock_bars(self, event):
+        self.outbox.put(orjson.dumps({
+            "type": "bar_close",
+            "stock": self.stockTick,
+            "bars": event.get("bars", []),
+            "indicators": event.get("indicators")
+        }).decode())
@@ -0,0 +1,88 @@
+import asyncio, datetime, random
+from aiohttp import web
+
+class StubMarketDataServer():
+    def __init__(self, host='127.0.0.1', port=8766, latency=0.2, days=100):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.days = days
+        self.runner = None
+        self.requests = {}
+
+    @property
+    def finnhubUrl(self):
+        return f"http://{self.host}:{self.port}/api/v1"
+
+    @property
+    def alphavantageUrl(self):
+        return f"http://{self.host}:{self.port}/query"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/query', self._timeSeries)
+        app.router.add_get('/api/v1/quote', self._quote)
+        app.router.add_get('/api/v1/stock/metric', self._metric)
+        app.router.add_get('/api/v1/stock/profile2', self._profile)
+        app.router.add_get('/api/v1/calendar/earnings', self._earnings)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def _respond(self, request, body):
+        self.requests[request.path] = self.requests.get(request.path, 0) + 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(body)
+
+    async def _timeSeries(self, request):
+        rng = random.Random(request.query.get('symbol'))
+        today = datetime.date.today()
+        price = rng.uniform(20, 500)
+        series = {}
+        for offset in range(self.days):
+            price *= 1 + rng.gauss(0, 0.01)
+            series[(today - datetime.timedelta(days=offset)).strftime('%Y-%m-%d')] = {
+                "1. open": f"{price * 0.99:.4f}",
+                "2. high": f"{price * 1.01:.4f}",
+                "3. low": f"{price * 0.98:.4f}",
+                "4. close": f"{price:.4f}",
+                "5. adjusted close": f"{price:.4f}",
+                "6. volume": str(rng.randint(100000, 5000000)),
+                "7. dividend amount": "0.0000",
+                "8. split coefficient": "1.0"
+            }
+        return await self._respond(request, {
+            "Meta Data": {"2. Symbol": request.query.get('symbol')},
+            "Time Series (Daily)": series
+        })
+
+    async def _quote(self, request):
+        return await self._respond(request, {"c": 101.0, "o": 100.5, "pc": 100.0, "h": 102.0, "l": 99.0})
+
+    async def _metric(self, request):
+        return await self._respond(request, {
+            "symbol": request.query.get('symbol'),
+            "metric": {
+                "10DayAverageTradingVolume": 12.5,
+                "3MonthAverageTradingVolume": 11.8,
+                "52WeekHigh": 210.0,
+                "52WeekLow": 120.0,
+                "52WeekPriceReturnDaily": 14.2,
+                "beta": 1.1
+            }
+        })
+
+    async def _profile(self, request):
+        return await self._respond(request, {"marketCapitalization": 2500000.0})
+
+    async def _earnings(self, request):
+        return await self._respond(request, {"earningsCalendar": [{"epsActual": 1.52}]})
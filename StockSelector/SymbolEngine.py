@@ -0,0 +1,150 @@
+import time
+import orjson
+from collections import deque
+from django.conf import settings
+from StockSelector.BarBuilder import BarBuilder
+from StockSelector.Technicals.RollingSMA import RollingSMA
+from StockSelector.Technicals.StreamingEMA import StreamingEMA
+from StockSelector.Technicals.RSI import RSI
+from StockSelector.Technicals.MACD import MACD
+from StockSelector.Technicals.BollingerBands import BollingerBands
+from StockSelector.PackedBars import SNAPSHOT_BARS, packBars, readBars, barsToDicts
+from StockSelector.BarStream import STREAMS, BUS_KEY, barKey, barId, isDuplicate
+from StockSelector.Screener import SNAPSHOT
+from StockSelector import Metrics
+
+BAR_INTERVALS = getattr(settings, "STOCK_BAR_INTERVALS", ["1m", "5m"])
+BAR_HISTORY = STREAMS["bars"]
+IND_INTERVAL = "1m"
+IND_PERIODS = {
+    "sma": 20,
+    "ema": 20,
+    "rsi": 14,
+    "macd": 12,
+    "bollinger": 20
+}
+
+# the screener columns this engine keeps current
+SNAPSHOT.declare(["ts", "volume1m", f"sma{IND_PERIODS['sma']}", f"ema{IND_PERIODS['ema']}", f"rsi{IND_PERIODS['rsi']}",
+                  "macd", "macdSignal", "macdHist", "bbMiddle", "bbUpper", "bbLower"])
+
+INDICATOR_SECONDS = Metrics.histogram("stonks_indicator_update_seconds", "Time to fold one closed bar into every indicator")
+CLOSE_SECONDS = Metrics.histogram("stonks_bar_close_seconds", "Indicators, bar store and Redis writes for one bucket close")
+
+class SymbolEngine():
+    def __init__(self, symbol, redis=None, intervals=None, store=None):
+        self.symbol = symbol
+        self.redis = redis
+        self.store = store
+        self.p_ind = f"stock|{symbol}|indicators|{IND_INTERVAL}"
+        self.p_barsByInterval = {label: barKey(symbol, label) for label in (intervals or BAR_INTERVALS)}
+        self.p_snapshot = f"stock|{symbol}|candles|{IND_INTERVAL}|snapshot"
+        self.ind_periods = IND_PERIODS
+        self.sma = RollingSMA(self.ind_periods['sma'])
+        self.ema = StreamingEMA(self.ind_periods['ema'], 2)
+        self.rsi = RSI(self.ind_periods['rsi'])
+        self.macd = MACD(self.ind_periods['macd'], 26, 9)
+        self.bollinger = BollingerBands(self.ind_periods['bollinger'], 2)
+        self.bars = BarBuilder(intervals or BAR_INTERVALS)
+        self.indicators = None
+        # newest 1m bars, re-encoded once per close so history requests forward bytes as-is
+        self.recent = deque(maxlen=SNAPSHOT_BARS)
+
+    async def _getRedisSeed(self):
+        if IND_INTERVAL not in self.p_barsByInterval:
+            return
+        count = max(SNAPSHOT_BARS, max(self.ind_periods.values()) + 10)
+        bars = None
+        if self.store is not None:
+            bars = self.store.read(self.symbol, IND_INTERVAL)[-count:]
+        if (bars is None or not len(bars)) and self.redis is not None:
+            try:
+                bars = await readBars(self.redis, self.p_barsByInterval[IND_INTERVAL], count=count)
+            except Exception as err:
+                Metrics.error("engine.seed", err, self.symbol)
+        if bars is not None and len(bars):
+            self.recent.extend(barsToDicts(bars))
+            self.seed(bars['close'].tolist())
+
+    def seed(self, priceQueue):
+        self.sma.seed(priceQueue)
+        self.rsi.seed(priceQueue)
+        self.bollinger.seed(priceQueue)
+        # the EMA carries the whole history, starting it at the last close would drop it
+        for price in priceQueue:
+            self.ema.update(price)
+            self.macd.update(price)
+
+    def addTrade(self, price, time, vol=0):
+        return self.bars.addTrade(price, time, vol)
+
+    def closeDue(self, now):
+        return self.bars.closeDue(now)
+
+    async def _closeBucket(self, closed):
+        if not closed:
+            return None
+        start = time.perf_counter()
+        indicators = None
+        for label, bar in closed:
+            if label == IND_INTERVAL:
+                indicators = self._updateIndicators(bar)
+                self.recent.append(bar)
+                SNAPSHOT.update(self.symbol, {**indicators, "price": bar['close'], "volume1m": bar['volume']})
+        if self.store is not None:
+            for label, bar in closed:
+                self.store.append(self.symbol, label, [bar])
+        if self.redis is not None:
+            members = [(label, packBars([bar])[0]) for label, bar in closed]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for (label, member), (_, bar) in zip(members, closed):
+                    await pipe.xadd(self.p_barsByInterval[label], {"b": member}, id=barId(bar['ts']),
+                                    maxlen=BAR_HISTORY, approximate=True)
+                if indicators is not None:
+                    # latest values stay plain keys: MGET for watchlists and the screener, GET for snapshots
+                    await pipe.set(self.p_ind, orjson.dumps(indicators).decode())
+                    await pipe.set(self.p_snapshot, self.snapshot())
+                results = await pipe.execute(raise_on_error=False)
+            # a bar that is already on its stream keeps the first write
+            errors = [result for result in results if isinstance(result, Exception) and not isDuplicate(result)]
+            if errors:
+                raise errors[0]
+            # and only the process that wrote it puts it on the bus, so group consumers see each close once
+            fresh = [member for member, result in zip(members, results) if not isinstance(result, Exception)]
+            if fresh:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for label, member in fresh:
+                        entry = {"s": self.symbol, "l": label, "b": member}
+                        if label == IND_INTERVAL and indicators is not None:
+                            entry["i"] = orjson.dumps(indicators)
+                        await pipe.xadd(BUS_KEY, entry, maxlen=STREAMS["bus"], approximate=True)
+                    await pipe.execute()
+        CLOSE_SECONDS.observe(time.perf_counter() - start)
+        return indicators
+
+    def snapshot(self):
+        return orjson.dumps({
+            "type": "history_candles",
+            "data": list(reversed(self.recent)),
+            "length": len(self.recent)
+        })
+
+    def _updateIndicators(self, bar):
+        start = time.perf_counter()
+        close = bar['close']
+        macdValue, macdSignal, macdHist = self.macd.update(close)
+        middle, upper, lower = self.bollinger.update(close)
+        self.indicators = {
+            "ts": bar['ts'],
+            f"sma{self.ind_periods['sma']}": self.sma.accumulate(close),
+            f"ema{self.ind_periods['ema']}": self.ema.update(close),
+            f"rsi{self.ind_periods['rsi']}": self.rsi.update(close),
+            "macd": macdValue,
+            "macdSignal": macdSignal,
+            "macdHist": macdHist,
+            "bbMiddle": middle,
+            "bbUpper": upper,
+            "bbLower": lower
+        }
+        INDICATOR_SECONDS.observe(time.perf_counter() - start)
+        return self.indicators
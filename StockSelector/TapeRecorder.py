@@ -0,0 +1,253 @@
+import atexit, datetime, glob, gzip, os, threading, time, zlib
+from collections import deque
+import orjson
+from django.conf import settings
+from StockSelector import Metrics
+
+TAPE = {
+    "enabled": False,
+    "dir": os.path.join(settings.BASE_DIR, "tapes"),
+    "segmentMb": 64,
+    "segmentMinutes": 60,
+    "flushSeconds": 1.0,
+    "maxQueue": 100000,
+    "level": 6,
+    **getattr(settings, "STOCK_TAPE", {})
+}
+SEGMENT_INDEX = "index.jsonl"
+
+TAPE_FRAMES = Metrics.counter("stonks_tape_frames_total", "Upstream frames written to the tape")
+TAPE_DROPPED = Metrics.counter("stonks_tape_dropped_total", "Frames dropped because the tape writer fell behind")
+TAPE_BYTES = Metrics.counter("stonks_tape_bytes_total", "Compressed tape bytes written")
+TAPE_WRITE_SECONDS = Metrics.histogram("stonks_tape_write_seconds", "Time to compress and append one batch")
+
+class TapeRecorder():
+    # Raw upstream frames, one per line, in append-only segments. Every flush is its own gzip
+    # member, so a segment is a plain .jsonl.gz (replayable as is) and the .idx sidecar can point
+    # a reader at just the members holding a symbol or time range. record() only appends to a
+    # deque; compression and file I/O happen on the writer thread.
+    _default = None
+
+    @classmethod
+    def default(cls):
+        if not TAPE["enabled"]:
+            return None
+        if cls._default is None:
+            cls._default = cls(TAPE["dir"])
+        return cls._default
+
+    def __init__(self, root, segmentMb=None, segmentMinutes=None, flushSeconds=None, maxQueue=None, level=None):
+        self.root = str(root)
+        self.segmentBytes = (segmentMb or TAPE["segmentMb"]) * 1024 * 1024
+        self.segmentSeconds = (segmentMinutes or TAPE["segmentMinutes"]) * 60
+        self.flushSeconds = flushSeconds or TAPE["flushSeconds"]
+        self.maxQueue = maxQueue or TAPE["maxQueue"]
+        self.level = TAPE["level"] if level is None else level
+        self.pending = deque()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.registered = False
+        self.segment = None
+        self.stats = {"frames": 0, "dropped": 0, "batches": 0, "bytes": 0, "segments": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="stonks-tape", daemon=True)
+            self.thread.start()
+            if not self.registered:
+                atexit.register(self.close)
+                self.registered = True
+        return self
+
+    def record(self, frame, symbols):
+        # called on the event loop for every trade frame: no I/O, no encoding
+        if len(self.pending) >= self.maxQueue:
+            self.stats["dropped"] += 1
+            TAPE_DROPPED.inc()
+            return
+        self.pending.append((time.time(), frame, symbols))
+
+    def close(self):
+        self.stopping = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(10)
+            self.thread = None
+        self._closeSegment()
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait(self.flushSeconds)
+            self.wake.clear()
+            self._safeFlush()
+        # whatever was recorded before close() but after the last drain
+        self._safeFlush()
+
+    def _safeFlush(self):
+        try:
+            self._flush()
+        except Exception as err:
+            Metrics.error("tape.flush", err)
+
+    def _flush(self):
+        batch = []
+        while self.pending:
+            batch.append(self.pending.popleft())
+        if not batch:
+            if self.segment is not None and time.time() - self.segment["opened"] >= self.segmentSeconds:
+                self._closeSegment()
+            return
+        start = time.perf_counter()
+        symbols = set()
+        lines = []
+        for _, frame, frameSymbols in batch:
+            symbols.update(frameSymbols)
+            lines.append(frame.encode() if isinstance(frame, str) else frame)
+        raw = b"\n".join(lines) + b"\n"
+        member = gzip.compress(raw, self.level)
+        segment = self._segment(batch[0][0])
+        offset = segment["file"].tell()
+        segment["file"].write(member)
+        segment["file"].flush()
+        block = {
+            "o": offset,
+            "n": len(member),
+            "t0": int(batch[0][0] * 1000),
+            "t1": int(batch[-1][0] * 1000),
+            "frames": len(batch),
+            "s": sorted(symbols)
+        }
+        segment["index"].write(orjson.dumps(block) + b"\n")
+        segment["index"].flush()
+        segment["raw"] += len(raw)
+        segment["frames"] += len(batch)
+        segment["end"] = block["t1"]
+        segment["symbols"].update(symbols)
+        self.stats["frames"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["bytes"] += len(member)
+        TAPE_FRAMES.inc(amount=len(batch))
+        TAPE_BYTES.inc(amount=len(member))
+        TAPE_WRITE_SECONDS.observe(time.perf_counter() - start)
+        if segment["raw"] >= self.segmentBytes or time.time() - segment["opened"] >= self.segmentSeconds:
+            self._closeSegment()
+
+    def _segment(self, at):
+        if self.segment is None:
+            stamp = datetime.datetime.fromtimestamp(at, datetime.timezone.utc).strftime("%Y%m%d-%H%M%S")
+            # names sort in recording order, so a directory replays chronologically
+            name = f"{stamp}-{os.getpid()}-{self.stats['segments']:04d}.jsonl.gz"
+            path = os.path.join(self.root, name)
+            self.segment = {
+                "name": name,
+                "file": open(path, "ab"),
+                "index": open(path + ".idx", "ab"),
+                "opened": time.time(),
+                "start": int(at * 1000),
+                "end": int(at * 1000),
+                "raw": 0,
+                "frames": 0,
+                "symbols": set()
+            }
+            self.stats["segments"] += 1
+        return self.segment
+
+    def _closeSegment(self):
+        segment, self.segment = self.segment, None
+        if segment is None:
+            return
+        segment["file"].close()
+        segment["index"].close()
+        summary = {
+            "segment": segment["name"],
+            "start": segment["start"],
+            "end": segment["end"],
+            "frames": segment["frames"],
+            "bytes": os.path.getsize(os.path.join(self.root, segment["name"])),
+            "symbols": sorted(segment["symbols"])
+        }
+        with open(os.path.join(self.root, SEGMENT_INDEX), "ab") as f:
+            f.write(orjson.dumps(summary) + b"\n")
+
+    def snapshot(self):
+        return {**self.stats, "queued": len(self.pending), "segment": self.segment["name"] if self.segment else None}
+
+class TapeReader():
+    # streams frames back from a tape directory, skipping segments and gzip members that the
+    # indexes say cannot hold the requested symbols or time range (times are ms). The indexes
+    # hold receive times; frames of a member that straddles the range are kept by trade time
+    def __init__(self, root):
+        self.root = str(root)
+
+    def segments(self):
+        summaries = {}
+        path = os.path.join(self.root, SEGMENT_INDEX)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        summary = orjson.loads(line)
+                        summaries[summary["segment"]] = summary
+        # the segment being written has no summary yet, its .idx is enough
+        for name in sorted(os.path.basename(p) for p in glob.glob(os.path.join(self.root, "*.jsonl.gz"))):
+            yield name, summaries.get(name)
+
+    def _blocks(self, name):
+        with open(os.path.join(self.root, name + ".idx"), "rb") as f:
+            for line in f:
+                # a torn last line means the writer died mid-flush, the member before it is intact
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    return
+
+    @staticmethod
+    def _overlaps(first, last, start, end):
+        return (start is None or last >= start) and (end is None or first <= end)
+
+    def blocks(self, symbols=None, start=None, end=None):
+        wanted = set(symbols) if symbols else None
+        for name, summary in self.segments():
+            if summary is not None:
+                if not self._overlaps(summary["start"], summary["end"], start, end):
+                    continue
+                if wanted and wanted.isdisjoint(summary["symbols"]):
+                    continue
+            if not os.path.exists(os.path.join(self.root, name + ".idx")):
+                continue
+            for block in self._blocks(name):
+                if not self._overlaps(block["t0"], block["t1"], start, end):
+                    continue
+                if wanted and wanted.isdisjoint(block["s"]):
+                    continue
+                yield name, block
+
+    def records(self, symbols=None, start=None, end=None):
+        # yields raw frames (bytes); with symbols given, only frames carrying one of them, with
+        # a time range, only frames whose newest trade falls in it
+        wanted = set(symbols) if symbols else None
+        for name, block in self.blocks(symbols, start, end):
+            with open(os.path.join(self.root, name), "rb") as f:
+                f.seek(block["o"])
+                data = zlib.decompress(f.read(block["n"]), wbits=31)
+            inside = (start is None or block["t0"] >= start) and (end is None or block["t1"] <= end)
+            for frame in data.splitlines():
+                if not frame:
+                    continue
+                if wanted is None and inside:
+                    yield frame
+                    continue
+                try:
+                    trades = [tr for tr in orjson.loads(frame).get("data") or [] if isinstance(tr, dict)]
+                except (orjson.JSONDecodeError, AttributeError):
+                    continue
+                if wanted is not None and not any(tr.get("s") in wanted for tr in trades):
+                    continue
+                if not inside:
+                    times = [tr["t"] for tr in trades if isinstance(tr.get("t"), (int, float))]
+                    if not times or not self._overlaps(max(times), max(times), start, end):
+                        continue
+                yield frame
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Batch versions of the streaming indicators. Every function takes either a 1-D close
+# series or a 2-D symbols x time array and runs over the whole time axis at once, with
+# the same warm-up semantics as RollingSMA / StreamingEMA so backfills line up with live.
+
+def _frame(closes):
+    arr = np.asarray(closes, dtype=np.float64)
+    if arr.ndim not in (1, 2):
+        raise ValueError("closes must be a 1-D series or a 2-D symbols x time array")
+    return arr, pd.DataFrame(np.atleast_2d(arr).T)
+
+def _out(arr, frame):
+    out = frame.to_numpy().T
+    return out[0] if arr.ndim == 1 else out
+
+def _ewm(arr, frame, alpha):
+    if alpha <= 0:
+        # StreamingEMA with no smoothing keeps its first value forever
+        first = np.atleast_2d(arr)[:, :1]
+        out = np.broadcast_to(first, np.atleast_2d(arr).shape).copy()
+        return out[0] if arr.ndim == 1 else out
+    return _out(arr, frame.ewm(alpha=alpha, adjust=False).mean())
+
+def batchSMA(closes, window):
+    arr, frame = _frame(closes)
+    if window > 0:
+        return _out(arr, frame.rolling(window, min_periods=1).mean())
+    return _out(arr, frame.expanding().mean())
+
+def batchEMA(closes, period, smoothing=2):
+    arr, frame = _frame(closes)
+    alpha = smoothing / (1 + period) if period > 0 else 0
+    return _ewm(arr, frame, alpha)
+
+def batchRSI(closes, period=14):
+    arr = np.asarray(closes, dtype=np.float64)
+    series = np.atleast_2d(arr)
+    out = np.full(series.shape, np.nan)
+    if period <= 0 or series.shape[1] <= period:
+        return out[0] if arr.ndim == 1 else out
+    change = np.diff(series, axis=1)
+    gains = np.clip(change, 0, None)
+    losses = np.clip(-change, 0, None)
+    # Wilder smoothing is an EMA with alpha 1/period started from the simple mean of
+    # the first period changes, which lands on close index `period`
+    smoothed = []
+    for moves in (gains, losses):
+        seeded = np.full(series.shape, np.nan)
+        seeded[:, period] = moves[:, :period].mean(axis=1)
+        seeded[:, period + 1:] = moves[:, period:]
+        smoothed.append(pd.DataFrame(seeded.T).ewm(alpha=1 / period, adjust=False).mean().to_numpy().T)
+    avgGain, avgLoss = smoothed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + avgGain / avgLoss)
+    rsi = np.where(avgLoss == 0, 100.0, rsi)
+    out[:, period:] = rsi[:, period:]
+    return out[0] if arr.ndim == 1 else out
+
+def batchMACD(closes, fast=12, slow=26, signal=9):
+    fastEMA = batchEMA(closes, fast)
+    slowEMA = batchEMA(closes, slow)
+    macd = fastEMA - slowEMA
+    signalLine = batchEMA(macd, signal)
+    return macd, signalLine, macd - signalLine
+
+def batchBollinger(closes, window=20, k=2):
+    arr, frame = _frame(closes)
+    rolling = frame.rolling(window, min_periods=1) if window > 0 else frame.expanding()
+    middle = _out(arr, rolling.mean())
+    std = _out(arr, rolling.std(ddof=0))
+    return middle, middle + k * std, middle - k * std
@@ -0,0 +1,40 @@
+from .RingBuffer import RingBuffer
+
+class BollingerBands():
+    __slots__ = ('window', 'k', 'queue', 'count', 'mean', 'm2')
+
+    def __init__(self, window=20, k=2):
+        self.queue = RingBuffer(window) if window > 0 else None
+        self.window = window
+        self.k = k
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def seed(self, closePrice):
+        for price in closePrice:
+            self.update(price)
+
+    def update(self, price):
+        # Welford's running mean and sum of squared deviations, with the oldest price
+        # swapped out in place once the window is full
+        price = float(price)
+        old = self.queue.push(price) if self.queue is not None else None
+        if old is not None:
+            oldMean = self.mean
+            self.mean += (price - old) / self.count
+            self.m2 += (price - old) * (price - self.mean + old - oldMean)
+        else:
+            self.count += 1
+            delta = price - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (price - self.mean)
+        if self.m2 < 0 or self.count == 1:
+            self.m2 = 0.0
+        return self.bands()
+
+    def bands(self):
+        if not self.count:
+            return None
+        band = self.k * (self.m2 / self.count) ** 0.5
+        return self.mean, self.mean + band, self.mean - band
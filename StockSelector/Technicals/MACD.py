@@ -0,0 +1,31 @@
+class MACD():
+    __slots__ = ('fastAlpha', 'slowAlpha', 'signalAlpha', 'fastEMA', 'slowEMA', 'macd', 'signal', 'histogram')
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fastAlpha = 2 / (1 + fast)
+        self.slowAlpha = 2 / (1 + slow)
+        self.signalAlpha = 2 / (1 + signal)
+        self.fastEMA = None
+        self.slowEMA = None
+        self.macd = None
+        self.signal = None
+        self.histogram = None
+
+    def seed(self, price):
+        self.fastEMA = price
+        self.slowEMA = price
+        self.macd = 0.0
+        self.signal = 0.0
+        self.histogram = 0.0
+
+    def update(self, price):
+        if self.fastEMA is None:
+            self.seed(price)
+            return self.macd, self.signal, self.histogram
+        self.fastEMA = (price * self.fastAlpha) + (self.fastEMA * (1 - self.fastAlpha))
+        self.slowEMA = (price * self.slowAlpha) + (self.slowEMA * (1 - self.slowAlpha))
+        self.macd = self.fastEMA - self.slowEMA
+        # the signal line starts at zero, so it can't use StreamingEMA's zero-means-unseeded check
+        self.signal = (self.macd * self.signalAlpha) + (self.signal * (1 - self.signalAlpha))
+        self.histogram = self.macd - self.signal
+        return self.macd, self.signal, self.histogram
@@ -0,0 +1,39 @@
+class RSI():
+    __slots__ = ('period', 'prev', 'count', 'gainSum', 'lossSum', 'avgGain', 'avgLoss', 'rsi')
+
+    def __init__(self, period=14):
+        self.period = period
+        self.prev = None
+        self.count = 0
+        self.gainSum = 0.0
+        self.lossSum = 0.0
+        self.avgGain = None
+        self.avgLoss = None
+        self.rsi = None
+
+    def seed(self, closePrice):
+        for price in closePrice:
+            self.update(price)
+
+    def update(self, price):
+        if self.prev is None:
+            self.prev = price
+            return self.rsi
+        change = price - self.prev
+        self.prev = price
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        if self.avgGain is None:
+            # Wilder's first average is a plain mean over the first period changes
+            self.count += 1
+            self.gainSum += gain
+            self.lossSum += loss
+            if self.count < self.period:
+                return None
+            self.avgGain = self.gainSum / self.period
+            self.avgLoss = self.lossSum / self.period
+        else:
+            self.avgGain = (self.avgGain * (self.period - 1) + gain) / self.period
+            self.avgLoss = (self.avgLoss * (self.period - 1) + loss) / self.period
+        self.rsi = 100.0 if self.avgLoss == 0 else 100 - 100 / (1 + self.avgGain / self.avgLoss)
+        return self.rsi
@@ -0,0 +1,36 @@
+from array import array
+
+class RingBuffer():
+    __slots__ = ('capacity', 'data', 'head', 'size')
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("RingBuffer capacity must be positive")
+        self.capacity = capacity
+        self.data = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        start = self.head - self.size
+        for idx in range(start, self.head):
+            yield self.data[idx % self.capacity]
+
+    def full(self):
+        return self.size == self.capacity
+
+    def push(self, value):
+        # returns the value that fell out of the window, or None while still filling up
+        evicted = self.data[self.head] if self.size == self.capacity else None
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if evicted is None:
+            self.size += 1
+        return evicted
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
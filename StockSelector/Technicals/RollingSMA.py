@@ -1,23 +1,49 @@
-from collections import deque
+import math
+from .RingBuffer import RingBuffer
 
 class RollingSMA():
-    def __init__(self, window):
-        self.queue = deque()
-        if window > 0:
-            self.queue = deque(maxlen=window)
+    __slots__ = ('window', 'queue', 'count', 's', 'updates', 'resumEvery')
+
+    def __init__(self, window, resumEvery=None):
+        self.queue = RingBuffer(window) if window > 0 else None
         self.window = window
-        self.s = 0
-    
+        self.count = 0
+        self.s = 0.0
+        self.updates = 0
+        # the running sum is replaced by an exact fsum of the window every resumEvery
+        # updates, which bounds drift while keeping the amortised cost O(1)
+        self.resumEvery = resumEvery or max(window, 64)
+
     def seed(self, closePrice):
-        for price in closePrice[-self.window:][::-1]:
-            self.accumulate(price)
-        
+        n = len(closePrice)
+        start = n - self.window if 0 < self.window < n else 0
+        for idx in range(start, n):
+            self.accumulate(closePrice[idx])
+
     def accumulate(self, price):
-        if len(self.queue) == self.queue.maxlen:
-            self.s -= self.queue.popleft()
-        self.queue.append(price)
-        self.s += price
-        return self.sma()
-    
+        price = float(price)
+        queue = self.queue
+        if queue is None:
+            self.count += 1
+            self.s += price
+            return self.s / self.count
+        # RingBuffer.push inlined, this runs for every bar of every live window
+        data = queue.data
+        head = queue.head
+        if queue.size == queue.capacity:
+            self.s += price - data[head]
+        else:
+            queue.size += 1
+            self.count += 1
+            self.s += price
+        data[head] = price
+        head += 1
+        queue.head = 0 if head == queue.capacity else head
+        self.updates += 1
+        if self.updates >= self.resumEvery:
+            self.updates = 0
+            self.s = math.fsum(queue.data) if queue.size == queue.capacity else math.fsum(queue)
+        return self.s / self.count
+
     def sma(self):
-        return (self.s / len(self.queue)) if self.queue else None
\ No newline at end of file
+        return (self.s / self.count) if self.count else None
@@ -1,2 +1,7 @@
+from .RingBuffer import RingBuffer
 from .RollingSMA import RollingSMA
 from .StreamingEMA import StreamingEMA
+from .RSI import RSI
+from .MACD import MACD
+from .BollingerBands import BollingerBands
+from .BatchIndicators import batchSMA, batchEMA, batchRSI, batchMACD, batchBollinger
@@ -0,0 +1,59 @@
+import asyncio
+from django.conf import settings
+
+PUBLISH_COALESCE = getattr(settings, "STOCK_PUBLISH_COALESCE", None) or {}
+
+def coalescing():
+    return PUBLISH_COALESCE.get("mode") in ("interval", "deadline")
+
+class TickCoalescer():
+    totals = {"ticks": 0, "published": 0}
+
+    def __init__(self):
+        self.pending = {}
+        self.ticks = 0
+        self.published = 0
+        self.ready = asyncio.Event()
+
+    def add(self, symbol, price, vol=0):
+        self.merge(symbol, price, price, price, vol, 1)
+
+    def merge(self, symbol, last, high, low, volume, ticks):
+        # one tick, or a window another coalescer already conflated
+        self.ticks += ticks
+        TickCoalescer.totals["ticks"] += ticks
+        entry = self.pending.get(symbol)
+        if entry is None:
+            self.pending[symbol] = {
+                "last": last,
+                "high": high,
+                "low": low,
+                "volume": volume,
+                "ticks": ticks
+            }
+            self.ready.set()
+            return
+        entry["last"] = last
+        if high > entry["high"]:
+            entry["high"] = high
+        if low < entry["low"]:
+            entry["low"] = low
+        entry["volume"] += volume
+        entry["ticks"] += ticks
+
+    async def wait(self):
+        await self.ready.wait()
+
+    def drain(self):
+        pending, self.pending = self.pending, {}
+        self.ready.clear()
+        self.published += len(pending)
+        TickCoalescer.totals["published"] += len(pending)
+        return pending
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "published": self.published,
+            "dropped": self.ticks - self.published - sum(e["ticks"] for e in self.pending.values())
+        }
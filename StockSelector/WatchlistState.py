@@ -0,0 +1,243 @@
+import contextlib
+from channels.generic.websocket import AsyncWebsocketConsumer
+import os, asyncio, time
+import orjson
+from dotenv import load_dotenv
+from django.conf import settings
+from StockSelector.Sharding import liveFeed
+from StockSelector.OpeningPrices import OpeningPrices, liveFrame
+from StockSelector.RedisPool import sharedRedis
+from StockSelector.TickCoalescer import TickCoalescer, PUBLISH_COALESCE
+from StockSelector.SendQueue import SendQueue
+from StockSelector.MarketData import validSymbol
+from StockSelector.StockState import FEED_EVENTS, ACTION_SECONDS, LIVE_PUBLISH_SECONDS, SLOW_CLIENTS, REQUEST_FAILED
+from StockSelector import Metrics
+
+load_dotenv('./content.env')
+FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
+WATCHLIST_MAX = getattr(settings, "STOCK_WATCHLIST_MAX", 2000)
+# opening prices fetched per "opening" frame after a subscribe
+OPENING_CHUNK = 20
+
+class WatchlistState(AsyncWebsocketConsumer):
+    # one socket for many symbols: ticks and bar closes are conflated per symbol and sent as
+    # a single frame per flush, so memory stays proportional to the watchlist, not the tick rate
+    async def connect(self):
+        if not FINNHUB_API_KEY:
+            await self.close(code=4001)
+            return None
+        self.redis = sharedRedis()
+        self.symbols = set()
+        self.opening = {}
+        self.openingTasks = set()
+        self.pendingBars = {}
+        self.coalescer = TickCoalescer()
+        self.feed = liveFeed()
+        await self.accept()
+        self.outbox = SendQueue(self.send, self._overBudget, name="watchlist")
+        self.sendTask = asyncio.create_task(self.outbox.run())
+        self.publishTask = asyncio.create_task(self.publishFlusher())
+
+    async def disconnect(self, close_code):
+        tasks = [getattr(self, name, None) for name in ('publishTask', 'sendTask')] + list(getattr(self, 'openingTasks', ()))
+        for task in tasks:
+            if task is None:
+                continue
+            task.cancel()
+            with contextlib.suppress(BaseException):
+                await task
+        if hasattr(self, 'feed'):
+            await self._leave(list(self.symbols))
+
+    async def dispatch(self, message):
+        handler = FEED_EVENTS.get(message["type"])
+        if handler is None:
+            return await super().dispatch(message)
+        # see StockState.dispatch
+        await getattr(self, handler)(message)
+
+    async def _overBudget(self):
+        SLOW_CLIENTS.inc("watchlist")
+        Metrics.logger.info("Closing slow watchlist client: %s", self.outbox.snapshot())
+        await self.close(code=4008)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if not text_data:
+            return
+        try:
+            data = orjson.loads(text_data)
+        except orjson.JSONDecodeError:
+            return
+        if not isinstance(data, dict):
+            return
+        action = data.get("action")
+        handler = self.actions.get(action)
+        if handler is None:
+            return
+        start = time.perf_counter()
+        try:
+            await getattr(self, handler)(data)
+            ACTION_SECONDS.observe(time.perf_counter() - start, action)
+        except Exception as err:
+            Metrics.error("watchlist.receive", err, action)
+            # validation messages are written for the client, anything else stays in the logs
+            message = str(err) if isinstance(err, ValueError) else REQUEST_FAILED
+            self.outbox.put(orjson.dumps({"type": "error", "action": action, "error": message}).decode())
+
+    actions = {
+        "subscribe": "_subscribe",
+        "unsubscribe": "_unsubscribe",
+        "get_watchlist": "_sendWatchlist"
+    }
+
+    @staticmethod
+    def _requested(data):
+        symbols = data.get("symbols")
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        if not isinstance(symbols, list):
+            raise ValueError("symbols must be a list")
+        seen = {}
+        for symbol in symbols:
+            if validSymbol(symbol):
+                seen[symbol] = None
+        return list(seen)
+
+    async def _subscribe(self, data):
+        requested = [symbol for symbol in self._requested(data) if symbol not in self.symbols]
+        room = max(WATCHLIST_MAX - len(self.symbols), 0)
+        added, rejected = requested[:room], requested[room:]
+        if added:
+            self.symbols.update(added)
+            # cached opens go in the ack, the rest are rate-limited quote calls and follow in "opening" frames
+            self.opening.update(await OpeningPrices.get(self.redis, added, fetch=False))
+            missing = [symbol for symbol in added if symbol not in self.opening]
+            if missing:
+                task = asyncio.create_task(self._fillOpening(missing))
+                self.openingTasks.add(task)
+                task.add_done_callback(self.openingTasks.discard)
+            await asyncio.gather(*(self.feed.join(symbol, self.channel_name) for symbol in added))
+        # indicators already live in the shared feed (or its shard), nothing to compute per connection
+        indicators = await self.feed.indicators(added)
+        self.outbox.put(orjson.dumps({
+            "type": "subscribed",
+            "symbols": added,
+            "rejected": rejected,
+            "open": {symbol: self.opening.get(symbol, 0.0) for symbol in added},
+            "indicators": indicators,
+            "count": len(self.symbols)
+        }).decode())
+
+    async def _fillOpening(self, symbols):
+        # small chunks so early quotes reach the client while the rest wait on the rate limit
+        for offset in range(0, len(symbols), OPENING_CHUNK):
+            chunk = [symbol for symbol in symbols[offset:offset + OPENING_CHUNK] if symbol in self.symbols]
+            if not chunk:
+                continue
+            try:
+                prices = await OpeningPrices.get(self.redis, chunk)
+            except Exception as err:
+                Metrics.error("watchlist.opening", err)
+                return
+            # symbols dropped while the quotes were in flight are not reported
+            prices = {symbol: price for symbol, price in prices.items() if symbol in self.symbols}
+            if not prices:
+                continue
+            self.opening.update(prices)
+            self.outbox.put(orjson.dumps({
+                "type": "opening",
+                "open": prices
+            }).decode())
+
+    async def _unsubscribe(self, data):
+        removed = [symbol for symbol in self._requested(data) if symbol in self.symbols]
+        await self._leave(removed)
+        self.outbox.put(orjson.dumps({
+            "type": "unsubscribed",
+            "symbols": removed,
+            "count": len(self.symbols)
+        }).decode())
+
+    async def _leave(self, symbols):
+        for symbol in symbols:
+            self.symbols.discard(symbol)
+            self.opening.pop(symbol, None)
+            self.pendingBars.pop(symbol, None)
+            self.coalescer.pending.pop(symbol, None)
+        results = await asyncio.gather(*(self.feed.leave(symbol, self.channel_name) for symbol in symbols), return_exceptions=True)
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                Metrics.error("watchlist.leave", result, symbol)
+
+    async def _sendWatchlist(self, data):
+        self.outbox.put(orjson.dumps({
+            "type": "watchlist_state",
+            "symbols": sorted(self.symbols),
+            "publish": self.coalescer.stats(),
+            "queue": self.outbox.snapshot()
+        }).decode())
+
+    async def _flush(self):
+        if self.outbox.depth():
+            # the client has not taken the last frame yet: leave ticks in the coalescer, where
+            # newer prices replace older ones, and only check whether it is over budget
+            self.outbox.check()
+            return
+        pending = self.coalescer.drain()
+        bars, self.pendingBars = self.pendingBars, {}
+        if not pending and not bars:
+            return
+        start = time.perf_counter()
+        quotes = []
+        for symbol, entry in pending.items():
+            live = liveFrame(symbol, entry["last"], self.opening.get(symbol))
+            live["high"] = float(entry["high"])
+            live["low"] = float(entry["low"])
+            live["volume"] = float(entry["volume"])
+            live["ticks"] = entry["ticks"]
+            quotes.append(live)
+        self.outbox.put(orjson.dumps({
+            "type": "watchlist",
+            "quotes": quotes,
+            "bars": bars
+        }).decode())
+        LIVE_PUBLISH_SECONDS.observe(time.perf_counter() - start, "watchlist")
+
+    async def publishFlusher(self):
+        delay = PUBLISH_COALESCE.get("ms", 250) / 1000
+        while True:
+            if PUBLISH_COALESCE.get("mode") == "deadline":
+                await self.coalescer.wait()
+            await asyncio.sleep(delay)
+            try:
+                await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                Metrics.error("watchlist.flush", err)
+
+    async def stock_trades(self, event):
+        # only sent when the feed does not coalesce
+        symbol = event.get("symbol")
+        if symbol not in self.symbols:
+            return
+        for price, ts, vol in event.get("trades", []):
+            self.coalescer.add(symbol, price, vol)
+
+    async def stock_quote(self, event):
+        # a window the feed already coalesced, merged with any this socket has not sent yet
+        symbol = event.get("symbol")
+        if symbol not in self.symbols:
+            return
+        quote = event["quote"]
+        self.coalescer.merge(symbol, quote["price"], quote["high"], quote["low"], quote["volume"], quote["ticks"])
+
+    async def stock_bars(self, event):
+        symbol = event.get("symbol")
+        if symbol not in self.symbols:
+            return
+        # bars are never conflated, indicators only matter at their latest value
+        entry = self.pendingBars.setdefault(symbol, {"bars": [], "indicators": None})
+        entry["bars"].extend(event.get("bars", []))
+        entry["indicators"] = event.get("indicators")
+        self.coalescer.ready.set()
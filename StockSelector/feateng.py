@@ -1,22 +1,80 @@
+import re
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 
+AVERAGE_WINDOWS = {
+    'monthly_average': pd.Timedelta(days=30),
+    'daily_average': pd.Timedelta(hours=24)
+}
+INTEGER_COLUMNS = ('volume',)
+
+def normalizeColumn(name):
+    # "5. adjusted close" -> "adjusted_close"
+    return re.sub(r'^\d+[a-z]?\.\s*', '', name.strip().lower()).replace(' ', '_')
+
+def parseTimeSeries(series):
+    if not series:
+        raise ValueError("Empty time series")
+    dates = list(series.keys())
+    rawColumns = list(next(iter(series.values())).keys())
+    # one float64 block parsed straight from the strings, then split into typed columns
+    values = np.array([[entry.get(col, 'nan') for col in rawColumns] for entry in series.values()], dtype=np.float64)
+    index = pd.DatetimeIndex(pd.to_datetime(dates, format='ISO8601'), name='date')
+    columns = {}
+    for pos, raw in enumerate(rawColumns):
+        name = normalizeColumn(raw)
+        column = values[:, pos]
+        if name in INTEGER_COLUMNS and not np.isnan(column).any():
+            column = column.astype(np.int64)
+        columns[name] = column
+    frame = pd.DataFrame(columns, index=index, copy=False)
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index()
+    return frame
+
+def windowAggregates(frame, windows=None):
+    windows = windows or AVERAGE_WINDOWS
+    numeric = frame.to_numpy(dtype=np.float64)
+    # a single prefix sum serves the mean over every trailing window
+    prefix = np.vstack([np.zeros((1, numeric.shape[1])), np.cumsum(numeric, axis=0)])
+    stamps = frame.index.values
+    end = len(stamps)
+    results = {}
+    for name, span in windows.items():
+        start = int(np.searchsorted(stamps, stamps[-1] - np.timedelta64(span), side='left'))
+        count = end - start
+        if count <= 0:
+            continue
+        results[name] = pd.Series((prefix[end] - prefix[start]) / count, index=frame.columns)
+    return results
+
 class FeatureAnalysis():
+    def __init__(self, cacheSize=256):
+        self.cacheSize = cacheSize
+        self.frames = OrderedDict()
+
+    def parse(self, symbol, series, interval='daily'):
+        newest = max(series) if series else None
+        key = (symbol, interval)
+        cached = self.frames.get(key)
+        if cached is not None and cached[0] == (newest, len(series)):
+            self.frames.move_to_end(key)
+            return cached[1]
+        frame = parseTimeSeries(series)
+        self.frames[key] = ((newest, len(series)), frame)
+        self.frames.move_to_end(key)
+        while len(self.frames) > self.cacheSize:
+            self.frames.popitem(last=False)
+        return frame
+
+    def averages(self, symbol, series, windows=None, interval='daily'):
+        return windowAggregates(self.parse(symbol, series, interval), windows)
+
     def calculateAverageFromJson(self, jsonObject, time):
-        df = pd.DataFrame.from_dict(jsonObject, orient='index')
-        columns = df.columns
-        for col in columns:
-            df = df.astype({col: float})
-        end_date = pd.to_datetime(df.index.max())
-        avg_df = None
-        if time == 'monthly_average':
-            start_date = end_date - pd.Timedelta(days=30)
-            last_month = df[(pd.to_datetime(df.index) >= start_date) & (pd.to_datetime(df.index) <=end_date)]
-            avg_df = last_month.mean()
-        elif time == 'daily_average':
-            start_date = end_date - pd.Timedelta(hours=24)
-            last_day = df[(pd.to_datetime(df.index) >= start_date) & (pd.to_datetime(df.index) <=end_date)]
-            avg_df = last_day.mean()
+        if time not in AVERAGE_WINDOWS:
+            raise ValueError("Invalid Average Dataframe")
+        avg_df = windowAggregates(parseTimeSeries(jsonObject), {time: AVERAGE_WINDOWS[time]}).get(time)
         if avg_df is not None and not avg_df.empty:
             return avg_df
-        raise ValueError("Invalid Average Dataframe")
\ No newline at end of file
+        raise ValueError("Invalid Average Dataframe")
@@ -0,0 +1,53 @@
+import orjson
+from django.core.management.base import BaseCommand, CommandError
+from StockSelector.Backtest import STRATEGIES, runBacktest
+from StockSelector.Replay import tapeFiles
+
+class Command(BaseCommand):
+    help = ("Replay recorded Finnhub frames through the live pipeline (parse, bars, _closeBucket, indicators) "
+            "on a simulated clock and backtest buy/sell/hold signals on the closed bars. Reports ticks/sec")
+
+    def add_arguments(self, parser):
+        parser.add_argument("tapes", nargs="+", help="tape files (.jsonl or .jsonl.gz), directories or globs")
+        parser.add_argument("--speed", type=float, default=0, help="0 replays as fast as possible, N replays at N x recorded pace")
+        parser.add_argument("--workers", type=int, default=1, help="processes, symbols are split between them")
+        parser.add_argument("--strategy", default="ema_sma,rsi", help=f"comma separated, any of {', '.join(STRATEGIES)}")
+        parser.add_argument("--symbols", default="", help="comma separated symbols, defaults to every symbol on the tape")
+        parser.add_argument("--redis", choices=["none", "fake"], default="none", help="fake also runs the Redis writes of each close")
+        parser.add_argument("--json", help="write the full report, per symbol results included, to this file")
+
+    def handle(self, *args, **options):
+        strategies = [name.strip() for name in options["strategy"].split(",") if name.strip()]
+        unknown = [name for name in strategies if name not in STRATEGIES]
+        if unknown:
+            raise CommandError(f"Unknown strategies {unknown}, expected {list(STRATEGIES)}")
+        if not tapeFiles(options["tapes"]):
+            raise CommandError("No tape files found")
+        symbols = [s.strip() for s in options["symbols"].split(",") if s.strip()] or None
+        report = runBacktest(options["tapes"], max(options["workers"], 1), options["speed"], strategies, symbols,
+                             options["redis"] if options["redis"] != "none" else None)
+
+        for worker in report["workers"]:
+            self.stdout.write(f"worker {worker['worker']}: {worker['symbols']} symbols, {worker['ticks']} ticks, "
+                              f"{worker['ticksPerSec']:.0f} ticks/s")
+        self.stdout.write(f"{report['ticks']} ticks for {report['symbols']} symbols in {report['seconds']:.2f}s: "
+                          f"{report['ticksPerSec']:.0f} ticks/s")
+        for name in strategies:
+            results = {key.split("|", 1)[1]: value for key, value in report["results"].items() if key.startswith(name + "|")}
+            if not results:
+                self.stdout.write(f"{name}: no closed bars with indicators")
+                continue
+            trades = sum(result["trades"] for result in results.values())
+            wins = sum(result["wins"] for result in results.values())
+            average = sum(result["return"] for result in results.values()) / len(results)
+            buyHold = sum(result["buyHold"] for result in results.values()) / len(results)
+            best = max(results, key=lambda symbol: results[symbol]["return"])
+            worst = min(results, key=lambda symbol: results[symbol]["return"])
+            self.stdout.write(f"{name}: {len(results)} symbols, {trades} trades, "
+                              f"win rate {wins / trades if trades else 0:.1%}, avg return {average:.2%} "
+                              f"vs buy and hold {buyHold:.2%}, best {best} {results[best]['return']:.2%}, "
+                              f"worst {worst} {results[worst]['return']:.2%}")
+
+        if options["json"]:
+            with open(options["json"], "wb") as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
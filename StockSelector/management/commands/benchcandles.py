@@ -0,0 +1,100 @@
+import asyncio, json, random, time
+import orjson
+from django.core.management.base import BaseCommand, CommandError
+from StockSelector.PackedBars import packBars, unpackBars, barsToDicts
+from StockSelector.RedisPool import RedisPool
+
+def syntheticBars(count):
+    rng = random.Random(5)
+    ts = int(time.time()) // 60 * 60 - count * 60
+    price = 100.0
+    bars = []
+    for _ in range(count):
+        price *= 1 + rng.gauss(0, 0.001)
+        bars.append({
+            'ts': ts,
+            'open': round(price * 0.999, 4),
+            'high': round(price * 1.002, 4),
+            'low': round(price * 0.997, 4),
+            'close': round(price, 4),
+            'volume': rng.randint(100, 50000)
+        })
+        ts += 60
+    return bars
+
+def legacyRequest(candles):
+    # the previous get_allcandles path: LRANGE of JSON strings, json.loads each, json.dumps all
+    candleData = []
+    for candle in candles:
+        candleData.append(json.loads(candle))
+    return json.dumps({"type": "history_candles", "data": candleData, "length": len(candleData)})
+
+def packedRequest(members):
+    candleData = barsToDicts(unpackBars(members)[::-1])
+    return orjson.dumps({"type": "history_candles", "data": candleData, "length": len(candleData)}).decode()
+
+class Command(BaseCommand):
+    help = "Compare JSON list candles with packed sorted set candles: bytes stored and time per history request"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bars", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--redis", action="store_true", help="also measure MEMORY USAGE and round trips against STOCK_REDIS")
+
+    def _time(self, fn, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        return (time.perf_counter() - start) / repeat, result
+
+    def handle(self, *args, **options):
+        bars = syntheticBars(options["bars"])
+        repeat = options["repeat"]
+        legacyCandles = [orjson.dumps(bar).decode() for bar in reversed(bars)]
+        members = packBars(bars)
+        snapshot = packedRequest(members).encode()
+
+        if orjson.loads(legacyRequest(legacyCandles)) != orjson.loads(packedRequest(members)):
+            raise CommandError("packed candles do not round trip to the legacy payload")
+
+        legacyBytes = sum(len(candle) for candle in legacyCandles)
+        packedBytes = sum(len(member) for member in members)
+        self.stdout.write(f"{len(bars)} bars")
+        self.stdout.write(f"stored payload: json list {legacyBytes} B, packed {packedBytes} B ({legacyBytes / packedBytes:.1f}x smaller)")
+
+        legacy, _ = self._time(lambda: legacyRequest(legacyCandles), repeat)
+        packed, _ = self._time(lambda: packedRequest(members), repeat)
+        forwarded, _ = self._time(lambda: snapshot.decode(), repeat)
+        raw, _ = self._time(lambda: unpackBars(members).tobytes(), repeat)
+        self.stdout.write(f"legacy decode + encode: {legacy * 1e6:.0f} us/request")
+        self.stdout.write(f"packed decode + encode: {packed * 1e6:.0f} us/request ({legacy / packed:.1f}x)")
+        self.stdout.write(f"binary frame: {raw * 1e6:.1f} us/request")
+        self.stdout.write(f"pre-serialized snapshot: {forwarded * 1e6:.1f} us/request")
+
+        if options["redis"]:
+            asyncio.run(self._redis(legacyCandles, bars, members, repeat))
+
+    async def _redis(self, legacyCandles, bars, members, repeat):
+        pool = RedisPool.instance()
+        redis = pool.client
+        listKey, setKey = "bench|candles|list", "bench|candles|zset"
+        try:
+            await redis.delete(listKey, setKey)
+            await redis.rpush(listKey, *legacyCandles)
+            await redis.zadd(setKey, {member: bar['ts'] for member, bar in zip(members, bars)})
+            listMemory = await redis.memory_usage(listKey)
+            setMemory = await redis.memory_usage(setKey)
+            self.stdout.write(f"redis MEMORY USAGE: list {listMemory} B, sorted set {setMemory} B")
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                legacyRequest([c.decode() for c in await redis.lrange(listKey, 0, -1)])
+            legacy = (time.perf_counter() - start) / repeat
+            start = time.perf_counter()
+            for _ in range(repeat):
+                packedRequest(await redis.zrange(setKey, 0, -1))
+            packed = (time.perf_counter() - start) / repeat
+            self.stdout.write(f"with round trip: legacy {legacy * 1e6:.0f} us, packed {packed * 1e6:.0f} us")
+        finally:
+            await redis.delete(listKey, setKey)
+            await pool.close()
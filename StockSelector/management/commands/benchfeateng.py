@@ -0,0 +1,69 @@
+import datetime, random, time
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from StockSelector.feateng import FeatureAnalysis, parseTimeSeries, windowAggregates
+
+def legacyAverage(jsonObject, time):
+    # the previous per-column astype / repeated to_datetime implementation, kept as the baseline
+    df = pd.DataFrame.from_dict(jsonObject, orient='index')
+    for col in df.columns:
+        df = df.astype({col: float})
+    end_date = pd.to_datetime(df.index.max())
+    span = pd.Timedelta(days=30) if time == 'monthly_average' else pd.Timedelta(hours=24)
+    start_date = end_date - span
+    return df[(pd.to_datetime(df.index) >= start_date) & (pd.to_datetime(df.index) <= end_date)].mean()
+
+def syntheticSeries(years):
+    rng = random.Random(3)
+    day = datetime.date.today()
+    price = 100.0
+    series = {}
+    while len(series) < years * 252:
+        if day.weekday() < 5:
+            price *= 1 + rng.gauss(0, 0.01)
+            series[day.strftime('%Y-%m-%d')] = {
+                "1. open": f"{price * 0.99:.4f}",
+                "2. high": f"{price * 1.01:.4f}",
+                "3. low": f"{price * 0.98:.4f}",
+                "4. close": f"{price:.4f}",
+                "5. adjusted close": f"{price:.4f}",
+                "6. volume": str(rng.randint(100000, 5000000)),
+                "7. dividend amount": "0.0000",
+                "8. split coefficient": "1.0"
+            }
+        day -= datetime.timedelta(days=1)
+    return series
+
+class Command(BaseCommand):
+    help = "Benchmark Alpha Vantage time series parsing and window averages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def _time(self, fn, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        return (time.perf_counter() - start) / repeat, result
+
+    def handle(self, *args, **options):
+        series = syntheticSeries(options["years"])
+        repeat = options["repeat"]
+        self.stdout.write(f"{len(series)} daily bars")
+
+        legacy, (monthly, daily) = self._time(
+            lambda: (legacyAverage(series, 'monthly_average'), legacyAverage(series, 'daily_average')), repeat)
+        columnar, averages = self._time(lambda: windowAggregates(parseTimeSeries(series)), repeat)
+        analysis = FeatureAnalysis()
+        analysis.averages("SYN", series)
+        cached, _ = self._time(lambda: analysis.averages("SYN", series), repeat)
+
+        for name, expected in (("monthly_average", monthly), ("daily_average", daily)):
+            if not np.allclose(averages[name].to_numpy(), expected.to_numpy(), rtol=1e-9):
+                raise CommandError(f"{name} differs from the legacy implementation")
+
+        self.stdout.write(f"legacy, parsed twice: {legacy * 1000:.1f} ms")
+        self.stdout.write(f"columnar parse + all windows: {columnar * 1000:.1f} ms ({legacy / columnar:.1f}x)")
+        self.stdout.write(f"cached frame + all windows: {cached * 1000:.2f} ms")
@@ -0,0 +1,49 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from StockSelector.Technicals import RollingSMA, StreamingEMA, batchSMA, batchEMA, batchRSI, batchMACD, batchBollinger
+
+def randomCloses(rng, shape):
+    steps = rng.normal(0, 0.01, size=shape)
+    return 100 * np.exp(np.cumsum(steps, axis=-1))
+
+class Command(BaseCommand):
+    # the batch/streaming equivalence checks live in StockSelector/tests.py (manage.py test StockSelector)
+    help = "Benchmark the batch indicators against the streaming classes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--symbols", type=int, default=500)
+        parser.add_argument("--length", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        self._benchmark(rng, options["symbols"], options["length"])
+
+    def _benchmark(self, rng, symbols, length):
+        closes = randomCloses(rng, (symbols, length))
+        self.stdout.write(f"{symbols} symbols x {length} bars")
+
+        start = time.perf_counter()
+        batchSMA(closes, 20)
+        batchEMA(closes, 20)
+        batchRSI(closes, 14)
+        batchMACD(closes)
+        batchBollinger(closes)
+        batch = time.perf_counter() - start
+        self.stdout.write(f"batch sma+ema+rsi+macd+bollinger: {batch * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        batchSMA(closes, 20)
+        batchEMA(closes, 20)
+        batchOnly = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for row in closes:
+            sma = RollingSMA(20)
+            ema = StreamingEMA(20, 2)
+            for price in row:
+                sma.accumulate(price)
+                ema.update(price)
+        loop = time.perf_counter() - start
+        self.stdout.write(f"batch sma+ema: {batchOnly * 1000:.1f} ms, accumulate()/update() loop: {loop * 1000:.1f} ms, speedup {loop / batchOnly:.1f}x")
@@ -0,0 +1,66 @@
+import math, random, time, tracemalloc
+from collections import deque
+from django.core.management.base import BaseCommand
+from StockSelector.Technicals import RollingSMA
+
+class DequeSMA():
+    # the previous deque-backed RollingSMA, kept here as the baseline
+    def __init__(self, window):
+        self.queue = deque(maxlen=window)
+        self.s = 0
+
+    def accumulate(self, price):
+        if len(self.queue) == self.queue.maxlen:
+            self.s -= self.queue.popleft()
+        self.queue.append(price)
+        self.s += price
+        return self.s / len(self.queue)
+
+class Command(BaseCommand):
+    help = "Benchmark RollingSMA update cost, memory for many instances and drift over a trading day"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--instances", type=int, default=10000)
+        parser.add_argument("--window", type=int, default=20)
+        parser.add_argument("--updates", type=int, default=100, help="updates per instance")
+        parser.add_argument("--day", type=int, default=23400, help="bars in the drift run, 1s bars over 6.5h")
+
+    def handle(self, *args, **options):
+        for name, cls in (("deque", DequeSMA), ("ring buffer", RollingSMA)):
+            self._bench(name, cls, options["instances"], options["window"], options["updates"])
+        self._drift(options["window"], options["day"])
+
+    def _bench(self, name, cls, instances, window, updates):
+        prices = [random.uniform(50, 500) for _ in range(window)]
+        tracemalloc.start()
+        smas = [cls(window) for _ in range(instances)]
+        for sma in smas:
+            for price in prices:
+                sma.accumulate(price)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for step in range(updates):
+            price = prices[step % window]
+            for sma in smas:
+                sma.accumulate(price)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name:>12}: {elapsed / (instances * updates) * 1e9:.0f} ns/update, {memory / instances:.0f} bytes/instance at window {window}")
+
+    def _drift(self, window, day):
+        rng = random.Random(11)
+        price = 100.0
+        legacy = DequeSMA(window)
+        ring = RollingSMA(window)
+        history = deque(maxlen=window)
+        worstLegacy = worstRing = 0.0
+        for _ in range(day):
+            price *= 1 + rng.gauss(0, 0.001)
+            # sub-cent noise exposes the cancellation in a long-running add/subtract sum
+            tick = price + rng.uniform(-1e-4, 1e-4) * 1e6
+            history.append(tick)
+            exact = math.fsum(history) / len(history)
+            worstLegacy = max(worstLegacy, abs(legacy.accumulate(tick) - exact))
+            worstRing = max(worstRing, abs(ring.accumulate(tick) - exact))
+        self.stdout.write(f"max drift over {day} bars: deque {worstLegacy:.3e}, ring buffer {worstRing:.3e}")
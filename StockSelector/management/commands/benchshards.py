@@ -0,0 +1,90 @@
+import multiprocessing, os, random, time
+import orjson
+from django.core.management.base import BaseCommand
+from StockSelector.Replay import ReplayFeed
+from StockSelector.Sharding import owner
+
+def shardFrames(symbols, trades, seed):
+    # what the upstream socket sends a worker subscribed to `symbols`: 5 trades per frame
+    rng = random.Random(seed)
+    prices = {symbol: rng.uniform(20, 500) for symbol in symbols}
+    t = 1_700_000_000_000
+    frames = []
+    for _ in range(trades // 5):
+        t += 50
+        data = []
+        for symbol in rng.choices(symbols, k=5):
+            prices[symbol] *= 1 + rng.gauss(0, 0.002)
+            data.append({"s": symbol, "p": round(prices[symbol], 4), "t": t, "v": rng.randint(1, 500)})
+        frames.append(orjson.dumps({"type": "trade", "data": data}))
+    return frames
+
+def shardProcess(symbols, trades, index, barrier, results):
+    import asyncio, django
+    django.setup()
+    frames = shardFrames(symbols, trades, index) if symbols else []
+    feed = ReplayFeed()
+    barrier.wait()
+    start = time.time()
+    stats = asyncio.run(feed.replay(frames))
+    results.put({"worker": index, "symbols": len(symbols), "start": start, "end": time.time(), **stats})
+
+class Command(BaseCommand):
+    help = ("Measure scaling of the sharded pipeline: symbols are rendezvous-hashed over N processes, each parses, "
+            "aggregates bars and computes indicators for its own shard. Reports ticks/s, speedup and rebalance moves")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", default="1,2,4", help="comma separated process counts")
+        parser.add_argument("--symbols", type=int, default=400)
+        parser.add_argument("--trades", type=int, default=400000, help="total trades across all shards")
+        parser.add_argument("--json", help="write the report to this file")
+
+    def _run(self, symbols, count, trades):
+        workers = [f"bench-{idx}" for idx in range(count)]
+        shards = {worker: [] for worker in workers}
+        for symbol in symbols:
+            shards[owner(symbol, workers)].append(symbol)
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(count)
+        results = context.Queue()
+        processes = [
+            context.Process(target=shardProcess, args=(shards[worker], trades * len(shards[worker]) // len(symbols), idx, barrier, results))
+            for idx, worker in enumerate(workers)
+        ]
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        wall = max(r["end"] for r in reports) - min(r["start"] for r in reports)
+        ticks = sum(r["ticks"] for r in reports)
+        return {"workers": count, "ticks": ticks, "seconds": wall, "ticksPerSec": ticks / wall if wall else 0.0,
+                "shardSizes": sorted(r["symbols"] for r in reports)}
+
+    def handle(self, *args, **options):
+        counts = [int(n) for n in options["workers"].split(",") if n.strip()]
+        symbols = [f"SH{idx:05d}" for idx in range(options["symbols"])]
+        if max(counts) > (os.cpu_count() or 1):
+            self.stderr.write(f"Only {os.cpu_count()} cores: runs above that cannot scale")
+        report = []
+        base = None
+        for count in counts:
+            result = self._run(symbols, count, options["trades"])
+            base = base or result["ticksPerSec"] / count
+            result["speedup"] = result["ticksPerSec"] / base if base else 0.0
+            result["efficiency"] = result["speedup"] / count
+            report.append(result)
+            self.stdout.write(f"{count} workers: {result['ticksPerSec']:.0f} ticks/s, speedup {result['speedup']:.2f}x, "
+                              f"efficiency {result['efficiency']:.0%}, shard sizes {result['shardSizes'][0]}-{result['shardSizes'][-1]}")
+
+        # rendezvous hashing: adding a worker should move about 1/(N+1) of the symbols, nothing else
+        for count in counts:
+            before = [f"bench-{idx}" for idx in range(count)]
+            after = before + [f"bench-{count}"]
+            moved = sum(1 for symbol in symbols if owner(symbol, before) != owner(symbol, after))
+            self.stdout.write(f"{count} -> {count + 1} workers moves {moved} of {len(symbols)} symbols "
+                              f"({moved / len(symbols):.1%}, ideal {1 / (count + 1):.1%})")
+
+        if options["json"]:
+            with open(options["json"], "wb") as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
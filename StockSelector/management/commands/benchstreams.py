@@ -0,0 +1,129 @@
+import asyncio, time
+import orjson
+from django.core.management.base import BaseCommand
+from StockSelector.BarStream import barId, isDuplicate
+from StockSelector.FakeRedis import FakeRedis
+from StockSelector.PackedBars import packBars, unpackBars, barsToDicts, readSince
+from StockSelector.RedisPool import RedisPool
+from StockSelector.management.commands.benchcandles import syntheticBars
+
+PREFIX = "bench|streams"
+
+class Command(BaseCommand):
+    help = ("Compare the previous sorted set bar keys with Redis Streams: bar close writes/sec, a reconnect "
+            "catch-up (full history reload vs one XRANGE from the last seen bar), tick appends and memory")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--symbols", type=int, default=200)
+        parser.add_argument("--bars", type=int, default=500, help="history per symbol, also the MAXLEN")
+        parser.add_argument("--missed", type=int, default=5, help="bars a reconnecting client missed")
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--fake", action="store_true", help="run against the in-process FakeRedis instead of STOCK_REDIS")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        pool = RedisPool.install(FakeRedis()) if options["fake"] else RedisPool.instance()
+        redis = pool.client
+        symbols = [f"S{idx:04d}" for idx in range(options["symbols"])]
+        bars = syntheticBars(options["bars"])
+        members = packBars(bars)
+        try:
+            await self._clear(redis, symbols)
+            await self._writes(redis, symbols, bars, members)
+            await self._duplicates(redis, symbols[0], bars, members)
+            await self._catchUp(redis, bars, options["missed"], options["repeat"])
+            await self._ticks(pool, symbols, options["repeat"])
+            if not options["fake"]:
+                zsetMemory = await redis.memory_usage(f"{PREFIX}|zset|{symbols[0]}")
+                streamMemory = await redis.memory_usage(f"{PREFIX}|stream|{symbols[0]}")
+                self.stdout.write(f"MEMORY USAGE for {len(bars)} bars: sorted set {zsetMemory} B, stream {streamMemory} B")
+        finally:
+            await self._clear(redis, symbols)
+            await pool.close()
+
+    async def _clear(self, redis, symbols):
+        keys = [f"{PREFIX}|{kind}|{symbol}" for symbol in symbols for kind in ("zset", "stream", "ticks")]
+        for offset in range(0, len(keys), 1000):
+            await redis.delete(*keys[offset:offset + 1000])
+        await redis.delete(f"{PREFIX}|bus")
+
+    async def _writes(self, redis, symbols, bars, members):
+        # one round trip per close for the sorted set, two for stream then bus, as SymbolEngine._closeBucket sends them
+        maxlen = len(bars)
+        start = time.perf_counter()
+        for bar, member in zip(bars, members):
+            for symbol in symbols:
+                key = f"{PREFIX}|zset|{symbol}"
+                async with redis.pipeline(transaction=True) as pipe:
+                    await pipe.zremrangebyscore(key, bar['ts'], bar['ts'])
+                    await pipe.zadd(key, {member: bar['ts']})
+                    await pipe.zremrangebyrank(key, 0, -maxlen - 1)
+                    await pipe.execute()
+        zsets = time.perf_counter() - start
+        start = time.perf_counter()
+        for bar, member in zip(bars, members):
+            for symbol in symbols:
+                # the bus entry follows only once the bar's own XADD went through
+                added = await redis.xadd(f"{PREFIX}|stream|{symbol}", {"b": member}, id=barId(bar['ts']), maxlen=maxlen, approximate=True)
+                if added:
+                    await redis.xadd(f"{PREFIX}|bus", {"s": symbol, "l": "1m", "b": member}, maxlen=100000, approximate=True)
+        streams = time.perf_counter() - start
+        closes = len(bars) * len(symbols)
+        self.stdout.write(f"{closes} bar closes: sorted set {closes / zsets:.0f}/s, stream + bus {closes / streams:.0f}/s "
+                          f"({zsets / streams:.2f}x)")
+
+    async def _duplicates(self, redis, symbol, bars, members):
+        # a second writer for the same closes (shard handoff, two web workers) must be refused
+        # with the error SymbolEngine recognises, or its bus entries would go out twice
+        async with redis.pipeline(transaction=False) as pipe:
+            for bar, member in zip(bars, members):
+                await pipe.xadd(f"{PREFIX}|stream|{symbol}", {"b": member}, id=barId(bar['ts']))
+            results = await pipe.execute(raise_on_error=False)
+        refused = sum(isDuplicate(result) for result in results)
+        self.stdout.write(f"second writer: {refused} of {len(results)} closes refused as duplicates")
+        if refused != len(results):
+            self.stderr.write("duplicate bar closes were not all recognised, the bus would see them twice")
+
+    async def _catchUp(self, redis, bars, missed, repeat):
+        symbol = "S0000"
+        zsetKey, streamKey = f"{PREFIX}|zset|{symbol}", f"{PREFIX}|stream|{symbol}"
+        since = bars[-missed - 1]['ts']
+
+        async def reload():
+            # what a reconnecting client did before: the whole history again
+            return barsToDicts(unpackBars(await redis.zrange(zsetKey, 0, -1)))
+
+        async def resume():
+            return barsToDicts(await readSince(redis, streamKey, since))
+
+        full, delta = await reload(), await resume()
+        if delta != full[-missed:]:
+            self.stderr.write("stream catch-up does not match the tail of the full reload")
+        results = {}
+        for name, fn in (("reload", reload), ("resume", resume)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                payload = orjson.dumps(await fn())
+            results[name] = ((time.perf_counter() - start) / repeat, len(payload))
+        (reloadTime, reloadBytes), (resumeTime, resumeBytes) = results["reload"], results["resume"]
+        self.stdout.write(f"reconnect after {missed} missed bars: full reload {reloadTime * 1e6:.0f} us / {reloadBytes} B, "
+                          f"XRANGE catch-up {resumeTime * 1e6:.0f} us / {resumeBytes} B ({reloadTime / resumeTime:.1f}x)")
+
+    async def _ticks(self, pool, symbols, repeat):
+        # one frame's trades per symbol, appended through the auto-batcher like FinnhubFeed does
+        frame = orjson.dumps([[100.0, int(time.time() * 1000), 10.0]] * 4)
+        before = pool.batch.stats["batches"]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for symbol in symbols:
+                pool.batch.send("xadd", f"{PREFIX}|ticks|{symbol}", {"d": frame}, maxlen=10000, approximate=True)
+            await asyncio.sleep(0)
+            while pool.batch.tasks or pool.batch.queue:
+                await asyncio.gather(*pool.batch.tasks)
+                await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        appends = repeat * len(symbols)
+        self.stdout.write(f"{appends} tick appends in {pool.batch.stats['batches'] - before} pipelines: {appends / elapsed:.0f}/s, "
+                          f"{pool.batch.stats['failed']} failed")
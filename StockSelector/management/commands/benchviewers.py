@@ -0,0 +1,45 @@
+import asyncio, random, time
+from django.core.management.base import BaseCommand
+from StockSelector.SymbolEngine import SymbolEngine
+
+class Command(BaseCommand):
+    help = "Compare indicator CPU cost with one engine per viewer against one shared engine per symbol"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--symbols", type=int, default=10)
+        parser.add_argument("--viewers", default="1,10,50,100", help="comma separated viewers per symbol")
+        parser.add_argument("--trades", type=int, default=3000, help="trades per symbol, 100 ms apart")
+
+    def handle(self, *args, **options):
+        tape = self._tape(options["symbols"], options["trades"])
+        for viewers in [int(v) for v in options["viewers"].split(",")]:
+            perViewer = asyncio.run(self._run(tape, options["symbols"], viewers))
+            shared = asyncio.run(self._run(tape, options["symbols"], 1))
+            self.stdout.write(
+                f"{viewers:>5} viewers/symbol: per-connection {perViewer * 1000:.1f} ms CPU, "
+                f"shared {shared * 1000:.1f} ms CPU, {perViewer / shared:.1f}x"
+            )
+
+    def _tape(self, symbols, trades):
+        rng = random.Random(5)
+        start = int(time.time()) // 3600 * 3600 * 1000
+        tape = []
+        for idx in range(symbols):
+            price = rng.uniform(20, 500)
+            for step in range(trades):
+                price *= 1 + rng.gauss(0, 0.0005)
+                tape.append((f"SYM{idx}", price, start + step * 100, rng.randint(1, 500)))
+        tape.sort(key=lambda trade: trade[2])
+        return tape
+
+    async def _run(self, tape, symbols, enginesPerSymbol):
+        # 1s bars so a bucket closes every ten trades
+        engines = {f"SYM{idx}": [SymbolEngine(f"SYM{idx}", intervals=["1s", "1m"]) for _ in range(enginesPerSymbol)]
+                   for idx in range(symbols)}
+        start = time.process_time()
+        for symbol, price, ts, vol in tape:
+            for engine in engines[symbol]:
+                closed = engine.addTrade(price, ts, vol)
+                if closed:
+                    await engine._closeBucket(closed)
+        return time.process_time() - start
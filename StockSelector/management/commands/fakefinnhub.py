@@ -0,0 +1,63 @@
+import asyncio, contextlib
+from django.core.management.base import BaseCommand
+from channels.layers import InMemoryChannelLayer
+from StockSelector.FakeFinnhub import FakeFinnhubServer
+from StockSelector.FinnhubFeed import FinnhubFeed
+
+class Command(BaseCommand):
+    help = "Run a local fake Finnhub trade websocket, optionally driving a shared feed with simulated clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--rate", type=float, default=10, help="trade frames per second")
+        parser.add_argument("--clients", type=int, default=0, help="simulated browser clients; 0 only serves")
+        parser.add_argument("--symbols", default="AAPL,MSFT,NVDA,AMZN,TSLA")
+        parser.add_argument("--duration", type=float, default=10)
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        server = await FakeFinnhubServer(options["host"], options["port"], options["rate"]).start()
+        self.stdout.write(f"Fake Finnhub listening on {server.url}")
+        try:
+            if options["clients"] > 0:
+                await self._simulate(server, options)
+            else:
+                await asyncio.Future()
+        finally:
+            await server.stop()
+
+    async def _simulate(self, server, options):
+        symbols = [s.strip() for s in options["symbols"].split(",") if s.strip()]
+        layer = InMemoryChannelLayer(capacity=10000)
+        feed = FinnhubFeed(url=server.url, channelLayer=layer, persist=False)
+        received = {}
+
+        async def client(idx):
+            symbol = symbols[idx % len(symbols)]
+            channel = await layer.new_channel()
+            received[channel] = 0
+            await feed.join(symbol, channel)
+            try:
+                while True:
+                    await layer.receive(channel)
+                    received[channel] += 1
+            finally:
+                await feed.leave(symbol, channel)
+
+        tasks = [asyncio.create_task(client(i)) for i in range(options["clients"])]
+        await asyncio.sleep(options["duration"])
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(BaseException):
+                await task
+
+        counts = sorted(received.values())
+        self.stdout.write(f"clients: {len(counts)}, symbols: {len(symbols)}")
+        self.stdout.write(f"upstream connections: {server.stats['connections']}, subscribes: {server.stats['subscribes']}, unsubscribes: {server.stats['unsubscribes']}")
+        self.stdout.write(f"upstream frames: {server.stats['framesSent']}, feed messages parsed: {feed.stats['messages']}")
+        if counts:
+            self.stdout.write(f"deliveries per client: min {counts[0]}, median {counts[len(counts) // 2]}, max {counts[-1]}")
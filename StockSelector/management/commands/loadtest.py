@@ -0,0 +1,205 @@
+import asyncio, contextlib, json, tempfile, time, tracemalloc
+import orjson
+from channels.layers import InMemoryChannelLayer, channel_layers
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from StockSelector import StockState as stockState
+from StockSelector.BarStore import BarStore
+from StockSelector.FakeFinnhub import FakeFinnhubServer
+from StockSelector.FakeRedis import FakeRedis
+from StockSelector.FinnhubFeed import FinnhubFeed
+from StockSelector.OpeningPrices import OPEN_TTL, openKey
+from StockSelector.RateLimiter import LocalTokenBucket, RequestScheduler
+from StockSelector.RedisPool import RedisPool
+
+# defaults for the CI run (200 clients, 20 symbols, 20 trades/s each, 250 ms coalescing);
+# roughly 5x the numbers measured on a laptop so only real regressions trip them. CPU is the
+# exception: a 1-CPU container measured 0.7-1.0 cores per 1k clients, so it gets 2x. One process
+# tops out at one core, 1000 / clients per 1k, so maxCpuCores also fails a saturated loop
+THRESHOLDS = {
+    "p99Ms": 500,
+    "cpuCoresPer1k": 2.0,
+    "maxCpuCores": 0.9,
+    "memKbPerConnection": 128,
+    "minFramesPerClientSec": 3.0,
+    **getattr(settings, "STOCK_LOADTEST_THRESHOLDS", {})
+}
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class SimClient():
+    # a browser tab on ws/stock/<symbol>/, driven straight through the ASGI app
+    def __init__(self, application, symbol, server, latencies):
+        self.application = application
+        self.symbol = symbol
+        self.server = server
+        self.latencies = latencies
+        self.frames = 0
+        self.closed = None
+        self.input = asyncio.Queue()
+        self.output = asyncio.Queue()
+        self.task = None
+        self.reader = None
+
+    async def connect(self, timeout=10):
+        scope = {
+            "type": "websocket",
+            "path": f"/ws/stock/{self.symbol}/",
+            "raw_path": f"/ws/stock/{self.symbol}/".encode(),
+            "query_string": b"",
+            "headers": [(b"host", b"loadtest")],
+            "subprotocols": [],
+            "client": ("127.0.0.1", 0),
+            "server": ("loadtest", 80)
+        }
+        self.task = asyncio.create_task(self.application(scope, self.input.get, self.output.put))
+        await self.input.put({"type": "websocket.connect"})
+        message = await asyncio.wait_for(self.output.get(), timeout)
+        if message["type"] != "websocket.accept":
+            raise CommandError(f"{self.symbol}: connection refused {message}")
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            message = await self.output.get()
+            if message["type"] == "websocket.close":
+                self.closed = message.get("code")
+                return
+            text = message.get("text")
+            if not text:
+                continue
+            received = time.perf_counter()
+            self.frames += 1
+            frame = orjson.loads(text)
+            price = frame.get("price") if isinstance(frame, dict) else None
+            if price is None:
+                continue
+            sent = self.server.sentAt.get(frame.get("symbol"), {}).get(price)
+            if sent is not None:
+                self.latencies.append(received - sent)
+
+    async def close(self):
+        await self.input.put({"type": "websocket.disconnect", "code": 1000})
+        for task in (self.task, self.reader):
+            if task is None:
+                continue
+            with contextlib.suppress(BaseException):
+                await asyncio.wait_for(task, 5)
+
+class Command(BaseCommand):
+    help = ("Load test the live websocket path: fake Finnhub trades -> shared feed -> N StockState clients. "
+            "Reports tick latency percentiles, CPU per 1k clients and memory per connection; --ci fails on regressions")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=200)
+        parser.add_argument("--symbols", type=int, default=20)
+        parser.add_argument("--rate", type=float, default=20, help="trades per second per symbol")
+        parser.add_argument("--duration", type=float, default=10, help="measured seconds")
+        parser.add_argument("--warmup", type=float, default=2)
+        parser.add_argument("--redis", choices=["fake", "real"], default="fake", help="real uses STOCK_REDIS")
+        parser.add_argument("--layer", choices=["memory", "settings"], default="memory", help="channel layer")
+        parser.add_argument("--ci", action="store_true", help="exit non-zero when a threshold is missed")
+        parser.add_argument("--thresholds", help="JSON file overriding the default thresholds")
+        parser.add_argument("--json", help="write the report to this file")
+
+    def handle(self, *args, **options):
+        thresholds = dict(THRESHOLDS)
+        if options["thresholds"]:
+            with open(options["thresholds"]) as f:
+                thresholds.update(json.load(f))
+        # the bar store the engines write closes to goes away with the run
+        with tempfile.TemporaryDirectory(prefix="loadtest-bars-") as storeDir:
+            report = asyncio.run(self._run(options, storeDir))
+        for name, value in report.items():
+            self.stdout.write(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+        if options["json"]:
+            with open(options["json"], "wb") as f:
+                f.write(orjson.dumps({"report": report, "thresholds": thresholds}, option=orjson.OPT_INDENT_2))
+        if options["ci"]:
+            failures = self._check(report, thresholds)
+            if failures:
+                raise CommandError("Load test regressions: " + "; ".join(failures))
+            self.stdout.write("All load test thresholds met")
+
+    def _check(self, report, thresholds):
+        failures = []
+        if report["latencyP99Ms"] is None or report["latencyP99Ms"] > thresholds["p99Ms"]:
+            failures.append(f"p99 latency {report['latencyP99Ms']} ms > {thresholds['p99Ms']}")
+        if report["cpuCoresPer1k"] > thresholds["cpuCoresPer1k"]:
+            failures.append(f"{report['cpuCoresPer1k']:.3f} cores per 1k clients > {thresholds['cpuCoresPer1k']}")
+        if report["cpuCores"] > thresholds["maxCpuCores"]:
+            failures.append(f"{report['cpuCores']:.3f} cores used by the event loop > {thresholds['maxCpuCores']}, it is saturated")
+        if report["memKbPerConnection"] > thresholds["memKbPerConnection"]:
+            failures.append(f"{report['memKbPerConnection']:.1f} KB per connection > {thresholds['memKbPerConnection']}")
+        if report["framesPerClientSec"] < thresholds["minFramesPerClientSec"]:
+            failures.append(f"{report['framesPerClientSec']:.2f} frames per client per second < {thresholds['minFramesPerClientSec']}")
+        if report["droppedClients"]:
+            failures.append(f"{report['droppedClients']} clients were disconnected")
+        return failures
+
+    async def _run(self, options, storeDir):
+        from stonksRec.asgi import application
+
+        symbols = [f"LT{idx:04d}" for idx in range(options["symbols"])]
+        BarStore._default = BarStore(storeDir)
+        stockState.FINNHUB_API_KEY = stockState.FINNHUB_API_KEY or "loadtest"
+        if options["layer"] == "memory":
+            channel_layers.set("default", InMemoryChannelLayer(capacity=1000))
+
+        if options["redis"] == "fake":
+            redis = RedisPool.install(FakeRedis()).client
+        else:
+            redis = RedisPool.instance().client
+        # opening prices come from the warmup keys, as they would after warmopens
+        async with redis.pipeline(transaction=False) as pipe:
+            for symbol in symbols:
+                await pipe.setex(openKey(symbol), OPEN_TTL, 100.0)
+            await pipe.execute()
+
+        server = await FakeFinnhubServer("127.0.0.1", 0, options["rate"], trackPrices=256).start()
+        feed = FinnhubFeed(url=server.url, redis=redis, scheduler=RequestScheduler(LocalTokenBucket(1e9, 1e9)))
+        feed.loop = asyncio.get_running_loop()
+        FinnhubFeed._instance = feed
+
+        latencies = []
+        clients = [SimClient(application, symbols[idx % len(symbols)], server, latencies) for idx in range(options["clients"])]
+        try:
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            for offset in range(0, len(clients), 100):
+                await asyncio.gather(*(client.connect() for client in clients[offset:offset + 100]))
+            perConnection = (tracemalloc.get_traced_memory()[0] - before) / max(len(clients), 1)
+            tracemalloc.stop()
+
+            await asyncio.sleep(options["warmup"])
+            latencies.clear()
+            frames = sum(client.frames for client in clients)
+            cpu, wall = time.process_time(), time.perf_counter()
+            await asyncio.sleep(options["duration"])
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            frames = sum(client.frames for client in clients) - frames
+        finally:
+            await asyncio.gather(*(client.close() for client in clients))
+            await feed.close()
+            await server.stop()
+            await RedisPool.instance().close()
+
+        return {
+            "clients": len(clients),
+            "symbols": len(symbols),
+            "tradesPerSymbolSec": options["rate"],
+            "upstreamTrades": server.stats["tradesSent"],
+            "latencySamples": len(latencies),
+            "latencyP50Ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "latencyP95Ms": percentile(latencies, 95) * 1000 if latencies else None,
+            "latencyP99Ms": percentile(latencies, 99) * 1000 if latencies else None,
+            "framesPerClientSec": frames / wall / max(len(clients), 1),
+            "cpuCores": cpu / wall,
+            "cpuCoresPer1k": cpu / wall / max(len(clients), 1) * 1000,
+            "memKbPerConnection": perConnection / 1024,
+            "droppedClients": sum(1 for client in clients if client.closed is not None)
+        }
@@ -0,0 +1,33 @@
+import asyncio, contextlib, signal
+from django.core.management.base import BaseCommand
+from StockSelector.MarketData import MarketDataClient
+from StockSelector.RedisPool import RedisPool
+from StockSelector.Sharding import SHARDS, ShardWorker
+
+class Command(BaseCommand):
+    help = ("Run one shard worker: owns the upstream subscription, bars and indicators for the symbols that "
+            "hash to it and publishes them through the channel layer. Start one per core with STOCK_SHARDS enabled")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--id", help="stable worker id, defaults to host-pid")
+
+    def handle(self, *args, **options):
+        if not SHARDS["enabled"]:
+            self.stderr.write("STOCK_SHARDS is not enabled: web processes still run their own feed")
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        worker = ShardWorker(options["id"])
+        task = asyncio.current_task()
+        with contextlib.suppress(NotImplementedError):
+            # SIGTERM hands the symbols over at once instead of after the heartbeat TTL
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        self.stdout.write(f"Shard worker {worker.workerId} started")
+        try:
+            await worker.run()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await MarketDataClient.instance().close()
+            await RedisPool.instance().close()
+            self.stdout.write(f"Shard worker {worker.workerId} stopped")
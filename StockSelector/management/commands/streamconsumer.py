@@ -0,0 +1,74 @@
+import asyncio, contextlib, os, signal, socket, time
+import orjson
+from django.core.management.base import BaseCommand
+from StockSelector.Backtest import STRATEGIES, Backtest
+from StockSelector.BarStream import STREAMS, BUS_KEY, StreamGroup
+from StockSelector.PackedBars import unpackBars, barsToDicts
+from StockSelector.RedisPool import RedisPool
+
+class Command(BaseCommand):
+    help = ("Run one consumer of a consumer group on the bar bus. Consumers in the same group split the "
+            "entries, separate groups each see all of them; unacked entries of a dead consumer are claimed")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", default=STREAMS["group"])
+        parser.add_argument("--consumer", help="defaults to host-pid, reuse it to pick up this consumer's pending entries")
+        parser.add_argument("--handler", choices=["count", "signals"], default="count",
+                            help="count logs bars/sec per interval, signals runs the backtest strategies live")
+        parser.add_argument("--strategy", default="ema_sma,rsi", help=f"for --handler signals, any of {', '.join(STRATEGIES)}")
+        parser.add_argument("--start", default="$", help="where a new group starts reading, 0 for the whole stream")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    def _counter(self):
+        counts = {}
+        window = [time.time()]
+
+        async def handler(entryId, fields):
+            label = fields[b"l"].decode()
+            counts[label] = counts.get(label, 0) + 1
+            elapsed = time.time() - window[0]
+            if elapsed >= 10:
+                rates = ", ".join(f"{label} {count / elapsed:.1f}/s" for label, count in sorted(counts.items()))
+                self.stdout.write(f"bars: {rates}")
+                counts.clear()
+                window[0] = time.time()
+        return handler
+
+    def _signals(self, strategies):
+        backtest = Backtest(strategies)
+
+        async def handler(entryId, fields):
+            if b"i" not in fields:
+                return
+            symbol = fields[b"s"].decode()
+            bar = barsToDicts(unpackBars([fields[b"b"]]))[0]
+            before = {key: book[1].entry for key, book in backtest.books.items() if key[1] == symbol}
+            backtest.onBars({"symbol": symbol, "bars": [[fields[b"l"].decode(), bar]], "indicators": orjson.loads(fields[b"i"])})
+            for (name, bookSymbol), (_, position) in backtest.books.items():
+                if bookSymbol != symbol or before.get((name, symbol)) == position.entry:
+                    continue
+                side = "buy" if position.entry is not None else "sell"
+                self.stdout.write(f"{name} {side} {symbol} at {bar['close']} (bar {bar['ts']})")
+        return handler
+
+    async def _run(self, options):
+        consumer = options["consumer"] or f"{socket.gethostname()}-{os.getpid()}"
+        if options["handler"] == "signals":
+            handler = self._signals([name.strip() for name in options["strategy"].split(",") if name.strip() in STRATEGIES])
+        else:
+            handler = self._counter()
+        pool = RedisPool.instance()
+        group = StreamGroup(pool.client, BUS_KEY, handler, options["group"], consumer)
+        task = asyncio.current_task()
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        self.stdout.write(f"Consumer {consumer} of group {group.group} on {BUS_KEY}")
+        try:
+            await group.run(options["start"])
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await pool.close()
+            self.stdout.write(f"Consumer {consumer} stopped: {group.stats}")
@@ -0,0 +1,67 @@
+import asyncio, time
+import requests
+from django.core.management.base import BaseCommand
+from StockSelector.MarketData import MarketDataClient
+from StockSelector.RateLimiter import LocalTokenBucket, RequestScheduler
+from StockSelector.StubMarketData import StubMarketDataServer
+
+class Command(BaseCommand):
+    help = "Serve stub Finnhub/Alpha Vantage endpoints, or benchmark blocking against async fetches on them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8766)
+        parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every response")
+        parser.add_argument("--bench", type=int, default=0, help="concurrent metric requests to time; 0 only serves")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        server = await StubMarketDataServer(options["host"], options["port"], options["latency"]).start()
+        self.stdout.write(f"Stub market data on FINNHUB_URL={server.finnhubUrl} ALPHAVANTAGE_URL={server.alphavantageUrl}")
+        try:
+            if options["bench"] > 0:
+                await self._bench(server, options["bench"])
+            else:
+                await asyncio.Future()
+        finally:
+            await server.stop()
+
+    def _blockingFetch(self, server, symbol):
+        # the call pattern the view used before: four sequential blocking requests
+        requests.get(f"{server.finnhubUrl}/stock/metric", params={'symbol': symbol, 'metric': 'all'})
+        requests.get(server.alphavantageUrl, params={'function': 'TIME_SERIES_DAILY_ADJUSTED', 'symbol': symbol})
+        requests.get(f"{server.finnhubUrl}/calendar/earnings", params={'symbol': symbol})
+        requests.get(f"{server.finnhubUrl}/stock/profile2", params={'symbol': symbol})
+
+    async def _asyncFetch(self, client, symbol):
+        await asyncio.gather(
+            client.basicFinancials(symbol),
+            client.timeSeries(symbol, 'daily'),
+            client.earningsCalendar(symbol),
+            client.companyProfile(symbol)
+        )
+
+    async def _bench(self, server, count):
+        start = time.perf_counter()
+        await asyncio.to_thread(self._blockingFetch, server, "AAPL")
+        blocking = time.perf_counter() - start
+
+        # the stub has no quota, so give the client unlimited local buckets
+        schedulers = {provider: RequestScheduler(LocalTokenBucket(1e9, 1e9)) for provider in ("finnhub", "alphavantage")}
+        client = MarketDataClient(finnhubUrl=server.finnhubUrl, alphavantageUrl=server.alphavantageUrl, schedulers=schedulers)
+        try:
+            start = time.perf_counter()
+            await self._asyncFetch(client, "AAPL")
+            single = time.perf_counter() - start
+
+            start = time.perf_counter()
+            await asyncio.gather(*(self._asyncFetch(client, f"SYM{idx}") for idx in range(count)))
+            burst = time.perf_counter() - start
+        finally:
+            await client.close()
+
+        self.stdout.write(f"one request, blocking sequential: {blocking * 1000:.0f} ms")
+        self.stdout.write(f"one request, async concurrent: {single * 1000:.0f} ms")
+        self.stdout.write(f"{count} concurrent requests on one event loop: {burst * 1000:.0f} ms")
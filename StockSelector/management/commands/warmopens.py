@@ -0,0 +1,73 @@
+import asyncio, datetime, time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from StockSelector.MarketData import MarketDataClient
+from StockSelector.OpeningPrices import OpeningPrices, watchedSymbols
+from StockSelector.RedisPool import RedisPool
+
+class Command(BaseCommand):
+    help = ("Prefetch opening prices (previous close) for the watched-symbol universe into stock|SYM|open|DATE. "
+            "Run it from cron before the open, or keep it running with --daily HH:MM")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--symbols", default="", help="comma separated symbols added to the universe")
+        parser.add_argument("--file", help="file with one symbol per line added to the universe")
+        parser.add_argument("--days", type=int, default=30, help="include symbols watched within this many days")
+        parser.add_argument("--date", help="YYYY-MM-DD key date, defaults to today")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--batch", type=int, default=200, help="symbols per MGET / SETEX pipeline")
+        parser.add_argument("--force", action="store_true", help="refetch symbols that are already cached")
+        parser.add_argument("--daily", help="stay running and warm every weekday at HH:MM local time")
+
+    def handle(self, *args, **options):
+        day = None
+        if options["date"]:
+            try:
+                day = datetime.date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD")
+        asyncio.run(self._run(options, day))
+
+    async def _universe(self, redis, options):
+        symbols = dict.fromkeys(getattr(settings, "STOCK_UNIVERSE", []))
+        symbols.update(dict.fromkeys(s.strip() for s in options["symbols"].split(",") if s.strip()))
+        if options["file"]:
+            with open(options["file"]) as f:
+                symbols.update(dict.fromkeys(line.strip() for line in f if line.strip()))
+        try:
+            symbols.update(dict.fromkeys(await watchedSymbols(redis, options["days"])))
+        except Exception as err:
+            self.stderr.write(f"Could not read the watched-symbol universe: {err}")
+        return list(symbols)
+
+    async def _warm(self, redis, options, day):
+        symbols = await self._universe(redis, options)
+        start = time.perf_counter()
+        stats = await OpeningPrices.warm(redis, symbols, day, options["concurrency"], options["batch"], options["force"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{stats['symbols']} symbols: {stats['cached']} already cached, "
+                          f"{stats['fetched']} fetched, {stats['failed']} failed in {elapsed:.1f}s")
+        return stats
+
+    async def _run(self, options, day):
+        pool = RedisPool.instance()
+        try:
+            if not options["daily"]:
+                await self._warm(pool.client, options, day)
+                return
+            at = datetime.time.fromisoformat(options["daily"])
+            while True:
+                now = datetime.datetime.now()
+                target = datetime.datetime.combine(now.date(), at)
+                if target <= now:
+                    target += datetime.timedelta(days=1)
+                while target.weekday() >= 5:
+                    target += datetime.timedelta(days=1)
+                await asyncio.sleep((target - now).total_seconds())
+                try:
+                    await self._warm(pool.client, options, None)
+                except Exception as err:
+                    self.stderr.write(f"Warmup failed: {err}")
+        finally:
+            await MarketDataClient.instance().close()
+            await pool.close()
@@ -34,7 +34,6 @@ class UserLogin(models.Model):
                 return user_id
     
     def save(self, *args, **kwargs):
-        print('yes')
         if not self.userID:
             self.userID = self.generate_user_id()
         self.full_clean()
@@ -1,6 +1,8 @@
 from django.urls import path
 from .StockState import StockState
+from .WatchlistState import WatchlistState
 
 websocket_urlpatterns = [
-    path("ws/stock/<str:stockTick>/", StockState.as_asgi())
+    path("ws/stock/<str:stockTick>/", StockState.as_asgi()),
+    path("ws/watchlist/", WatchlistState.as_asgi())
 ]
\ No newline at end of file
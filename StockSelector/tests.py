@@ -1,3 +1,517 @@
-from django.test import TestCase
+import asyncio, os, shutil, tempfile
+from unittest import mock
+import numpy as np
+import orjson
+from django.test import RequestFactory, SimpleTestCase
+from StockSelector.Technicals import RollingSMA, StreamingEMA, RSI, MACD, BollingerBands, batchSMA, batchEMA, batchRSI, batchMACD, batchBollinger
+from StockSelector.BarBuilder import BarBuilder
+from StockSelector.BarStore import BarStore, symbolDir
+from StockSelector.BarStream import barKey, barId
+from StockSelector.FakeRedis import FakeRedis
+from StockSelector.FinnhubFeed import FinnhubFeed
+from StockSelector.MarketData import validSymbol
+from StockSelector.PackedBars import packBars, unpackBars, barsToDicts, readBars, readSince
+from StockSelector.RateLimiter import LocalTokenBucket, RequestScheduler, SimulatedClock
+from StockSelector.Replay import ReplayLayer, tapeFiles
+from StockSelector.ResponseCache import ResponseCache
+from StockSelector.Screener import SCREENER, ScreenerSnapshot
+from StockSelector.StockState import StockState, REQUEST_FAILED
+from StockSelector.SymbolEngine import SymbolEngine
+from StockSelector.TapeRecorder import TapeRecorder, TapeReader
+from StockSelector import views
 
-# Create your tests here.
+def randomCloses(rng, shape):
+    steps = rng.normal(0, 0.01, size=shape)
+    return 100 * np.exp(np.cumsum(steps, axis=-1))
+
+def streamSMA(closes, window):
+    sma = RollingSMA(window)
+    return np.array([sma.accumulate(price) for price in closes])
+
+def streamEMA(closes, period):
+    ema = StreamingEMA(period, 2)
+    return np.array([ema.update(price) for price in closes])
+
+def streamRSI(closes, period):
+    rsi = RSI(period)
+    return np.array([np.nan if value is None else value for value in map(rsi.update, closes)])
+
+def streamMACD(closes):
+    macd = MACD()
+    return np.array([macd.update(price) for price in closes]).reshape(-1, 3).T
+
+def streamBollinger(closes, window):
+    bands = BollingerBands(window)
+    return np.array([bands.update(price) for price in closes]).reshape(-1, 3).T
+
+def bar(ts, close, volume=1.0):
+    return {'ts': ts, 'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': volume}
+
+class IndicatorEquivalenceTests(SimpleTestCase):
+    # randomised but seeded, so a failing case reproduces: walks, flat series and wide noise,
+    # windows from 0 (degenerate) up, every batch function against its streaming class
+    seed = 7
+    trials = 300
+    tolerance = 1e-9
+
+    def _cases(self, rng):
+        for _ in range(self.trials):
+            length = int(rng.integers(1, 400))
+            window = int(rng.integers(0, 60))
+            kind = rng.integers(0, 3)
+            if kind == 0:
+                closes = randomCloses(rng, length)
+            elif kind == 1:
+                closes = np.full(length, float(rng.uniform(1, 500)))
+            else:
+                closes = rng.uniform(1, 1e6, size=length)
+            yield closes, window
+
+    def assertSeries(self, batch, stream, msg):
+        np.testing.assert_array_equal(np.isnan(batch), np.isnan(stream), err_msg=msg)
+        err = np.abs(batch - stream) / np.maximum(np.abs(stream), 1)
+        self.assertLessEqual(float(np.nanmax(err, initial=0)), self.tolerance, msg)
+
+    def test_streaming_matches_batch(self):
+        rng = np.random.default_rng(self.seed)
+        for trial, (closes, window) in enumerate(self._cases(rng)):
+            period = max(window, 1)
+            msg = f"trial {trial}: {len(closes)} closes, window {window}"
+            self.assertSeries(batchSMA(closes, window), streamSMA(closes, window), f"sma {msg}")
+            self.assertSeries(batchEMA(closes, window), streamEMA(closes, window), f"ema {msg}")
+            self.assertSeries(batchRSI(closes, period), streamRSI(closes, period), f"rsi {msg}")
+            self.assertSeries(np.vstack(batchMACD(closes)), streamMACD(closes), f"macd {msg}")
+            self.assertSeries(np.vstack(batchBollinger(closes, window)), streamBollinger(closes, window), f"bollinger {msg}")
+
+    def test_rows_match_single_symbols(self):
+        grid = randomCloses(np.random.default_rng(self.seed), (8, 300))
+        for name, fn in (("sma", lambda c: batchSMA(c, 20)), ("ema", lambda c: batchEMA(c, 20)),
+                         ("rsi", lambda c: batchRSI(c, 14)), ("macd", lambda c: batchMACD(c)[0]),
+                         ("bollinger", lambda c: batchBollinger(c)[1])):
+            rows = np.vstack([fn(row) for row in grid])
+            np.testing.assert_allclose(fn(grid), rows, rtol=0, atol=self.tolerance, err_msg=name)
+
+class BarBuilderTests(SimpleTestCase):
+    start = 1700000100 // 300 * 300
+
+    def _trade(self, builder, offset, price, vol=1):
+        return builder.addTrade(price, (self.start + offset) * 1000, vol)
+
+    def test_five_minutes_roll_up_from_one_minute_bars(self):
+        builder = BarBuilder(["1m", "5m"])
+        closed = []
+        for minute, price in enumerate([10, 12, 9, 11, 13]):
+            closed += self._trade(builder, minute * 60, price, 2)
+            closed += self._trade(builder, minute * 60 + 30, price + 0.5, 1)
+        # the 5m bar closes with the last 1m bar folded into it
+        closed += builder.closeDue(self.start + 301)
+        minutes = [b for label, b in closed if label == "1m"]
+        fives = [b for label, b in closed if label == "5m"]
+        self.assertEqual([b['ts'] - self.start for b in minutes], [0, 60, 120, 180, 240])
+        self.assertEqual(minutes[0], {'ts': self.start, 'open': 10, 'high': 10.5, 'low': 10, 'close': 10.5, 'volume': 3})
+        self.assertEqual(fives, [{'ts': self.start, 'open': 10, 'high': 13.5, 'low': 9, 'close': 13.5, 'volume': 15}])
+
+    def test_close_due_waits_for_the_close_delay(self):
+        builder = BarBuilder(["1m"], closeDelay=1)
+        self._trade(builder, 5, 10)
+        self.assertEqual(builder.closeDue(self.start + 60), [])
+        closed = builder.closeDue(self.start + 61)
+        self.assertEqual([(label, b['ts']) for label, b in closed], [("1m", self.start)])
+
+    def test_late_trade_goes_into_the_next_bar(self):
+        builder = BarBuilder(["1m"])
+        self._trade(builder, 5, 10)
+        builder.closeDue(self.start + 120)
+        self._trade(builder, 30, 11)
+        closed = builder.closeDue(self.start + 600)
+        self.assertEqual(closed[0][1]['ts'], self.start + 60)
+        self.assertEqual(closed[0][1]['close'], 11)
+
+class SymbolEngineSeedTests(SimpleTestCase):
+    def test_seeded_ema_matches_the_full_history(self):
+        closes = randomCloses(np.random.default_rng(3), 120)
+        engine = SymbolEngine("AAA")
+        engine.seed(closes.tolist())
+        period = engine.ind_periods['ema']
+        self.assertAlmostEqual(engine.ema.ema, streamEMA(closes, period)[-1], places=9)
+        self.assertAlmostEqual(engine.ema.ema, batchEMA(closes, period)[-1], places=9)
+
+class RecordingLayer(ReplayLayer):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    async def group_send(self, group, message):
+        await super().group_send(group, message)
+        self.messages.append(message)
+
+def tradeFrame(*trades):
+    return orjson.dumps({"type": "trade", "data": [{"s": symbol, "p": price, "t": ts, "v": vol} for symbol, price, ts, vol in trades]})
+
+class FeedCoalescingTests(SimpleTestCase):
+    def _feed(self, coalesce=True):
+        layer = RecordingLayer()
+        feed = FinnhubFeed(url="test://", channelLayer=layer, persist=False, coalesce=coalesce)
+        feed.engines["AAA"] = SymbolEngine("AAA")
+        return feed, layer
+
+    async def _trade(self, feed):
+        await feed._dispatch(tradeFrame(("AAA", 10.0, 1000, 1), ("AAA", 12.0, 1001, 2)))
+        await feed._dispatch(tradeFrame(("AAA", 9.0, 1002, 3), ("BBB", 50.0, 1002, 1)))
+        await feed._dispatch(tradeFrame(("AAA", 11.0, 1003, 4)))
+
+    async def test_one_quote_per_symbol_and_window(self):
+        feed, layer = self._feed()
+        await self._trade(feed)
+        self.assertEqual(layer.messages, [])
+        await feed.flushQuotes()
+        self.assertEqual([message["type"] for message in layer.messages], ["stock.quote"])
+        quote = layer.messages[0]["quote"]
+        self.assertEqual((quote["price"], quote["high"], quote["low"], quote["volume"], quote["ticks"]), (11.0, 12.0, 9.0, 10.0, 4))
+        self.assertEqual(orjson.loads(layer.messages[0]["frame"]), quote)
+        await feed.flushQuotes()
+        self.assertEqual(len(layer.messages), 1)
+
+    async def test_uncoalesced_feed_sends_every_frame(self):
+        feed, layer = self._feed(coalesce=False)
+        await self._trade(feed)
+        self.assertEqual([message["type"] for message in layer.messages], ["stock.trades"] * 3)
+
+class QuietFeed(FinnhubFeed):
+    # no upstream socket: refcounting and engine lifetime only
+    async def priceStream(self):
+        await asyncio.Event().wait()
+
+class FeedRefcountTests(SimpleTestCase):
+    def _feed(self):
+        return QuietFeed(url="test://", channelLayer=ReplayLayer(), persist=False)
+
+    async def test_engine_lives_until_the_last_release(self):
+        feed = self._feed()
+        await feed.acquire("AAA")
+        engine = feed.engines["AAA"]
+        await feed.acquire("AAA")
+        self.assertIs(feed.engines["AAA"], engine)
+        await feed.release("AAA")
+        self.assertEqual(feed.refs, {"AAA": 1})
+        self.assertIs(feed.engines["AAA"], engine)
+        await feed.release("AAA")
+        self.assertEqual(feed.refs, {})
+        self.assertEqual(feed.engines, {})
+        self.assertIsNone(feed.stream_task)
+        self.assertIsNone(feed.timer_task)
+
+    async def test_release_during_acquire_leaves_nothing_running(self):
+        feed = self._feed()
+        seeded = asyncio.Event()
+
+        async def slowSeed(engine):
+            await seeded.wait()
+
+        with mock.patch.object(SymbolEngine, "_getRedisSeed", slowSeed):
+            acquiring = asyncio.create_task(feed.acquire("AAA"))
+            await settle()
+            await feed.release("AAA")
+            seeded.set()
+            await acquiring
+        self.assertEqual(feed.refs, {})
+        self.assertEqual(feed.engines, {})
+        self.assertIsNone(feed.stream_task)
+        self.assertIsNone(feed.timer_task)
+        self.assertIsNone(feed.publish_task)
+
+    async def test_release_without_acquire_is_ignored(self):
+        feed = self._feed()
+        await feed.acquire("AAA")
+        await feed.release("BBB")
+        self.assertEqual(feed.refs, {"AAA": 1})
+        await feed.join("BBB", "channel")
+        await feed.leave("BBB", "channel")
+        await feed.leave("BBB", "channel")
+        self.assertEqual(feed.refs, {"AAA": 1})
+        await feed.release("AAA")
+
+async def settle():
+    # let freshly created tasks reach their first await
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+class SchedulerTests(SimpleTestCase):
+    def _scheduler(self, rate=1.0, capacity=2):
+        clock = SimulatedClock(1000.0)
+        return RequestScheduler(LocalTokenBucket(rate, capacity), clock=clock, sleep=clock.sleep), clock
+
+    async def test_requests_are_paced_by_the_bucket(self):
+        scheduler, clock = self._scheduler()
+        done = {}
+
+        def fetch(name):
+            async def run():
+                done[name] = clock()
+                return name
+            return run
+
+        futures = [scheduler.submit(f"r{idx}", fetch(f"r{idx}")) for idx in range(5)]
+        await settle()
+        self.assertEqual(sorted(done), ["r0", "r1"])
+        await clock.advance(3)
+        self.assertEqual(await asyncio.gather(*futures), ["r0", "r1", "r2", "r3", "r4"])
+        self.assertEqual([done[f"r{idx}"] - 1000 for idx in range(5)], [0, 0, 1, 2, 3])
+
+    async def test_priority_and_duplicate_merging(self):
+        scheduler, clock = self._scheduler(capacity=1)
+        order = []
+
+        def fetch(name):
+            async def run():
+                order.append(name)
+                return name
+            return run
+
+        first = scheduler.submit("busy", fetch("busy"), "live")
+        await settle()
+        backfill = scheduler.submit("old", fetch("old"), "backfill")
+        live = scheduler.submit("new", fetch("new"), "live")
+        again = scheduler.submit("old", fetch("old twice"), "backfill")
+        await settle()
+        await clock.advance(5)
+        self.assertEqual(await asyncio.gather(first, backfill, live, again), ["busy", "old", "new", "old"])
+        self.assertEqual(order, ["busy", "new", "old"])
+        self.assertEqual(scheduler.stats["merged"], 1)
+
+class PackedBarsTests(SimpleTestCase):
+    bars = [bar(60 * idx, 100 + idx, idx) for idx in range(1, 11)]
+
+    def test_pack_round_trip(self):
+        members = packBars(self.bars)
+        self.assertTrue(all(len(member) == 48 for member in members))
+        self.assertEqual(barsToDicts(unpackBars(members)), self.bars)
+        self.assertEqual(len(unpackBars([])), 0)
+
+    async def _stream(self):
+        redis = FakeRedis()
+        for b, member in zip(self.bars, packBars(self.bars)):
+            await redis.xadd(barKey("AAA", "1m"), {"b": member}, id=barId(b['ts']))
+        return redis
+
+    async def test_read_bars_by_count_and_range(self):
+        redis = await self._stream()
+        key = barKey("AAA", "1m")
+        self.assertEqual(barsToDicts(await readBars(redis, key)), self.bars)
+        self.assertEqual((await readBars(redis, key, count=3))['ts'].tolist(), [480, 540, 600])
+        self.assertEqual((await readBars(redis, key, 120, 300))['ts'].tolist(), [120, 180, 240, 300])
+        self.assertEqual((await readBars(redis, key, 120, 300, 2))['ts'].tolist(), [240, 300])
+
+    async def test_read_since_returns_only_newer_bars(self):
+        redis = await self._stream()
+        key = barKey("AAA", "1m")
+        self.assertEqual(barsToDicts(await readSince(redis, key, 420)), self.bars[7:])
+        self.assertEqual(len(await readSince(redis, key, 600)), 0)
+        self.assertEqual(len(await readSince(redis, key, 0)), 10)
+
+class ScreenerQueryTests(SimpleTestCase):
+    def setUp(self):
+        self.snapshot = ScreenerSnapshot(capacity=2)
+        self.snapshot.declare(["price", "rsi14", "sma20", "marketCap"])
+        self.snapshot.update("AAA", {"price": 10.0, "rsi14": 25.0, "sma20": 12.0, "marketCap": 2e9})
+        self.snapshot.update("BBB", {"price": 50.0, "rsi14": 75.0, "sma20": 40.0, "marketCap": 5e8})
+        self.snapshot.update("CCC", {"price": 30.0, "rsi14": 50.0, "marketCap": 3e12})
+
+    def _symbols(self, text, **kwargs):
+        return [row["symbol"] for row in self.snapshot.query(text, **kwargs)["results"]]
+
+    def test_comparisons_and_boolean_logic(self):
+        self.assertEqual(self._symbols("rsi14 < 30"), ["AAA"])
+        self.assertEqual(self._symbols("rsi < 30 or rsi > 70"), ["AAA", "BBB"])
+        self.assertEqual(self._symbols("not price above 20"), ["AAA"])
+        self.assertEqual(self._symbols("price > 5 and (rsi14 >= 50 or marketCap > 1B)"), ["AAA", "BBB", "CCC"])
+
+    def test_arithmetic_suffixes_and_missing_values(self):
+        self.assertEqual(self._symbols("price > sma20 * 1.2"), ["BBB"])
+        self.assertEqual(self._symbols("marketCap >= 1.5t"), ["CCC"])
+        # CCC has no sma20, NaN never matches
+        self.assertEqual(self._symbols("price - sma20 < 100"), ["AAA", "BBB"])
+
+    def test_sort_limit_and_fields(self):
+        result = self.snapshot.query("price > 0", sort="price", order="asc", limit=2, fields=["rsi"])
+        self.assertEqual(result["count"], 3)
+        self.assertEqual(result["results"], [
+            {"symbol": "AAA", "rsi14": 25.0, "price": 10.0},
+            {"symbol": "CCC", "rsi14": 50.0, "price": 30.0}
+        ])
+
+    async def test_refresh_scales_finnhub_millions(self):
+        redis = FakeRedis()
+        # as ResponseCache stores a /stock/metric response: market cap and volumes in millions
+        metric = {"metric": {"marketCapitalization": 2950000.0, "peTTM": 31.2, "10DayAverageTradingVolume": 52.4,
+                             "3MonthAverageTradingVolume": 61.0, "52WeekHigh": 237.2}}
+        await redis.set("cache|metric|AAPL", orjson.dumps({"v": metric, "fresh": 0}))
+        await redis.set("stock|AAPL|latest", orjson.dumps({"price": 230.5}))
+        snapshot = ScreenerSnapshot()
+        await snapshot.refresh(redis, ["AAPL"])
+        self.assertEqual(snapshot.value("AAPL", "marketCap"), 2.95e12)
+        self.assertEqual(snapshot.value("AAPL", "avgVolume3m"), 61e6)
+        self.assertEqual(snapshot.value("AAPL", "pe"), 31.2)
+        self.assertEqual([row["symbol"] for row in snapshot.query("marketCap > 1t and avgVolume10d > 50M")["results"]], ["AAPL"])
+        self.assertEqual(snapshot.query("high52w > 1M")["count"], 0)
+
+    def test_limit_must_be_in_range(self):
+        self.assertEqual(len(self._symbols("price > 0", limit="1")), 1)
+        for limit in (0, -3, 1.5, "x", True, SCREENER["maxLimit"] + 1):
+            with self.subTest(limit=limit):
+                with self.assertRaises(ValueError):
+                    self.snapshot.query("price > 0", limit=limit)
+
+    def test_bad_queries_raise_value_error(self):
+        for text in ("", "price", "price >", "bogus > 1", "price > 1 and", "(price > 1", "price > 1 $", "rsi14 and price"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    self.snapshot.query(text)
+
+class Outbox(list):
+    def put(self, frame):
+        self.append(frame)
+
+class StockRequestTests(SimpleTestCase):
+    bars = [bar(60 * idx, 100 + idx) for idx in range(1, 6)]
+
+    async def _consumer(self):
+        consumer = StockState()
+        consumer.stockTick = "AAA"
+        consumer.p_bars1m = barKey("AAA", "1m")
+        consumer.outbox = Outbox()
+        consumer.redis = FakeRedis()
+        for b, member in zip(self.bars, packBars(self.bars)):
+            await consumer.redis.xadd(consumer.p_bars1m, {"b": member}, id=barId(b['ts']))
+        return consumer
+
+    async def _ask(self, consumer, **request):
+        consumer.outbox.clear()
+        await consumer.receive(orjson.dumps(request).decode())
+        return orjson.loads(consumer.outbox[-1])
+
+    async def test_counts_and_times_are_validated(self):
+        consumer = await self._consumer()
+        self.assertEqual((await self._ask(consumer, action="get_allcandles", count="2"))["length"], 2)
+        self.assertEqual((await self._ask(consumer, action="resume", since=180))["length"], 2)
+        for request, error in (({"action": "get_allcandles", "count": 0}, "count must be between 1 and 10000"),
+                               ({"action": "get_allcandles", "count": "lots"}, "count must be a whole number"),
+                               ({"action": "get_allcandles", "count": [3]}, "count must be a whole number"),
+                               ({"action": "get_allcandles", "count": 5, "from": -1}, "from must be at least 0"),
+                               ({"action": "resume"}, "since is required"),
+                               ({"action": "resume", "since": 1.5}, "since must be a whole number")):
+            with self.subTest(request=request):
+                self.assertEqual(await self._ask(consumer, **request), {"type": "error", "action": request["action"], "error": error})
+
+    async def test_unexpected_errors_are_not_sent_to_the_client(self):
+        consumer = await self._consumer()
+        consumer.redis = None
+        frame = await self._ask(consumer, action="get_1mcandles")
+        self.assertEqual(frame["error"], REQUEST_FAILED)
+
+class TapeTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="tape-tests-")
+        self.addCleanup(shutil.rmtree, self.root)
+        recorder = TapeRecorder(self.root)
+        # one gzip member received between t=100s and t=103s, trades a moment before each receive
+        for idx, symbol in enumerate(["AAA", "BBB", "AAA", "BBB"]):
+            frame = orjson.dumps({"type": "trade", "data": [{"s": symbol, "p": 1.0, "t": (100 + idx) * 1000 - 50, "v": 1}]})
+            recorder.pending.append((100 + idx, frame, [symbol]))
+        recorder.pending.append((103.5, b'{"type":"ping"}', []))
+        recorder._flush()
+        recorder.close()
+
+    def _times(self, **kwargs):
+        return [orjson.loads(frame)["data"][0]["t"] for frame in TapeReader(self.root).records(**kwargs)]
+
+    def test_records_are_filtered_inside_a_member(self):
+        self.assertEqual(len(list(TapeReader(self.root).records())), 5)
+        self.assertEqual(self._times(start=101000, end=102500), [101950])
+        self.assertEqual(self._times(start=100500), [100950, 101950, 102950])
+        self.assertEqual(self._times(symbols=["AAA"], end=101000), [99950])
+        self.assertEqual(self._times(start=200000), [])
+
+    def test_tape_files_skip_the_indexes(self):
+        self.assertEqual([name.endswith(".jsonl.gz") for name in tapeFiles([self.root])], [True])
+        self.assertEqual(len(tapeFiles([f"{self.root}/*"])), 1)
+
+class StaffUser():
+    is_active = True
+
+    def __init__(self, staff):
+        self.is_staff = staff
+
+class OperatorEndpointTests(SimpleTestCase):
+    async def _get(self, address, staff=False):
+        request = RequestFactory().get("/metrics/", REMOTE_ADDR=address)
+
+        async def auser():
+            return StaffUser(staff)
+        request.auser = auser
+        return await views.metrics(request)
+
+    async def test_metrics_need_an_allowed_address_or_staff(self):
+        self.assertEqual((await self._get("127.0.0.1")).status_code, 200)
+        self.assertEqual((await self._get("203.0.113.5")).status_code, 403)
+        self.assertEqual((await self._get("203.0.113.5", staff=True)).status_code, 200)
+        self.assertEqual((await self._get("not an address")).status_code, 403)
+
+class ResponseCacheTests(SimpleTestCase):
+    async def test_cancelled_leader_does_not_strand_followers(self):
+        cache = ResponseCache(FakeRedis())
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return {"c": 101.0}
+
+        leader = asyncio.create_task(cache.get("quote", "quote", "AAA", fetch))
+        await settle()
+        follower = asyncio.create_task(cache.get("quote", "quote", "AAA", fetch))
+        await settle()
+        leader.cancel()
+        await settle()
+        release.set()
+        self.assertEqual(await asyncio.wait_for(follower, 1), {"c": 101.0})
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.inflight, {})
+        self.assertEqual(await cache.get("quote", "quote", "AAA", fetch), {"c": 101.0})
+
+class SymbolTests(SimpleTestCase):
+    def test_provider_symbols_are_accepted(self):
+        for symbol in ("AAPL", "BRK.B", "BINANCE:BTCUSDT", "OANDA:EUR_USD", "btcusdt", "FXCM:EUR/USD"):
+            with self.subTest(symbol=symbol):
+                self.assertTrue(validSymbol(symbol))
+        for symbol in ("", "A B", "X" * 33, None, 7, "AAPL\n"):
+            with self.subTest(symbol=symbol):
+                self.assertFalse(validSymbol(symbol))
+
+    def test_store_directories_stay_under_the_root(self):
+        root = tempfile.mkdtemp(prefix="barstore-tests-")
+        self.addCleanup(shutil.rmtree, root)
+        store = BarStore(root)
+        self.assertEqual(symbolDir("BRK.B"), "BRK.B")
+        for symbol in ("..", ".", "../../escape", "FXCM:EUR/USD", "a\\b"):
+            with self.subTest(symbol=symbol):
+                name = symbolDir(symbol)
+                self.assertNotIn("/", name)
+                self.assertNotIn(name, (".", ".."))
+                self.assertEqual(os.path.dirname(os.path.dirname(store._path(symbol, "1d"))), root)
+        with self.assertRaises(ValueError):
+            symbolDir("")
+        store.append("BINANCE:BTCUSDT", "1d", [bar(86400, 100.0)])
+        self.assertEqual(store.read("BINANCE:BTCUSDT", "1d")['ts'].tolist(), [86400])
+        self.assertEqual(os.listdir(root), ["BINANCE%3ABTCUSDT"])
+
+class RequestBodyTests(SimpleTestCase):
+    async def test_json_that_is_not_an_object_is_a_bad_request(self):
+        for body in (b"[]", b'"x"', b"3"):
+            with self.subTest(body=body):
+                request = RequestFactory().post("/main/api/screener/", body, content_type="application/json")
+                response = await views.screener(request)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(orjson.loads(response.content), {"error": "query is required"})
@@ -5,5 +5,13 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path("api/stocksearch/", views.searchStock, name="searchStock"),
-    path("api/stockbasicmetrics/", views.getBasicFinancialMetrics, name="getBasicFinancialMetrics")
+    path("api/stockbasicmetrics/", views.getBasicFinancialMetrics, name="getBasicFinancialMetrics"),
+    path("api/screener/", views.screener, name="screener"),
+    path("api/cachestats/", views.cacheStats, name="cacheStats"),
+    path("api/schedulerstats/", views.schedulerStats, name="schedulerStats"),
+    path("api/redisstats/", views.redisStats, name="redisStats"),
+    path("api/sendqueues/", views.sendQueueStats, name="sendQueueStats"),
+    path("api/shards/", views.shardStats, name="shardStats"),
+    path("api/profiler/", views.profiler, name="profiler"),
+    path("metrics/", views.metrics, name="metrics")
 ]
\ No newline at end of file
@@ -1,139 +1,260 @@
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.core.exceptions import ValidationError
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-import requests
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 import asyncio
-import finnhub
-import pandas
 import datetime
-from .feateng import FeatureAnalysis
-from dotenv import load_dotenv
-import os
+import functools
+import orjson
+import numpy as np
+from .feateng import FeatureAnalysis, parseTimeSeries
+from .BarStore import BarStore, frameToBars
+from .MarketData import MarketDataClient, MarketDataError, validSymbol
+from .ResponseCache import ResponseCache
+from .RedisPool import RedisPool
+from .SendQueue import SendQueue
+from .Screener import SNAPSHOT as SCREENER_SNAPSHOT
+from .Sharding import shardStatus
+from . import Metrics
 
 
 from .forms import StockSearchForm
 from . import models
 
-load_dotenv("./content.env")
-FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
-ALPHAVANTAGE_API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
-
-__finnhubClient = finnhub.Client(api_key=FINNHUB_API_KEY)
 __featureAnalysis = FeatureAnalysis()
 
+# end-of-period series live in the local bar store, intraday stays network only
+STORED_SERIES = {
+    'daily': ('1d', 1),
+    'weekly': ('1w', 7),
+    'monthly': ('1mo', 31)
+}
+
+def _operatorsOnly(view):
+    # metrics, stats and the profiler: staff users, or scrapers from STOCK_METRICS_ALLOW
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not Metrics.allowedAddress(request.META.get("REMOTE_ADDR", "")):
+            user = await request.auser()
+            if not (user.is_active and user.is_staff):
+                return JsonResponse({"error": "Forbidden"}, status=403)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
 # Create your views here.
 def index(request):
-    user = models.UserLogin(userName='Joel', userPassword="Jello123!@##@!", dateOfBirth=datetime.date(2001,5,12)) 
-    user.save()   
+    user = models.UserLogin(userName='Joel', userPassword="Jello123!@##@!", dateOfBirth=datetime.date(2001,5,12))
+    user.save()
     return HttpResponse("Hello, world. This is the base.")
 
-@api_view(['POST'])
-def searchStock(request):
-    try:
-        stockName = request.data.get("stock")
-        closedPrices = getStockClosePrice(stockName)
-        print(closedPrices)
-        return Response(closedPrices)
-    except Exception as err:
-        return Response("Failure in sending data")
-
-def getStockClosePrice(stock, time):
-    timeOptions = {
-        'intraday': f'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol={stock}&interval=5min&apikey={ALPHAVANTAGE_API_KEY}',
-        'daily': f'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={stock}&apikey={ALPHAVANTAGE_API_KEY}',
-        'weekly': f'https://www.alphavantage.co/query?function=TIME_SERIES_WEEKLY_ADJUSTED&symbol={stock}&apikey={ALPHAVANTAGE_API_KEY}',
-        'monthly': f'https://www.alphavantage.co/query?function=TIME_SERIES_MONTHLY_ADJUSTED&symbol={stock}&apikey={ALPHAVANTAGE_API_KEY}'
-    }
+def _requestData(request):
     try:
-        if time in timeOptions:
-            url = timeOptions[time]
-        r = requests.get(url)
-        data = r.json()
-        timeSeries = list(data.keys())[1]
-        
-        priceData = {}
-        for time in data[timeSeries]:
-            entry = data[timeSeries][time]
-            close_key = next((k for k in entry if "close" in k.lower()), None)
-            volume_key = next((k for k in entry if "volume" in k.lower()), None)
-            priceData[time] = {
-                'close': close_key,
-                'volume': volume_key
-            }
-        print(priceData)
-        return priceData
+        data = orjson.loads(request.body or b"{}")
+    except orjson.JSONDecodeError:
+        return request.POST
+    # valid JSON that is not an object ([] or "x") is treated like a body without fields
+    return data if isinstance(data, dict) else request.POST
 
+@csrf_exempt
+@require_POST
+async def searchStock(request):
+    try:
+        data = _requestData(request)
+        if not validSymbol(data.get("stock")):
+            return JsonResponse({"error": "Invalid symbol"}, status=400)
+        closedPrices = await getStockClosePrice(data.get("stock"), data.get("time", "daily"))
+        return JsonResponse(closedPrices)
     except Exception as err:
-        return Response("Error in generating data")
+        return JsonResponse("Failure in sending data", safe=False)
+
+async def _fetchSeries(stock, time):
+    client = MarketDataClient.instance()
+    return await ResponseCache.instance().get(
+        'quote' if time == 'intraday' else 'timeseries',
+        f'timeseries:{time}', stock,
+        lambda: client.timeSeries(stock, time)
+    )
+
+def _staleBefore(days):
+    # the newest bar we can expect is from the previous business day (or period)
+    today = np.datetime64(datetime.date.today(), 'D')
+    if days == 1:
+        expected = np.busday_offset(today, -1, roll='backward')
+    else:
+        expected = today - np.timedelta64(days, 'D')
+    return int(expected.astype('datetime64[s]').astype(np.int64))
+
+async def getStockClosePrice(stock, time='daily'):
+    if time in STORED_SERIES:
+        interval, days = STORED_SERIES[time]
+        store = BarStore.default()
+        bars = store.read(stock, interval)
+        if not len(bars) or bars['ts'][-1] < _staleBefore(days):
+            series = await _fetchSeries(stock, time)
+            store.merge(stock, interval, frameToBars(parseTimeSeries(series)))
+            bars = store.read(stock, interval)
+        dates = np.datetime_as_string(bars['ts'].astype('datetime64[s]'), unit='D')
+        closes = bars['close'].tolist()
+        volumes = bars['volume'].tolist()
+        # newest first, like the upstream series
+        return {dates[i]: {'close': closes[i], 'volume': volumes[i]} for i in range(len(bars) - 1, -1, -1)}
 
-@api_view(['POST'])    
-def getBasicFinancialMetrics(request):
+    series = await _fetchSeries(stock, time)
+    priceData = {}
+    for date, entry in series.items():
+        close_key = next((k for k in entry if "close" in k.lower()), None)
+        volume_key = next((k for k in entry if "volume" in k.lower()), None)
+        priceData[date] = {
+            'close': entry.get(close_key),
+            'volume': entry.get(volume_key)
+        }
+    return priceData
+
+def _metricValue(basicMetrics, key):
+    return basicMetrics[key] if basicMetrics and basicMetrics.get(key) != None else 0
+
+@csrf_exempt
+@require_POST
+async def getBasicFinancialMetrics(request):
     try:
-        stock = request.data.get("stock")
-        metricData = __finnhubClient.company_basic_financials(stock, 'all')
-        baseStatJson = {}
-        flag = False
-        if metricData and metricData['symbol'] == stock:
-            basicMetrics = metricData['metric']  
-            metricJson = {
-                "10DayAvgTradeVol": [
-                    "10 Day Average Trading Volume", 
-                    basicMetrics['10DayAverageTradingVolume'] if basicMetrics and basicMetrics['10DayAverageTradingVolume'] != None else 0
-                ],
-                "52WeekHigh": [
-                    "Annual Highest Price",
-                    basicMetrics["52WeekHigh"] if basicMetrics and basicMetrics['52WeekHigh'] != None else 0,
-                ],
-                "52WeekLow": [
-                    "Annual Lowest Price",
-                    basicMetrics["52WeekLow"] if basicMetrics and basicMetrics['52WeekLow'] != None else 0,
-                ],
-                "52WeekReturn": [
-                    "Annual Return",
-                    basicMetrics["52WeekPriceReturnDaily"] if basicMetrics and basicMetrics['52WeekPriceReturnDaily'] != None else 0,
-                ],
-                "beta": [
-                    "Beta(1Y)",
-                    basicMetrics["beta"] if basicMetrics and basicMetrics['beta'] != None else 0
-                ]
-            }
-            baseStatJson = metricJson
-            flag = True
-        
-        dailyStockUrl = f'https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={stock}&apikey={ALPHAVANTAGE_API_KEY}'
-        r = requests.get(dailyStockUrl)
-        data = r.json()
-        timeSeries = list(data.keys())[1]
-        monthAvgVol = __featureAnalysis.calculateAverageFromJson(data[timeSeries], 'monthly_average')
-        dailyAvgVol = __featureAnalysis.calculateAverageFromJson(data[timeSeries], 'daily_average')
-        baseStatJson['avgDailyVol'] = [
-            "Volume",
-            dailyAvgVol[[idx for idx in dailyAvgVol.index if 'volume' in idx][0]]
-        ]
-        baseStatJson['avgVol30d'] = [
-            "Average Volume(30D)",
-            monthAvgVol[[idx for idx in monthAvgVol.index if 'volume' in idx][0]]
-        ]
-        today = datetime.date.today()
-        yesterday = today - datetime.timedelta(days=30)
-        earnings = __finnhubClient.earnings_calendar(_from=yesterday.strftime('%Y-%m-%d'), to=today.strftime('%Y-%m-%d'), symbol=stock, international=False)['earningsCalendar']
-        if earnings and 'epsActual' in earnings[0]:
-            baseStatJson['baseEPS'] = [
-                "Basic EPS",
-                earnings[0]['epsActual']
+        stock = _requestData(request).get("stock")
+        if not validSymbol(stock):
+            return JsonResponse({"error": "Invalid symbol"}, status=400)
+        client = MarketDataClient.instance()
+        cache = ResponseCache.instance()
+        # every upstream call runs at once with its own timeout, one slow provider only
+        # costs its own section of the response
+        metricData, series, earnings, profile = await asyncio.gather(
+            cache.get('fundamentals', 'metric', stock, lambda: client.basicFinancials(stock)),
+            cache.get('timeseries', 'timeseries:daily', stock, lambda: client.timeSeries(stock, 'daily')),
+            cache.get('earnings', 'earnings', stock, lambda: client.earningsCalendar(stock)),
+            cache.get('fundamentals', 'profile2', stock, lambda: client.companyProfile(stock)),
+            return_exceptions=True
+        )
+        if isinstance(metricData, Exception) or not metricData or metricData.get('symbol') != stock:
+            raise ValidationError("The stock has no valid metric values/stock data is incorrect")
+
+        basicMetrics = metricData.get('metric')
+        baseStatJson = {
+            "10DayAvgTradeVol": [
+                "10 Day Average Trading Volume",
+                _metricValue(basicMetrics, '10DayAverageTradingVolume')
+            ],
+            "52WeekHigh": [
+                "Annual Highest Price",
+                _metricValue(basicMetrics, '52WeekHigh')
+            ],
+            "52WeekLow": [
+                "Annual Lowest Price",
+                _metricValue(basicMetrics, '52WeekLow')
+            ],
+            "52WeekReturn": [
+                "Annual Return",
+                _metricValue(basicMetrics, '52WeekPriceReturnDaily')
+            ],
+            "beta": [
+                "Beta(1Y)",
+                _metricValue(basicMetrics, 'beta')
             ]
+        }
+
+        if not isinstance(series, Exception):
+            averages = __featureAnalysis.averages(stock, series)
+            baseStatJson['avgDailyVol'] = [
+                "Volume",
+                averages['daily_average']['volume']
+            ]
+            baseStatJson['avgVol30d'] = [
+                "Average Volume(30D)",
+                averages['monthly_average']['volume']
+            ]
+
+        if not isinstance(earnings, Exception):
+            calendar = earnings.get('earningsCalendar')
+            if calendar and 'epsActual' in calendar[0]:
+                baseStatJson['baseEPS'] = [
+                    "Basic EPS",
+                    calendar[0]['epsActual']
+                ]
 
         baseStatJson['marketCap'] = [
             "Market Capitalization",
-            __finnhubClient.company_profile2(symbol=stock).get("marketCapitalization")
+            profile.get("marketCapitalization") if not isinstance(profile, Exception) else None
         ]
-        if not flag:
-            raise ValidationError("The stock has no valid metric values/stock data is incorrect")
-        return Response(baseStatJson)
-    except finnhub.FinnhubAPIException as ferr:
-        return Response({})
+        return JsonResponse(baseStatJson)
+    except MarketDataError as ferr:
+        return JsonResponse({})
     except (Exception) as err:
-        return Response(err)    
-    
+        return JsonResponse({"error": str(err)}, status=400)
+
+@csrf_exempt
+@require_POST
+async def screener(request):
+    # {"query": "rsi14 < 30 and price above sma20 and avgVolume3m > 1M", "sort": "rsi14", "order": "asc", "limit": 50}
+    data = _requestData(request)
+    query = data.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return JsonResponse({"error": "query is required"}, status=400)
+    if data.get("order", "desc") not in ("asc", "desc"):
+        return JsonResponse({"error": "order must be asc or desc"}, status=400)
+    try:
+        await SCREENER_SNAPSHOT.ensureFresh(RedisPool.instance().client)
+    except Exception as err:
+        # a Redis outage still leaves this worker's own symbols to screen
+        Metrics.error("screener.refresh", err)
+    try:
+        result = SCREENER_SNAPSHOT.query(query, data.get("sort"), data.get("order", "desc"), data.get("limit"), data.get("fields"))
+    except (ValueError, TypeError) as err:
+        return JsonResponse({"error": str(err)}, status=400)
+    return JsonResponse(result)
+
+@_operatorsOnly
+async def cacheStats(request):
+    return JsonResponse(ResponseCache.snapshot())
+
+@_operatorsOnly
+async def schedulerStats(request):
+    return JsonResponse(MarketDataClient.instance().schedulerStats())
+
+@_operatorsOnly
+async def redisStats(request):
+    return JsonResponse(RedisPool.instance().snapshot())
+
+@_operatorsOnly
+async def sendQueueStats(request):
+    return JsonResponse({"connections": SendQueue.snapshotAll()})
+
+@_operatorsOnly
+async def shardStats(request):
+    return JsonResponse(await shardStatus(RedisPool.instance().client))
+
+@_operatorsOnly
+async def metrics(request):
+    return HttpResponse(Metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@csrf_exempt
+@_operatorsOnly
+async def profiler(request):
+    # POST {"action": "start", "interval": 0.005, "seconds": 60} or {"action": "stop"};
+    # GET ?format=collapsed returns the stacks for flamegraph.pl or speedscope
+    if not Metrics.PROFILER_ENABLED:
+        return JsonResponse({"error": "Profiler is disabled, set STOCK_PROFILER_ENABLED"}, status=403)
+    if request.method == "POST":
+        data = _requestData(request)
+        try:
+            if data.get("action") == "start":
+                interval = min(max(float(data.get("interval", 0.005)), 0.001), 1.0)
+                seconds = min(max(float(data.get("seconds", 60)), 1.0), 600.0)
+                Metrics.PROFILER.start(interval, seconds)
+            elif data.get("action") == "stop":
+                await asyncio.to_thread(Metrics.PROFILER.stop)
+            else:
+                return JsonResponse({"error": "action must be start or stop"}, status=400)
+        except (TypeError, ValueError) as err:
+            return JsonResponse({"error": str(err)}, status=400)
+        return JsonResponse(Metrics.PROFILER.snapshot())
+    if request.GET.get("format") == "collapsed":
+        limit = request.GET.get("limit")
+        return HttpResponse(Metrics.PROFILER.collapsed(int(limit) if limit and limit.isdigit() else None), content_type="text/plain; charset=utf-8")
+    return JsonResponse(Metrics.PROFILER.snapshot())
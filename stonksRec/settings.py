@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,15 +78,137 @@ TEMPLATES = [
 WSGI_APPLICATION = 'stonksRec.wsgi.application'
 ASGI_APPLICATION = 'stonksRec.asgi.application'
 
+# One pooled client per worker process for the app's own keys; maxConnections caps the
+# sockets, callers queue (for up to timeout seconds) instead of opening more
+
+STOCK_REDIS = {
+    "host": os.getenv("REDIS_HOST", "localhost"),
+    "port": int(os.getenv("REDIS_PORT", 6379)),
+    "db": 0,
+    "maxConnections": 50,
+    "timeout": 5,
+    "healthCheckInterval": 30
+}
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("localhost", 6379)]
+            "hosts": [(STOCK_REDIS["host"], STOCK_REDIS["port"])]
         }
     }
 }
 
+# Live market data
+# Bar intervals built from the trade feed; any of 1s, 1m, 5m, 15m, 1h
+
+STOCK_BAR_INTERVALS = ["1m", "5m", "15m", "1h"]
+
+# Closed bars and end-of-day history, one fixed-width file per symbol and interval
+
+STOCK_BAR_STORE_DIR = BASE_DIR / "barstore"
+
+# Trade tape: raw Finnhub frames in rotating gzip segments with a symbol/time index, for
+# manage.py backtest and for reproducing feed bugs. Off by default
+
+STOCK_TAPE = {
+    "enabled": False,
+    "dir": BASE_DIR / "tapes",
+    "segmentMb": 64,
+    "segmentMinutes": 60,
+    "flushSeconds": 1.0
+}
+
+# Coalesce live ticks per symbol in the feed: one stock|SYM|latest write and one channel layer
+# message per symbol and window, which consumers forward. mode is "interval" (flush every ms),
+# "deadline" (flush ms after the first tick of a window) or None to publish every trade
+
+STOCK_PUBLISH_COALESCE = {
+    "mode": "interval",
+    "ms": 250
+}
+
+# Per-connection outbound queue: a client that stays over maxDepth queued frames or maxLag
+# seconds behind for grace seconds is disconnected (4x maxDepth disconnects at once)
+
+STOCK_SEND_QUEUE = {
+    "maxDepth": 256,
+    "maxLag": 5,
+    "grace": 10
+}
+
+# Symbols the warmopens command always prefetches, on top of the ones users watched recently
+
+STOCK_UNIVERSE = ["AAPL", "MSFT", "AMZN", "GOOGL", "NVDA", "META", "TSLA"]
+
+# Most symbols one ws/watchlist/ connection may subscribe to
+
+STOCK_WATCHLIST_MAX = 2000
+
+# Screener snapshot: seconds between Redis refreshes of the whole universe, MGET batch size
+# and default / largest result counts
+
+STOCK_SCREENER = {
+    "refresh": 30,
+    "batch": 500,
+    "limit": 50,
+    "maxLimit": 1000
+}
+
+# Shard mode: web processes only advertise the symbols their clients watch, manage.py
+# shardworker processes (one per core) split them by rendezvous hash and publish through
+# the Redis channel layer. Seconds for heartbeats, membership TTL and rebalance polling
+
+STOCK_SHARDS = {
+    "enabled": False,
+    "heartbeat": 2,
+    "ttl": 6,
+    "poll": 1
+}
+
+# Redis Streams: MAXLEN (approximate) of each bar stream, tick stream and the all-symbol bar bus,
+# XREAD BLOCK milliseconds and batch size, the default consumer group and the seconds after
+# which a dead consumer's unacked entries are claimed. ticks 0 stops the tick streams; each
+# symbol's ticks are appended by one process, holding a lease of writerTtl seconds
+
+STOCK_STREAMS = {
+    "bars": 500,
+    "ticks": 10000,
+    "bus": 100000,
+    "block": 5000,
+    "count": 500,
+    "group": "analytics",
+    "claimIdle": 60,
+    "writerTtl": 10
+}
+
+# Runtime sampling profiler behind api/profiler/, metrics are always on at metrics/
+
+STOCK_PROFILER_ENABLED = DEBUG
+
+# metrics/, the api/*stats endpoints and api/profiler/ answer staff users and these addresses or
+# networks only, as seen in REMOTE_ADDR (add the Prometheus scraper, not a proxy in front of everyone)
+
+STOCK_METRICS_ALLOW = ["127.0.0.1", "::1"]
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"}
+    },
+    "loggers": {
+        "StockSelector": {"handlers": ["console"], "level": "INFO"}
+    }
+}
+
+# Upstream REST quotas, shared through Redis token buckets per provider and API key
+
+MARKET_DATA_RATE_LIMITS = {
+    "finnhub": {"perMinute": 60, "burst": 10},
+    "alphavantage": {"perMinute": 5, "burst": 1}
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 